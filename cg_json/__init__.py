@@ -189,6 +189,51 @@ class JSONResponse(t.Generic[T], flask.Response):  # pylint: disable=too-many-an
 
         return self
 
+    @classmethod
+    def make_stream(
+        cls,
+        obj: T,
+        stream_key: str,
+        items: t.Iterable[object],
+        status_code: int = 200,
+        use_extended: _UseExtendedType = object,
+    ) -> 'JSONResponse[T]':
+        """Create a response that serializes the given ``items`` while it is
+        being sent.
+
+        The payload is the object ``obj`` with the list of ``items`` added
+        under the key ``stream_key``, so ``obj`` should be a mapping that does
+        not contain this key yet. Every item is serialized separately, so only
+        a single item needs to be in memory at once.
+
+        :param obj: The mapping with the other keys of the payload, these are
+            serialized directly.
+        :param stream_key: The key under which the items should be placed.
+        :param items: The items to serialize while sending the response.
+        :param status_code: The status code of the response.
+        :param use_extended: See :meth:`.ExtendedJSONResponse.make`, this
+            argument is ignored if this is not an extended response.
+        :returns: The response that streams the payload.
+        """
+        assert isinstance(obj, t.Mapping) and stream_key not in obj
+        start = cls._dump_to_string(obj, use_extended=use_extended).rstrip()
+        start = start[:-1] + (',' if obj else '')
+        start += system_json.dumps(stream_key) + ':['
+
+        def __get_chunks() -> t.Iterator[str]:
+            yield start
+            for idx, item in enumerate(items):
+                yield (',' if idx else '') + cls._dump_to_string(
+                    item, use_extended=use_extended
+                ).rstrip()
+            yield ']}\n'
+
+        return cls(
+            flask.stream_with_context(__get_chunks()),
+            mimetype=flask.current_app.config['JSONIFY_MIMETYPE'],
+            status=status_code,
+        )
+
 
 class ExtendedJSONResponse(t.Generic[T], JSONResponse[T]):  # pylint: disable=too-many-ancestors
     """A datatype for a JSON response created by using the
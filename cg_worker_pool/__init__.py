@@ -4,7 +4,11 @@ In this implementation you can add work while the pool is running.
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
+import math
+import time
+import heapq
 import typing as t
+import itertools
 import threading
 import traceback
 import collections
@@ -19,7 +23,22 @@ from typing_extensions import Protocol
 
 logger = structlog.get_logger()
 
-Work = t.NamedTuple('Work', [('result_id', int), ('student_id', int)])
+
+@dataclasses.dataclass(frozen=True)
+class Work:
+    """A single item of work, which is running a single result.
+
+    :ivar result_id: The id of the result to run.
+    :ivar student_id: The id of the student of the result.
+    :ivar expected_runtime: The amount of seconds running this work is
+        expected to take, or ``None`` if this is not known. This is not taken
+        into account when comparing work.
+    """
+    result_id: int
+    student_id: int
+    expected_runtime: t.Optional[float] = dataclasses.field(
+        default=None, compare=False
+    )
 
 
 def _make_process(*, target: t.Callable[[], object]) -> mp.Process:
@@ -95,8 +114,18 @@ class WorkerException(Exception):
 
 
 class _PrioQueue:
+    """The queue of work shared by all workers.
+
+    Work is handed out by expected runtime, longest first, as this minimizes
+    the time the last workers run while others are idle. The expected runtime
+    of work is given by the producer of the work (see
+    :attr:`.Work.expected_runtime`), if it is unknown the average runtime of
+    all finished work in this queue is used. Work with the same expected
+    runtime is handed out in the order it was added.
+    """
+
     def __init__(self, max_retry_amount: int) -> None:
-        self.queue: t.Deque[Work] = collections.deque()
+        self.queue: t.List[t.Tuple[float, int, Work]] = []
         self.newest: t.Dict[int, int] = {}
         self.mutex = mp.Lock()
 
@@ -106,11 +135,18 @@ class _PrioQueue:
         self._amount_waiting = 0
         self._closed = False
         self._new_work = mp.Condition(self.mutex)
+        self._work_wanted = mp.Condition(self.mutex)
         self._work_needed = mp.Semaphore(0)
         self._retried: t.MutableMapping[Work, int
                                         ] = collections.defaultdict(lambda: 0)
         self._max_retry_amount = max_retry_amount
 
+        self._counter = itertools.count()
+        self._started_at: t.Dict[Work, float] = {}
+        self._total_runtime = 0.0
+        self._amount_runtimes = 0
+        self._finished_at: t.Deque[float] = collections.deque()
+
     def wait_on_work_needed(self, timeout: t.Optional[int]) -> bool:
         return self._work_needed.acquire(True, timeout=timeout)
 
@@ -120,12 +156,28 @@ class _PrioQueue:
         with self.mutex:
             self._work_needed.release()
 
+    def wait_on_work_wanted(self, timeout: float) -> bool:
+        """Wait until a worker is waiting for work while the queue is empty.
+
+        :param timeout: The maximum amount of seconds to wait.
+        :returns: ``True`` if a worker is waiting for work, ``False`` if the
+            timeout expired or the queue was closed.
+        """
+        with self.mutex:
+            return self._work_wanted.wait_for(
+                lambda: self._closed or self._is_work_wanted(), timeout
+            ) and not self._closed
+
+    def _is_work_wanted(self) -> bool:
+        return self._amount_waiting > 0 and self._peek() is None
+
     def close(self) -> None:
         """Close the given queue.
         """
         with self.mutex:
             self._closed = True
             self._new_work.notify_all()
+            self._work_wanted.notify_all()
             self._work_needed.release()
 
     def _inc_version(self) -> None:
@@ -141,6 +193,36 @@ class _PrioQueue:
         with self.mutex:
             return self._version, self._peek() is None, self._amount_waiting
 
+    def get_prefetch_amount(self, minimum: int, lookahead: float) -> int:
+        """Get the amount of work the queue should contain.
+
+        :param minimum: The minimum amount of work the queue should contain.
+        :param lookahead: The amount of seconds of work the queue should
+            contain, based on how fast work was finished in the last minute.
+        :returns: The wanted size of the queue.
+        """
+        with self.mutex:
+            now = time.monotonic()
+            while self._finished_at and self._finished_at[0] < now - 60:
+                self._finished_at.popleft()
+
+            return max(
+                minimum, math.ceil(len(self._finished_at) / 60 * lookahead)
+            )
+
+    def _get_expected_runtime(self, work: Work) -> float:
+        if work.expected_runtime is not None:
+            return work.expected_runtime
+        elif self._amount_runtimes:
+            return self._total_runtime / self._amount_runtimes
+        return 0
+
+    def _push(self, work: Work) -> None:
+        heapq.heappush(
+            self.queue,
+            (-self._get_expected_runtime(work), next(self._counter), work),
+        )
+
     def put_all(self, works: t.Iterable[Work]) -> bool:
         """Put all the given work in the queue.
 
@@ -157,8 +239,8 @@ class _PrioQueue:
 
                 added_amount += 1
                 self._non_finished_work.add(work)
-                self.queue.append(work)
                 self.newest[work.student_id] = work.result_id
+                self._push(work)
 
             if added_amount > 0:
                 self._inc_version()
@@ -168,11 +250,11 @@ class _PrioQueue:
 
     def _peek(self) -> t.Optional[Work]:
         while self.queue:
-            work = self.queue[0]
+            work = self.queue[0][-1]
             if self.newest[work.student_id] == work.result_id:
                 return work
             else:
-                self.queue.popleft()
+                heapq.heappop(self.queue)
 
         return None
 
@@ -185,6 +267,7 @@ class _PrioQueue:
         :param work: The work to retry.
         """
         with self.mutex:
+            self._started_at.pop(work, None)
             if self._retried[work] >= self._max_retry_amount:
                 self._non_finished_work.remove(work)
                 self._retried[work] = 0
@@ -193,7 +276,7 @@ class _PrioQueue:
 
             assert work in self._non_finished_work
 
-            self.queue.append(work)
+            self._push(work)
             # Do not update newest here. We want to retry this work, but we
             # don't want to do this if we have a newer work for this student.
             self._inc_version()
@@ -214,11 +297,12 @@ class _PrioQueue:
                 work = self._peek()
                 if work is not None:
                     # Remove item from the queue
-                    self.queue.popleft()
+                    heapq.heappop(self.queue)
                     # Do not forget that what the newest work for this student
                     # is, as we might want need to retry the returned work
                     # later.
                     self._inc_version()
+                    self._started_at[work] = time.monotonic()
 
                     logger.info('Got new work', work=work)
                     return work
@@ -227,6 +311,7 @@ class _PrioQueue:
 
                 self._amount_waiting += 1
                 self._work_needed.release()
+                self._work_wanted.notify_all()
                 self._new_work.wait()
                 self._amount_waiting -= 1
 
@@ -245,6 +330,13 @@ class _PrioQueue:
             self._non_finished_work.remove(work)
             self._retried[work] = 0
 
+            now = time.monotonic()
+            self._finished_at.append(now)
+            started_at = self._started_at.pop(work, None)
+            if started_at is not None:
+                self._total_runtime += now - started_at
+                self._amount_runtimes += 1
+
 
 class _Manager(managers.SyncManager):
     pass
@@ -340,10 +432,16 @@ class WorkerPool:
 
         self._drain_finish_queue()
 
-    def start(self, producer: t.Callable[[bool], t.Iterable[Work]]) -> None:
+    def start(
+        self, producer: t.Callable[[bool, int], t.Iterable[Work]]
+    ) -> None:
         """Start the workers to work on the given work.
 
-        :param producer: The function to call to produce more work.
+        :param producer: The function to call to produce more work. It is
+            called with a boolean indicating if this is the final call, and
+            the amount of work the queue should contain. The queue is
+            prefetched based on how fast work is finished, and the producer
+            is called early if workers are waiting for work.
         :returns: Nothing.
         """
         bonus_round = threading.Event()
@@ -358,9 +456,12 @@ class WorkerPool:
                 with self._producer_lock:
                     bonus = bonus_round.is_set()
                     final = bonus and (bonus_done + 1 == self._extra_amount)
+                    amount = self._work_queue.get_prefetch_amount(
+                        self._processes, 2 * self._sleep_time
+                    )
 
                     try:
-                        new_items = producer(final)
+                        new_items = producer(final, amount)
                         produced = self._work_queue.put_all(new_items)
                     except:  # pylint: disable=bare-except; # pragma: no cover
                         logger.warning('Producer crashed!', exc_info=True)
@@ -376,8 +477,14 @@ class WorkerPool:
                             bonus_done += 1
                         bonus_round_result.put(produced)
 
+                if produced and not bonus:
+                    # If new work was produced there probably is more, so we
+                    # ask for it as soon as workers are waiting for work.
+                    self._work_queue.wait_on_work_wanted(self._sleep_time)
+                    if self._stop.is_set():
+                        return
                 # This call returns the value of the internal flag
-                if self._stop.wait(self._sleep_time):
+                elif self._stop.wait(self._sleep_time):
                     return
 
         producer_thread = threading.Thread(target=producer_fun)
@@ -4,7 +4,7 @@ import multiprocessing as mp
 import pytest
 
 from cg_worker_pool import (
-    Work, WorkerPool, WorkerException, KillWorkerException
+    Work, WorkerPool, WorkerException, KillWorkerException, _PrioQueue
 )
 
 
@@ -34,7 +34,7 @@ def test_all_work_is_done_once(work_done):
 
     final_calls = 0
 
-    def producer_fun(final_call):
+    def producer_fun(final_call, _amount):
         nonlocal final_calls
 
         if extra_work:
@@ -74,7 +74,7 @@ def test_newest_work_is_done(work_done, continue_work):
             time.sleep(0.1)
         work_done.put(work)
 
-    def producer(final):
+    def producer(final, _amount):
         if continue_work.is_set():
             return []
         time.sleep(2)
@@ -99,7 +99,7 @@ def test_raises_exception():
         time.sleep(1)
         raise CustomExc(work.result_id)
 
-    def producer(final):
+    def producer(final, _amount):
         if final:  # pragma: no cover
             final_set.set()
         return []
@@ -133,7 +133,7 @@ def test_retry_work(work_done):
         Work(result_id=6, student_id=3),
     ]
     pool = WorkerPool(3, worker_fun, 0.5, 1, initial_work)
-    pool.start(lambda _: [])
+    pool.start(lambda *_: [])
 
     all_work = initial_work + initial_work + initial_work
     for _ in range(len(all_work)):
@@ -157,7 +157,7 @@ def test_killing_and_replacing_worker(work_done):
         Work(result_id=6, student_id=3),
     ]
     pool = WorkerPool(3, worker_fun, 0.5, 1, initial_work)
-    pool.start(lambda _: [])
+    pool.start(lambda *_: [])
 
     all_work = initial_work
     for _ in range(len(all_work)):
@@ -197,9 +197,61 @@ def test_producer_producing_work_twice(work_done):
     main_work = Work(result_id=1, student_id=2)
 
     pool = WorkerPool(1, worker_fun, 0.5, 1, [main_work])
-    pool.start(lambda _: [main_work])
+    pool.start(lambda *_: [main_work])
 
     assert work_done.get(False) == main_work
     assert work_done.get(False) is None
     assert work_done.get(False) == main_work
     assert work_done.empty()
+
+
+def test_longest_work_is_done_first(monkeypatch):
+    now = 0
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    queue = _PrioQueue(max_retry_amount=2)
+
+    queue.put_all([Work(1, 1), Work(2, 2), Work(3, 3)])
+    for runtime in [5, 30, 10]:
+        work = queue.get()
+        now += runtime
+        queue.mark_as_finished(work)
+
+    # The runtime of student 4 is unknown, so the average runtime of the
+    # finished work is used for it.
+    queue.put_all(
+        [Work(5, 1, 5), Work(6, 2, 30), Work(7, 3, 10), Work(8, 4, None)]
+    )
+    assert [queue.get(block=False) for _ in range(5)] == [
+        Work(6, 2),
+        Work(8, 4),
+        Work(7, 3),
+        Work(5, 1),
+        None,
+    ]
+
+
+def test_expected_runtime_is_not_compared():
+    assert Work(1, 2, 10) == Work(1, 2, None)
+    assert len({Work(1, 2, 10), Work(1, 2, 20)}) == 1
+
+    queue = _PrioQueue(max_retry_amount=2)
+    assert queue.put_all([Work(1, 2, 10)])
+    assert not queue.put_all([Work(1, 2, 20)])
+
+
+def test_prefetch_amount(monkeypatch):
+    now = 0
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    queue = _PrioQueue(max_retry_amount=2)
+
+    assert queue.get_prefetch_amount(4, 10) == 4
+
+    # 30 results per minute is 5 results in 10 seconds.
+    queue.put_all([Work(i, i) for i in range(30)])
+    for _ in range(30):
+        queue.mark_as_finished(queue.get())
+    assert queue.get_prefetch_amount(4, 10) == 5
+
+    # Only the last minute is taken into account.
+    now += 61
+    assert queue.get_prefetch_amount(4, 10) == 4
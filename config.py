@@ -72,6 +72,10 @@ FlaskConfig = TypedDict(
         'AUTO_TEST_OUTPUT_LIMIT': int,
         'AUTO_TEST_MEMORY_LIMIT': str,
         'AUTO_TEST_BDEVTYPE': str,
+        'AUTO_TEST_SNAPSHOT_CLONES': bool,
+        'AUTO_TEST_MAX_CONTAINERS_PER_CORE': int,
+        'AUTO_TEST_CACHE_DIR': str,
+        'AUTO_TEST_PREFETCH_AMOUNT': int,
         'AUTO_TEST_HEARTBEAT_INTERVAL': int,
         'AUTO_TEST_HEARTBEAT_MAX_MISSED': int,
         'AUTO_TEST_TEMPLATE_CONTAINER': t.Optional[str],
@@ -98,6 +102,7 @@ FlaskConfig = TypedDict(
         'JWT_ACCESS_TOKEN_EXPIRES': int,
         'UPLOAD_DIR': str,
         'MIRROR_UPLOAD_DIR': str,
+        'DEDUPLICATE_UPLOADS': bool,
         'SHARED_TEMP_DIR': str,
         'MAX_NUMBER_OF_FILES': int,
         'MAX_FILE_SIZE': int,
@@ -316,6 +321,10 @@ if not os.path.isdir(CONFIG['MIRROR_UPLOAD_DIR']):
         ' does not exist',
     )
 
+# Store uploaded files with identical contents only once on disk, see
+# `psef.files.store_file`.
+set_bool(CONFIG, backend_ops, 'DEDUPLICATE_UPLOADS', True)
+
 set_str(CONFIG, backend_ops, 'SHARED_TEMP_DIR', tempfile.gettempdir())
 if not os.path.isdir(CONFIG['SHARED_TEMP_DIR']):
     warnings.warn(
@@ -708,6 +717,13 @@ set_int(CONFIG, auto_test_ops, 'AUTO_TEST_OUTPUT_LIMIT', 32768)
 set_int(CONFIG, auto_test_ops, 'AUTO_TEST_MAX_OUTPUT_TAIL', 2 ** 13)
 set_str(CONFIG, auto_test_ops, 'AUTO_TEST_MEMORY_LIMIT', '512M')
 set_str(CONFIG, auto_test_ops, 'AUTO_TEST_BDEVTYPE', 'best')
+set_bool(CONFIG, auto_test_ops, 'AUTO_TEST_SNAPSHOT_CLONES', True)
+set_int(CONFIG, auto_test_ops, 'AUTO_TEST_MAX_CONTAINERS_PER_CORE', 1)
+set_str(
+    CONFIG, auto_test_ops, 'AUTO_TEST_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'codegrade_auto_test_cache')
+)
+set_int(CONFIG, auto_test_ops, 'AUTO_TEST_PREFETCH_AMOUNT', 8)
 set_int(CONFIG, auto_test_ops, 'AUTO_TEST_HEARTBEAT_INTERVAL', 10)
 set_int(CONFIG, auto_test_ops, 'AUTO_TEST_HEARTBEAT_MAX_MISSED', 6)
 set_str(CONFIG, auto_test_ops, 'AUTO_TEST_TEMPLATE_CONTAINER', None)
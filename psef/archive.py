@@ -125,6 +125,21 @@ def _safe_join(*args: str) -> str:
     return res
 
 
+def get_symlink_notice(link_target: str) -> str:
+    """Get the contents of the file that replaces a symbolic link.
+
+    >>> get_symlink_notice('/etc/passwd')[:50]
+    'This file was a symbolic link to "/etc/passwd" whe'
+
+    :param link_target: The target of the symbolic link.
+    :returns: The notice that the file was a symbolic link.
+    """
+    return (
+        'This file was a symbolic link to "{}" when it was submitted, but '
+        'CodeGrade does not support symbolic links.\n'
+    ).format(link_target)
+
+
 class ArchiveException(Exception):
     """Base exception class for all archive errors."""
 
@@ -332,13 +347,7 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
                 symlinks.append(rel_path)
                 os.remove(file_path)
                 with open(file_path, 'w') as new_file:
-                    new_file.write(
-                        (
-                            'This file was a symbolic link to "{}" when it '
-                            'was submitted, but CodeGrade does not support '
-                            'symbolic links.\n'
-                        ).format(link_target),
-                    )
+                    new_file.write(get_symlink_notice(link_target))
 
                 logger.warning(
                     'Symlink detected in archive',
@@ -1227,6 +1227,47 @@ class FeedbackReplyPermissions(CoursePermissionChecker):
             self._ensure(CPerm.can_view_inline_feedback_before_approved)
 
 
+def get_feedback_reply_visibility_checker(
+    assignment: 'psef.models.Assignment'
+) -> t.Callable[['psef.models.CommentReply'], bool]:
+    """Get a function that checks if the current user may see a feedback
+    reply on a submission in the given assignment.
+
+    The returned function gives the same result as
+    :meth:`.FeedbackReplyPermissions.ensure_may_see`, but all permissions are
+    only checked once for the entire assignment.
+
+    .. warning::
+
+        This function does not check if the user may see the submission of
+        the reply, this is the responsibility of the caller.
+
+    :param assignment: The assignment of the submissions of the replies.
+    :returns: A function that returns ``True`` if the current user may see
+        the given reply.
+    """
+    user = _get_cur_user()
+    course_id = assignment.course_id
+    enrolled = user.is_enrolled(course_id)
+    may_see_before_done = assignment.is_done or user.has_permission(
+        CPerm.can_see_user_feedback_before_done, course_id
+    )
+    may_see_not_approved = user.has_permission(
+        CPerm.can_view_inline_feedback_before_approved, course_id
+    )
+
+    def may_see(reply: 'psef.models.CommentReply') -> bool:
+        if reply.author.contains_user(user):
+            return enrolled
+        if not may_see_before_done:
+            return False
+        if reply.in_reply_to is not None and not may_see(reply.in_reply_to):
+            return False
+        return reply.is_approved or may_see_not_approved
+
+    return may_see
+
+
 class NotificationPermissions(CoursePermissionChecker):
     """The permission checker for :class:`psef.models.Notification`.
     """
@@ -16,14 +16,16 @@ import errno
 import queue
 import random
 import select
+import shutil
 import signal
 import typing as t
+import hashlib
+import tarfile
 import datetime
 import tempfile
 import threading
 import contextlib
 import subprocess
-import collections
 import dataclasses
 import multiprocessing
 from pathlib import Path
@@ -45,7 +47,7 @@ import cg_worker_pool
 import cg_threading_utils
 from cg_timers import timed_code, timed_function
 
-from .. import models, helpers
+from .. import models, archive, helpers
 from ..helpers import JSONType, RepeatedTimer, defer
 from ..registry import auto_test_handlers
 from ..exceptions import APICodes, StopRunningStepsException
@@ -57,6 +59,9 @@ URL = t.NewType('URL', str)
 
 _STOP_RUNNING = Event()
 _LXC_START_STOP_LOCK = multiprocessing.Lock()
+# The (monotonic) time at which updates were last sent to the server by a
+# ``_ResultReporter``, as this also counts as a heartbeat.
+_LAST_REPORT_TIME = multiprocessing.Value('d', 0.0)
 
 T = t.TypeVar('T')
 Y = t.TypeVar('Y')
@@ -71,6 +76,13 @@ PRE_STUDENT_FIXTURES_DIR = f'{uuid.uuid4().hex}/'
 
 OUTPUT_DIR = f'/.{uuid.uuid4().hex}/{uuid.uuid4().hex}'
 
+# The name of the manifest in the uploaded archives of output files.
+OUTPUT_MANIFEST_NAME = 'manifest.json'
+
+# Output files are compressed using gzip, the lowest compression level is used
+# as the upload is done while the runner is waiting.
+_OUTPUT_COMPRESS_LEVEL = 1
+
 # _Absolute_ path to the bash executable.
 BASH_PATH = '/bin/bash'
 
@@ -105,6 +117,8 @@ _SYSTEMD_WAIT_CMD = [
     '/bin/true',
 ]
 _REQUEST_TIMEOUT = 10
+_FIFO_MIN_READ_SIZE = 1024
+_FIFO_MAX_READ_SIZE = 64 * 1024
 _REQUEST_RETRIES = 5
 _REQUEST_BACKOFF_FACTOR = 1.2
 
@@ -144,6 +158,81 @@ class OutputTail:
     overflowed: bool
 
 
+class _TailBuffer:
+    """A ring buffer that keeps the last bytes written to it.
+
+    >>> buf = _TailBuffer(4)
+    >>> buf.write(b'ab')
+    >>> buf.get_tail()
+    OutputTail(data=b'ab', overflowed=False)
+    >>> buf.write(b'cd')
+    >>> buf.get_tail()
+    OutputTail(data=b'abcd', overflowed=False)
+    >>> buf.write(b'e')
+    >>> buf.get_tail()
+    OutputTail(data=b'bcde', overflowed=True)
+    >>> buf.write(b'0123456789')
+    >>> buf.get_tail()
+    OutputTail(data=b'6789', overflowed=True)
+    >>> buf = _TailBuffer(0)
+    >>> buf.write(b'a')
+    >>> buf.get_tail()
+    OutputTail(data=b'', overflowed=True)
+    """
+
+    def __init__(self, size: int) -> None:
+        self._buffer = bytearray(size)
+        self._size = size
+        # The position where the next byte will be written. As long as the
+        # buffer is not full this is also the amount of bytes in the buffer.
+        self._pos = 0
+        self._full = size == 0
+        self._overflowed = False
+
+    def write(self, data: bytes) -> None:
+        """Write data to the buffer, this only copies the part of the data
+        that is kept.
+
+        :param data: The data to write.
+        :returns: Nothing.
+        """
+        size = self._size
+        length = len(data)
+        if self._full or self._pos + length > size:
+            self._overflowed = self._overflowed or length > 0
+        if size == 0:
+            return
+
+        if length >= size:
+            self._buffer[:] = memoryview(data)[length - size:]
+            self._pos = 0
+            self._full = True
+            return
+
+        end = self._pos + length
+        if end <= size:
+            self._buffer[self._pos:end] = data
+        else:
+            first = size - self._pos
+            view = memoryview(data)
+            self._buffer[self._pos:] = view[:first]
+            self._buffer[:end - size] = view[first:]
+            self._full = True
+        self._pos = end % size
+        self._full = self._full or self._pos == 0
+
+    def get_tail(self) -> OutputTail:
+        """Get the data kept in this buffer.
+
+        :returns: The kept data, in the order it was written.
+        """
+        if self._full:
+            data = bytes(self._buffer[self._pos:] + self._buffer[:self._pos])
+        else:
+            data = bytes(self._buffer[:self._pos])
+        return OutputTail(data=data, overflowed=self._overflowed)
+
+
 @dataclasses.dataclass(frozen=True)
 class StudentCommandResult:
     """The result of a student command.
@@ -383,10 +472,20 @@ _Manager.register('FairLock', cg_threading_utils.FairLock)
 class CpuCores:
     """This class contains a reservation system for cpu cores.
 
-    With this class you can make sure only one of the containers is using
-    specific core at any specific moment. This also works across multiple
-    processes.
+    With this class you can make sure only a limited amount of containers is
+    using specific core at any specific moment. This also works across
+    multiple processes.
+
+    By default every core can be used by one container at a time. The cpu time
+    used by the containers is measured using their cgroups, and when the
+    containers turn out to leave their cores mostly idle (for example because
+    they are waiting on IO) a core can be handed out more than once, up to
+    ``max_per_core`` times.
     """
+    # The fraction of a core we aim to use when oversubscribing.
+    _TARGET_UTILISATION = 0.75
+    # The weight of the older measurements after each new measurement.
+    _USAGE_DECAY = 0.9
 
     class Core:
         """A class representing the currently reserved core.
@@ -400,12 +499,23 @@ class CpuCores:
         def __init__(self, core_number: int, cores: 'CpuCores') -> None:
             self._core_number = core_number
             self._cores = cores
+            self._cpu_time = 0.0
+            self._wall_time = 0.0
+            self._yielded = False
 
         def get_core_number(self) -> int:
             """Get the number of the core that is reserved.
             """
             return self._core_number
 
+        def get_usage(self) -> t.Tuple[float, float]:
+            """Get the measured usage of this core.
+
+            :returns: A tuple of the cpu time used and the wall time measured,
+                both in seconds.
+            """
+            return self._cpu_time, self._wall_time
+
         def yield_core(self) -> bool:
             """Yield the current core.
 
@@ -415,22 +525,66 @@ class CpuCores:
                 make sure that you actually lock the container to this core
                 after the call.
             """
+            self._yielded = True
             new_number = self._cores.yield_core(self._core_number)
             old_number = self._core_number
             self._core_number = new_number
             return new_number != old_number
 
+        @contextlib.contextmanager
+        def measured_usage(self, container: 'StartedContainer'
+                           ) -> t.Generator[None, None, None]:
+            """Measure the cpu time used by the given container during the
+            ``with`` block.
+
+            :param container: The container which is using this core.
+            """
+            self._yielded = False
+            start_cpu = container.get_cpu_time()
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                wall_time = time.monotonic() - start
+                end_cpu = container.get_cpu_time()
+                if self._yielded:
+                    # We yielded because a command timed out, so assume the
+                    # core was fully used. Yielding also restarts the
+                    # container, which resets the usage counter.
+                    self._cpu_time += wall_time
+                    self._wall_time += wall_time
+                elif start_cpu is not None and end_cpu is not None:
+                    if end_cpu < start_cpu:
+                        # The container was restarted.
+                        start_cpu = 0.0
+                    self._cpu_time += min(end_cpu - start_cpu, wall_time)
+                    self._wall_time += wall_time
+
     def __init__(
         self,
         manager: _Manager,
         number_of_cores: t.Optional[int] = None,
+        max_per_core: int = 1,
     ) -> None:
         self._number_of_cores = number_of_cores or _get_amount_cpus()
+        self._max_per_core = max(max_per_core, 1)
         self._available_cores: 'Queue[int]' = manager.Queue(  # type: ignore
-            self._number_of_cores
+            self._number_of_cores * self._max_per_core
         )
         self._lock: cg_threading_utils.FairLock = manager.FairLock(  # type: ignore
         )
+        self._usage_lock: threading.Lock = manager.Lock()
+        self._usage: t.Dict[str, float] = manager.dict(  # type: ignore
+            cpu_time=0.0,
+            wall_time=0.0,
+            total_cpu_time=0.0,
+            total_wall_time=0.0,
+            measurements=0,
+        )
+        # The amount of times every core can be handed out at the same time.
+        self._slots: t.List[int] = manager.list(  # type: ignore
+            [1] * self._number_of_cores
+        )
         for core in range(self._number_of_cores):
             self._available_cores.put(core)
 
@@ -449,6 +603,124 @@ class CpuCores:
         finally:
             self._lock.release()
 
+    def _get_wanted_extra_slots(
+        self, cpu_time: float, wall_time: float
+    ) -> int:
+        """Get the amount of times cores should be oversubscribed.
+
+        >>> get = CpuCores._get_wanted_extra_slots
+        >>> cores = CpuCores.__new__(CpuCores)
+        >>> cores._number_of_cores, cores._max_per_core = 4, 3
+        >>> get(cores, 4.0, 4.0)
+        0
+        >>> get(cores, 1.0, 4.0)
+        8
+        >>> get(cores, 0.0, 0.0)
+        0
+        >>> cores._max_per_core = 1
+        >>> get(cores, 0.0, 4.0)
+        0
+
+        :param cpu_time: The (weighted) cpu time used by the containers.
+        :param wall_time: The (weighted) time the containers were running.
+        :returns: The amount of extra slots that should be available.
+        """
+        if wall_time <= 0:
+            return 0
+        utilisation = cpu_time / wall_time
+        per_core = self._max_per_core
+        if utilisation > 0:
+            per_core = min(
+                per_core, max(int(self._TARGET_UTILISATION / utilisation), 1)
+            )
+        return (per_core - 1) * self._number_of_cores
+
+    def get_slots(self) -> t.List[int]:
+        """Get the amount of times every core can be handed out at the same
+        time.
+
+        :returns: A list with the amount of slots for every core.
+        """
+        with self._usage_lock:
+            return list(self._slots)
+
+    def _release_core(self, core: 'CpuCores.Core') -> None:
+        """Release the given core and update the amount of available slots
+        with its measured usage.
+        """
+        cpu_time, wall_time = core.get_usage()
+        with self._usage_lock:
+            usage = self._usage
+            if wall_time > 0:
+                usage['cpu_time'] = (
+                    usage['cpu_time'] * self._USAGE_DECAY + cpu_time
+                )
+                usage['wall_time'] = (
+                    usage['wall_time'] * self._USAGE_DECAY + wall_time
+                )
+                usage['total_cpu_time'] += cpu_time
+                usage['total_wall_time'] += wall_time
+                usage['measurements'] += 1
+
+            slots = list(self._slots)
+            extra_slots = sum(slots) - self._number_of_cores
+            wanted = 0
+            # Don't oversubscribe before every core has been measured at least
+            # once.
+            if usage['measurements'] >= self._number_of_cores:
+                wanted = self._get_wanted_extra_slots(
+                    usage['cpu_time'], usage['wall_time']
+                )
+
+            core_number = core.get_core_number()
+            # A slot can only be removed from a core that has more than its
+            # base slot, otherwise the core is removed later when a core with
+            # extra slots is released.
+            if extra_slots > wanted and slots[core_number] > 1:
+                logger.info(
+                    'Removing core slot',
+                    core=core_number,
+                    extra_slots=extra_slots,
+                    wanted_extra_slots=wanted,
+                )
+                self._slots[core_number] = slots[core_number] - 1
+                return
+
+            self._available_cores.put(core_number)
+            added = 0
+            while extra_slots + added < wanted:
+                new_core = min(
+                    range(self._number_of_cores),
+                    key=lambda num: (slots[num], num),
+                )
+                if slots[new_core] >= self._max_per_core:
+                    break
+                slots[new_core] += 1
+                self._slots[new_core] = slots[new_core]
+                self._available_cores.put(new_core)
+                added += 1
+
+            if added:
+                logger.info(
+                    'Added core slots',
+                    extra_slots=extra_slots,
+                    wanted_extra_slots=wanted,
+                    slots=slots,
+                )
+
+    def get_utilisation(self) -> t.Optional[float]:
+        """Get the fraction of the reserved cores that was actually used.
+
+        :returns: The utilisation of the cores, or ``None`` if nothing was
+            measured.
+        """
+        with self._usage_lock:
+            return helpers.safe_div(
+                self._usage['total_cpu_time'],
+                self._usage['total_wall_time'],
+                None,
+            )
+
     @contextlib.contextmanager
     def reserved_core(self) -> t.Generator['CpuCores.Core', None, None]:
         """Reserve a core for the duration of the ``with`` block.
@@ -459,7 +731,15 @@ class CpuCores:
         try:
             yield core
         finally:
-            self._available_cores.put(core.get_core_number())
+            cpu_time, wall_time = core.get_usage()
+            logger.info(
+                'Releasing core',
+                core=core.get_core_number(),
+                cpu_time=cpu_time,
+                wall_time=wall_time,
+                utilisation=helpers.safe_div(cpu_time, wall_time, None),
+            )
+            self._release_core(core)
 
 
 class StopContainerException(Exception):
@@ -697,6 +977,10 @@ class RunnerInstructions(TypedDict, total=True):
     :ivar assignment_info: Assignment information made available to AutoTest
         steps.
     :ivar student_infos: List of information associated to each result.
+    :ivar expected_runtimes: The amount of seconds running a result is
+        expected to take, based on the previous result of the same student.
+        The keys are the ids of the results as strings, results for which the
+        runtime is not known are not included.
     :ivar sets: The sets that this AutoTest configuration contain.
     :ivar setup_script: The setup script that should be run for each student.
     :ivar run_setup_script: The setup script that should be run once.
@@ -710,6 +994,7 @@ class RunnerInstructions(TypedDict, total=True):
     result_ids: t.List[int]
     student_ids: t.List[int]
     student_infos: t.Optional[t.List[StudentInformation]]
+    expected_runtimes: t.Dict[str, float]
     assignment_info: t.Optional[AssignmentInformation]
     sets: t.List[SetInstructions]
     fixtures: t.List[t.Tuple[str, int]]
@@ -738,6 +1023,145 @@ class ExecuteOptions:
     yield_core: YieldCoreCallback
 
 
+def _is_list_of_dicts(value: object) -> bool:
+    return isinstance(value, list) and all(isinstance(v, dict) for v in value)
+
+
+def get_log_patch(
+    old_log: t.Mapping[str, object],
+    new_log: t.Mapping[str, object],
+) -> t.Optional[t.Dict[str, object]]:
+    """Get a patch that changes ``old_log`` into ``new_log``.
+
+    The patch contains the top level keys of which the value changed, and for
+    every changed item of the ``steps`` list of the log only the changed keys.
+    So updating a single sub step of a step doesn't require sending the output
+    of all other sub steps again.
+
+    >>> get_log_patch({'a': 1, 'b': 2}, {'a': 1, 'b': 3, 'c': 4})
+    {'set': {'b': 3, 'c': 4}, 'steps': []}
+    >>> get_log_patch(
+    ...     {'steps': [{'state': 'running'}, {'state': 'not_started'}]},
+    ...     {'steps': [{'state': 'passed', 'out': 'a'}, {'state': 'running'}]},
+    ... )['steps']
+    [[0, {'state': 'passed', 'out': 'a'}], [1, {'state': 'running'}]]
+    >>> get_log_patch({'steps': [{}]}, {'steps': [{}, {}]})['steps']
+    [[1, {}]]
+    >>> get_log_patch({'a': 1}, {}) is None
+    True
+    >>> get_log_patch({'steps': [{}, {}]}, {'steps': [{}]}) is None
+    True
+
+    :param old_log: The log as it was last sent to the server.
+    :param new_log: The new log.
+    :returns: The patch, which can be applied with :func:`apply_log_patch`, or
+        ``None`` if something was removed from the log in which case the
+        complete log should be sent.
+    """
+    if any(key not in new_log for key in old_log):
+        return None
+
+    to_set = {}
+    steps_patch = []
+
+    for key, value in new_log.items():
+        old_value = old_log.get(key)
+        if (
+            key == 'steps' and _is_list_of_dicts(value) and
+            _is_list_of_dicts(old_value)
+        ):
+            new_steps = t.cast(t.List[t.Dict[str, object]], value)
+            old_steps = t.cast(t.List[t.Dict[str, object]], old_value)
+            if len(new_steps) < len(old_steps):
+                return None
+
+            for idx, step in enumerate(new_steps):
+                if idx >= len(old_steps):
+                    steps_patch.append([idx, step])
+                    continue
+
+                old_step = old_steps[idx]
+                if any(step_key not in step for step_key in old_step):
+                    return None
+                changed = {
+                    step_key: step_value
+                    for step_key, step_value in step.items()
+                    if step_key not in old_step or
+                    old_step[step_key] != step_value
+                }
+                if changed:
+                    steps_patch.append([idx, changed])
+        elif key not in old_log or old_value != value:
+            to_set[key] = value
+
+    return {'set': to_set, 'steps': steps_patch}
+
+
+def apply_log_patch(
+    log: t.Mapping[str, object],
+    patch: t.Mapping[str, object],
+) -> t.Dict[str, object]:
+    """Apply a patch created by :func:`get_log_patch` to the given log.
+
+    Applying the same patch multiple times gives the same result, so a request
+    containing a patch can safely be retried.
+
+    >>> log = {'a': 1, 'steps': [{'state': 'running', 'out': ''}]}
+    >>> patch = {
+    ...     'set': {'a': 2},
+    ...     'steps': [[0, {'state': 'passed'}], [1, {'state': 'running'}]],
+    ... }
+    >>> new_log = apply_log_patch(log, patch)
+    >>> new_log
+    {'a': 2, 'steps': [{'state': 'passed', 'out': ''}, {'state': 'running'}]}
+    >>> apply_log_patch(new_log, patch) == new_log
+    True
+    >>> log
+    {'a': 1, 'steps': [{'state': 'running', 'out': ''}]}
+    >>> apply_log_patch(log, {'steps': [[5, {}]]})
+    Traceback (most recent call last):
+    ...
+    ValueError: The index 5 of the patched step is out of range
+
+    :param log: The log to patch, this log is not modified.
+    :param patch: The patch to apply.
+    :returns: The patched log.
+    :raises ValueError: If the patch is not a valid patch for the given log.
+    """
+    to_set = patch.get('set', {})
+    steps_patch = patch.get('steps', [])
+    if not isinstance(to_set, dict) or not isinstance(steps_patch, list):
+        raise ValueError('The given patch is not valid')
+
+    res = {**log, **to_set}
+    if not steps_patch:
+        return res
+
+    old_steps = res.get('steps', [])
+    if not _is_list_of_dicts(old_steps):
+        raise ValueError('The steps of the log cannot be patched')
+    steps = list(t.cast(t.List[t.Dict[str, object]], old_steps))
+
+    for item in steps_patch:
+        if not (
+            isinstance(item, list) and len(item) == 2 and
+            isinstance(item[0], int) and isinstance(item[1], dict)
+        ):
+            raise ValueError('The given patch is not valid')
+        idx, changes = item
+        if idx == len(steps):
+            steps.append(changes)
+        elif 0 <= idx < len(steps):
+            steps[idx] = {**steps[idx], **changes}
+        else:
+            raise ValueError(
+                f'The index {idx} of the patched step is out of range'
+            )
+
+    res['steps'] = steps
+    return res
+
+
 def init_app(_: 'psef.PsefFlask') -> None:
     pass
 
@@ -990,6 +1414,38 @@ class StartedContainer:
                 if success:
                     return
 
+    def get_cgroup_item(self, key: str) -> t.Optional[str]:
+        """Get a cgroup option of the given container.
+
+        :param key: The cgroup key to get.
+        :returns: The value of the option, or ``None`` if it could not be
+            retrieved.
+        """
+        try:
+            return self._container.get_cgroup_item(key)
+        except KeyError:
+            return None
+
+    def get_cpu_time(self) -> t.Optional[float]:
+        """Get the cpu time used by the container since it was started.
+
+        Both the ``cpuacct`` controller of cgroup v1 and the ``cpu``
+        controller of cgroup v2 are supported.
+
+        :returns: The used cpu time in seconds, or ``None`` if it could not be
+            retrieved.
+        """
+        usage = self.get_cgroup_item('cpuacct.usage')
+        if usage is not None and usage.strip().isdigit():
+            return int(usage) / 10 ** 9
+
+        for line in (self.get_cgroup_item('cpu.stat') or '').splitlines():
+            key, _, value = line.partition(' ')
+            if key == 'usage_usec' and value.strip().isdigit():
+                return int(value) / 10 ** 6
+
+        return None
+
     def _create_snapshot(self) -> None:
         with self._SNAPSHOT_LOCK:
             snap = self._container.snapshot()
@@ -1041,8 +1497,12 @@ class StartedContainer:
         _start_container(self._container, check_network=True)
 
     @contextlib.contextmanager
-    def as_snapshot(self, disable_network: bool = False
-                    ) -> t.Generator['StartedContainer', None, None]:
+    def as_snapshot(
+        self,
+        disable_network: bool = False,
+        *,
+        restore: bool = True,
+    ) -> t.Generator['StartedContainer', None, None]:
         """Create a snapshot of the running container.
 
         .. warning::
@@ -1051,6 +1511,12 @@ class StartedContainer:
           this. To also restore the network use
           :meth:`.StartedContainer.enable_network` and
           :meth:`.StartedContainer.disable_network`.
+
+        :param disable_network: Disable the network inside the block.
+        :param restore: Restore the container to the snapshot after the
+            block. If this is ``False`` no snapshot is created, which saves
+            stopping and starting the container twice when it isn't used
+            after the block anymore.
         """
         # NOTE: This code never destroys snapshots, as this logic makes the
         # function way harder to follow. As we keep a dirty flag, only one
@@ -1064,8 +1530,9 @@ class StartedContainer:
             self.enable_network()
 
         try:
-
-            if self._dirty or not self._snapshots:
+            if not restore:
+                logger.info('Snapshot not needed as it is not restored')
+            elif self._dirty or not self._snapshots:
                 with timed_code(
                     'create_snapshot',
                     container=self._name,
@@ -1085,7 +1552,7 @@ class StartedContainer:
             yield self
         finally:
             # Creating the snapshot, so we might not have a snapshot
-            if self._snapshots:
+            if restore and self._snapshots:
                 self._stop_container()
                 with self._SNAPSHOT_LOCK, timed_code('restore_snapshots'):
                     self._container.snapshot_restore(self._snapshots[-1])
@@ -1096,7 +1563,9 @@ class StartedContainer:
 
     @staticmethod
     def _read_fifo(
-        files: t.Mapping[str, OutputCallback], stop: LockableValue[bool]
+        files: t.Mapping[str, OutputCallback],
+        stop: LockableValue[bool],
+        read_size: t.Callable[[], int],
     ) -> None:
         fds = {}
 
@@ -1110,12 +1579,13 @@ class StartedContainer:
             while fds and not stop.get():
                 reads, _, _ = select.select(list(fds.keys()), [], [], 0.5)
                 for f in reads:
-                    # Read at most 1024, this is a low value as otherwise we
-                    # might fill the limited output buffers with only one of
-                    # the two file descriptors. (see
-                    # ``_make_restricted_append`` for how the shared output
-                    # buffers work).
-                    data = os.read(f, 1024)
+                    # The read size is normally low, as otherwise we might
+                    # fill the limited output buffers with only one of the two
+                    # file descriptors (see ``_make_restricted_append`` for
+                    # how the shared output buffers work). Once these buffers
+                    # are full it is increased, so large outputs don't cost a
+                    # read and a callback per kilobyte.
+                    data = os.read(f, read_size())
                     if data:
                         # We know that select returns a subset of its
                         # arguments, so ``f`` should always be in ``fds``.
@@ -1344,9 +1814,7 @@ class StartedContainer:
         """
         stdout: t.List[bytes] = []
         stderr: t.List[bytes] = []
-        max_tail_len = self._config['AUTO_TEST_MAX_OUTPUT_TAIL']
-        stdout_tail: t.Deque[int] = collections.deque([], maxlen=max_tail_len)
-        tail_overflowed: bool = False
+        stdout_tail = _TailBuffer(self._config['AUTO_TEST_MAX_OUTPUT_TAIL'])
 
         user = CODEGRADE_USER
         if cwd is None:
@@ -1365,19 +1833,20 @@ class StartedContainer:
             ]
 
         if keep_stdout_tail:
-
-            def on_stdout(data: bytes) -> None:
-                nonlocal tail_overflowed
-                tail_overflowed = (
-                    tail_overflowed or
-                    len(data) + len(stdout_tail) > max_tail_len
-                )
-                stdout_tail.extend(data)
+            on_stdout = stdout_tail.write
         else:
 
             def on_stdout(data: bytes) -> None:  # pylint: disable=unused-argument
                 return
 
+        def get_read_size() -> int:
+            # Once the output limit is reached the order in which stdout and
+            # stderr are read doesn't matter anymore, so we can read larger
+            # chunks.
+            if size_left.get() > 0:
+                return _FIFO_MIN_READ_SIZE
+            return _FIFO_MAX_READ_SIZE
+
         time_spend = 0.0
         try:
             with timed_code('run_student_command') as get_time_spend:
@@ -1391,6 +1860,7 @@ class StartedContainer:
                     stdin=stdin,
                     check=False,
                     timeout=timeout,
+                    read_size=get_read_size,
                 )
             time_spend = get_time_spend()
         except CommandTimeoutException as e:
@@ -1408,9 +1878,7 @@ class StartedContainer:
             stdout=stdout_str,
             stderr=stderr_str,
             time_spend=time_spend,
-            stdout_tail=OutputTail(
-                data=stdout_tail, overflowed=tail_overflowed
-            ),
+            stdout_tail=stdout_tail.get_tail(),
         )
 
     def run_command(
@@ -1474,6 +1942,7 @@ class StartedContainer:
         stdout: t.Union[OutputCallback, None, str],
         stderr: t.Optional[OutputCallback],
         stdin: t.Union[None, bytes],
+        read_size: t.Callable[[], int],
     ) -> t.Generator[t.Tuple[t.IO[bytes], t.BinaryIO, t.BinaryIO, threading.
                              Event, t.Callable[[float], None]], None, None]:
 
@@ -1526,7 +1995,7 @@ class StartedContainer:
 
             reader_thread = threading.Thread(
                 target=self._read_fifo,
-                args=(reader_fifo_files, stop_reader_threads)
+                args=(reader_fifo_files, stop_reader_threads, read_size)
             )
             reader_thread.start()
 
@@ -1561,13 +2030,14 @@ class StartedContainer:
         stdin: t.Union[None, bytes],
         check: bool,
         timeout: t.Union[None, float, int],
+        read_size: t.Callable[[], int] = lambda: _FIFO_MIN_READ_SIZE,
     ) -> int:
         self._dirty = True
         assert timeout is None or timeout > 0
 
         with cg_logger.bound_to_logger(
             cmd=cmd, timeout=timeout
-        ), self._prepared_output(stdout, stderr, stdin) as [
+        ), self._prepared_output(stdout, stderr, stdin, read_size) as [
             stdin_file, stdout_file, stderr_file, command_started, stop_reading
         ]:
             _maybe_quit_running()
@@ -1683,22 +2153,704 @@ class AutoTestContainer:
                 with timed_code('destroy_container'):
                     self.destroy_container()
 
-    def clone(self, *, new_name: str = '') -> 'AutoTestContainer':
+    def clone(
+        self,
+        *,
+        new_name: str = '',
+        snapshot: bool = False,
+    ) -> 'AutoTestContainer':
         """Clone this container to a new container.
 
         :param new_name: The name of the new container, will be randomly
             generated if not provided.
+        :param snapshot: Create the clone as a copy-on-write snapshot of this
+            container, instead of copying its entire root filesystem. This
+            container should not be changed or started as long as the clone
+            exists.
         :returns: A clone of this container with the provided name.
         """
         _maybe_quit_running()
 
-        with self._lock, timed_code('clone_container'):
+        with self._lock, timed_code('clone_container', snapshot=snapshot):
             new_name = new_name or _get_new_container_name()
-            cont = self._cont.clone(new_name)
+            cont = self._cont.clone(
+                new_name, flags=lxc.LXC_CLONE_SNAPSHOT if snapshot else 0
+            )
             assert isinstance(cont, lxc.Container)
             return type(self)(new_name, self._config, cont)
 
 
+@dataclasses.dataclass(frozen=True)
+class _OutputFile:
+    """A single output file from an archive of the output directory.
+
+    :ivar path: The path of the file, relative to the output directory.
+    :ivar digest: The sha256 hex digest of the contents of the file.
+    :ivar size: The size of the contents of the file in bytes.
+    :ivar member: The member of the archive containing the contents, or
+        ``None`` if the contents are stored in ``content``.
+    :ivar content: The contents of the file if ``member`` is ``None``.
+    """
+    path: str
+    digest: str
+    size: int
+    member: t.Optional[tarfile.TarInfo] = None
+    content: bytes = b''
+
+    def open(self, tar: tarfile.TarFile) -> t.IO[bytes]:
+        """Open the contents of this file.
+
+        :param tar: The archive from which this file was read.
+        :returns: A readable file with the contents.
+        """
+        if self.member is None:
+            return io.BytesIO(self.content)
+        fileobj = tar.extractfile(self.member)
+        assert fileobj is not None
+        return fileobj
+
+
+def _get_output_files(tar: tarfile.TarFile) -> t.List[_OutputFile]:
+    """Get all files in the given archive of the output directory.
+
+    Symbolic links are replaced by a notice, just like when extracting
+    archives on the server.
+
+    >>> buf = io.BytesIO()
+    >>> with tarfile.open(fileobj=buf, mode='w') as tar:
+    ...     info = tarfile.TarInfo('./dir/file')
+    ...     info.size = 5
+    ...     tar.addfile(info, io.BytesIO(b'hello'))
+    ...     info = tarfile.TarInfo('./link')
+    ...     info.type = tarfile.SYMTYPE
+    ...     info.linkname = '/etc/passwd'
+    ...     tar.addfile(info)
+    >>> _ = buf.seek(0)
+    >>> with tarfile.open(fileobj=buf, mode='r') as tar:
+    ...     files = _get_output_files(tar)
+    >>> [(f.path, f.size) for f in files]
+    [('dir/file', 5), ('link', 117)]
+    >>> files[0].digest[:16]
+    '2cf24dba5fb0a30e'
+
+    :param tar: The archive to read.
+    :returns: The files in the archive.
+    """
+    res = []
+    for member in tar.getmembers():
+        path = member.name
+        while path.startswith('./'):
+            path = path[2:]
+
+        if member.issym():
+            content = archive.get_symlink_notice(member.linkname).encode()
+            res.append(
+                _OutputFile(
+                    path=path,
+                    digest=hashlib.sha256(content).hexdigest(),
+                    size=len(content),
+                    content=content,
+                )
+            )
+            continue
+
+        fileobj = tar.extractfile(member)
+        if fileobj is None:
+            continue
+
+        digest = hashlib.sha256()
+        read = fileobj.read
+        for chunk in iter(lambda: read(1 << 16), b''):
+            digest.update(chunk)
+        res.append(
+            _OutputFile(
+                path=path,
+                digest=digest.hexdigest(),
+                size=member.size,
+                member=member,
+            )
+        )
+
+    return res
+
+
+def _write_output_archive(
+    out: t.IO[bytes],
+    tar: tarfile.TarFile,
+    output_files: t.Sequence[_OutputFile],
+    missing: t.Container[str],
+) -> None:
+    """Write the archive that can be uploaded to the server.
+
+    The archive contains a manifest of all output files, and the contents of
+    every file of which the digest is in ``missing`` once.
+
+    :param out: The file to write the archive to.
+    :param tar: The archive of the output directory.
+    :param output_files: The files from this archive.
+    :param missing: The digests of the contents that should be uploaded.
+    :returns: Nothing.
+    """
+    manifest = json.dumps(
+        [{
+            'path': f.path,
+            'digest': f.digest,
+        } for f in output_files]
+    ).encode('utf8')
+
+    with tarfile.open(
+        fileobj=out, mode='w:gz', compresslevel=_OUTPUT_COMPRESS_LEVEL
+    ) as upload:
+        info = tarfile.TarInfo(OUTPUT_MANIFEST_NAME)
+        info.size = len(manifest)
+        upload.addfile(info, io.BytesIO(manifest))
+
+        added = set()
+        for output_file in output_files:
+            digest = output_file.digest
+            if digest in added or digest not in missing:
+                continue
+            added.add(digest)
+            info = tarfile.TarInfo(digest)
+            info.size = output_file.size
+            upload.addfile(info, output_file.open(tar))
+
+
+class _DownloadCache:
+    """A content addressed cache of files downloaded from the server.
+
+    Downloaded fixtures are stored by the sha256 digest of their contents, and
+    validated against the ETag of the server on every use. The submission
+    files of students that will be tested soon can be prefetched in bulk.
+
+    This class only stores paths, so it can be used in all the processes of a
+    run at the same time.
+    """
+    # Cached files that were not used for this amount of time are removed.
+    _MAX_AGE = datetime.timedelta(days=7)
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        for directory in ['blobs', 'index', 'submissions', 'tmp']:
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def _get_blob_path(self, digest: str) -> str:
+        return os.path.join(self._root, 'blobs', digest)
+
+    def _get_index_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return os.path.join(self._root, 'index', key)
+
+    def _get_submission_path(self, run_id: int, result_id: int) -> str:
+        return os.path.join(
+            self._root, 'submissions', str(run_id), f'{result_id}.zip'
+        )
+
+    @contextlib.contextmanager
+    def _atomic_write(self, dst: str) -> t.Generator[t.IO[bytes], None, None]:
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.join(self._root, 'tmp'), delete=False
+        ) as f:
+            try:
+                yield f
+            except:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, dst)
+
+    def remove_old_files(self) -> None:
+        """Remove all cached fixtures that were not used recently.
+
+        :returns: Nothing.
+        """
+        oldest = time.time() - self._MAX_AGE.total_seconds()
+        for directory in ['blobs', 'index', 'tmp']:
+            for entry in os.scandir(os.path.join(self._root, directory)):
+                with contextlib.suppress(FileNotFoundError):
+                    if entry.stat().st_mtime < oldest:
+                        os.unlink(entry.path)
+
+    def download(self, session: requests.Session, url: str) -> str:
+        """Download the given url, or use the cached version if it is still
+        valid.
+
+        :param session: The session to do the request with.
+        :param url: The url to download.
+        :returns: The path to the downloaded file. This file should not be
+            changed.
+        """
+        headers = {}
+        index_path = self._get_index_path(url)
+        try:
+            with open(index_path, 'r') as index_file:
+                known_digest: t.Optional[str] = index_file.read().strip()
+        except FileNotFoundError:
+            known_digest = None
+        if known_digest and os.path.isfile(self._get_blob_path(known_digest)):
+            headers['If-None-Match'] = f'"{known_digest}"'
+
+        with session.get(
+            url, headers=headers, stream=True, timeout=_REQUEST_TIMEOUT
+        ) as response:
+            if response.status_code == 304 and known_digest:
+                logger.info('Using cached file', url=url, digest=known_digest)
+                blob_path = self._get_blob_path(known_digest)
+                os.utime(blob_path)
+                os.utime(index_path)
+                return blob_path
+
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.join(self._root, 'tmp'), delete=False
+            ) as f:
+                try:
+                    for chunk in response.iter_content(_FIFO_MAX_READ_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                except:
+                    os.unlink(f.name)
+                    raise
+            etag = response.headers.get('ETag', '').strip('"')
+
+        if etag and etag != digest.hexdigest():
+            os.unlink(f.name)
+            raise StopRunningStudentException(
+                f'Downloaded file does not match its ETag: {url}'
+            )
+
+        blob_path = self._get_blob_path(digest.hexdigest())
+        os.replace(f.name, blob_path)
+        if etag:
+            with self._atomic_write(index_path) as new_index:
+                new_index.write(etag.encode('utf8'))
+        logger.info('Downloaded file into cache', url=url, digest=etag)
+        return blob_path
+
+    def prefetch_submissions(
+        self, session: requests.Session, url: str, run_id: int,
+        result_ids: t.Sequence[int]
+    ) -> None:
+        """Download the submission files of the given results.
+
+        :param session: The session to do the request with.
+        :param url: The url of the bulk submissions route of the run.
+        :param run_id: The id of the run of the results.
+        :param result_ids: The ids of the results to download.
+        :returns: Nothing.
+        """
+        os.makedirs(
+            os.path.dirname(self._get_submission_path(run_id, 0)),
+            exist_ok=True,
+        )
+        with session.post(
+            url,
+            json={'result_ids': list(result_ids)},
+            stream=True,
+            timeout=_REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with tarfile.open(fileobj=response.raw, mode='r|') as tar:
+                for member in tar:
+                    fileobj = tar.extractfile(member)
+                    result_id, _, ext = member.name.partition('.')
+                    if fileobj is None or not result_id.isdigit(
+                    ) or ext != 'zip':
+                        continue
+                    dst = self._get_submission_path(run_id, int(result_id))
+                    with self._atomic_write(dst) as f:
+                        shutil.copyfileobj(fileobj, f, _FIFO_MAX_READ_SIZE)
+
+    def pop_submission(self, run_id: int,
+                       result_id: int) -> t.Optional[bytes]:
+        """Get and remove the prefetched submission files of a result.
+
+        :param run_id: The id of the run of the result.
+        :param result_id: The id of the result.
+        :returns: The zip with the submission files, or ``None`` if the files
+            were not prefetched.
+        """
+        path = self._get_submission_path(run_id, result_id)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+    def clear_submissions(self, run_id: int) -> None:
+        """Remove all prefetched submissions of the given run.
+
+        :param run_id: The id of the run.
+        :returns: Nothing.
+        """
+        shutil.rmtree(
+            os.path.dirname(self._get_submission_path(run_id, 0)),
+            ignore_errors=True,
+        )
+
+
+class _StudentTimings:
+    """The time spent in the different phases of running a single student.
+
+    Phases can be timed from multiple threads at the same time, for example
+    the reporting of results is done in the background.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._phases: t.Dict[str, float] = {}
+        self._steps: t.Dict[int, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add time to the given phase.
+
+        >>> timings = _StudentTimings()
+        >>> timings.add('setup', 1.5)
+        >>> timings.add('setup', 1)
+        >>> timings.to_json()['phases']
+        {'setup': 2.5}
+
+        :param phase: The name of the phase.
+        :param seconds: The time to add in seconds.
+        :returns: Nothing.
+        """
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0.0) + seconds
+
+    def add_step(self, step_id: int, seconds: float) -> None:
+        """Add the time it took to run a step.
+
+        The time is also added to the ``steps`` phase.
+
+        >>> timings = _StudentTimings()
+        >>> timings.add_step(5, 2)
+        >>> timings.add_step(6, 1)
+        >>> timings.to_json()['steps']
+        {'5': 2.0, '6': 1.0}
+        >>> timings.to_json()['phases']
+        {'steps': 3.0}
+
+        :param step_id: The id of the step.
+        :param seconds: The time it took to run the step in seconds.
+        :returns: Nothing.
+        """
+        with self._lock:
+            self._steps[step_id] = self._steps.get(step_id, 0.0) + seconds
+        self.add('steps', seconds)
+
+    @contextlib.contextmanager
+    def timed(self, phase: str) -> t.Generator[None, None, None]:
+        """Add the time spent in the ``with`` block to the given phase.
+
+        :param phase: The name of the phase.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - start)
+
+    @contextlib.contextmanager
+    def timed_context(
+        self,
+        phase: str,
+        context: t.ContextManager[T],
+    ) -> t.Generator[T, None, None]:
+        """Add the time spent entering and exiting the given context manager
+        to the given phase, but not the time spent in the ``with`` block.
+
+        :param phase: The name of the phase.
+        :param context: The context manager to enter.
+        """
+        with self.timed(phase):
+            value = context.__enter__()
+
+        try:
+            yield value
+        except:
+            with self.timed(phase):
+                if not context.__exit__(*sys.exc_info()):
+                    raise
+        else:
+            with self.timed(phase):
+                context.__exit__(None, None, None)
+
+    def to_json(self) -> t.Dict[str, object]:
+        """Get the timings as they should be send to the server.
+
+        :returns: A mapping with the ``total`` time since the creation of this
+            object, and mappings with the time spent per ``phases`` and per
+            ``steps``.
+        """
+        with self._lock:
+            return {
+                'total': time.monotonic() - self._start,
+                'phases': dict(self._phases),
+                'steps': {
+                    str(step_id): seconds
+                    for step_id, seconds in self._steps.items()
+                },
+            }
+
+
+class _ResultReporter:
+    """Report updates of a result and its step results to the server in the
+    background.
+
+    Updates are sent in the order in which they were added. All updates that
+    are added while a request is in flight are sent together in a single
+    request, in which consecutive updates of the same step are merged and
+    only the changes of the logs are sent (see :func:`get_log_patch`).
+
+    Errors that occur while sending updates are raised by the next call to
+    one of the public methods of this class.
+
+    :ivar timings: The timings of the student of this result, the time spent
+        sending updates is added to its ``reporting`` phase.
+    """
+
+    def __init__(
+        self,
+        runner: 'AutoTestRunner',
+        result_id: int,
+        timings: t.Optional[_StudentTimings] = None,
+    ) -> None:
+        self._runner = runner
+        self._result_id = result_id
+        self.timings = _StudentTimings() if timings is None else timings
+        self._url = (
+            f'{runner.base_url}/runs/{runner.instructions["run_id"]}/updates/'
+        )
+
+        self._cond = threading.Condition()
+        self._queue: t.List[t.Dict[str, t.Any]] = []
+        self._sending = False
+        self._stopped = False
+        self._error: t.Optional[Exception] = None
+
+        # The logs of the steps as they are stored on the server, and the ids
+        # of the step results, by the id of the step.
+        self._server_logs: t.Dict[int, t.Dict[str, object]] = {}
+        self._step_result_ids: t.Dict[int, int] = {}
+
+    @contextlib.contextmanager
+    def started(self) -> t.Iterator['_ResultReporter']:
+        """Send the added updates in a background thread while inside this
+        context manager.
+
+        When the context manager exits normally it waits until all added
+        updates are sent, errors while sending them are logged by the sending
+        thread. When it exits because of an exception unsent updates are
+        discarded, as the result will be retried or marked as failed anyway.
+        Use :meth:`flush` to wait until all updates are sent and to raise
+        errors that occurred while sending them.
+        """
+        thread = threading.Thread(target=self._send_updates, daemon=True)
+        thread.start()
+        try:
+            yield self
+            self._wait_until_sent()
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+            thread.join()
+
+    def _maybe_raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _add_update(self, update: t.Dict[str, t.Any]) -> None:
+        with self._cond:
+            self._maybe_raise_error()
+            assert not self._stopped, 'Reporter is not running'
+            self._queue.append(update)
+            self._cond.notify_all()
+
+    def update_result(self, data: t.Mapping[str, object]) -> None:
+        """Update the result.
+
+        :param data: The data to update, see
+            :func:`.v_internal.auto_tests.update_result`.
+        :returns: Nothing.
+        """
+        self._add_update(
+            {**data, 'type': 'result', 'result_id': self._result_id}
+        )
+
+    def update_step_result(
+        self,
+        step_id: int,
+        state: 'models.AutoTestStepResultState',
+        log: t.Dict[str, object],
+    ) -> None:
+        """Update the result of a step.
+
+        :param step_id: The id of the step of which the result should be
+            updated.
+        :param state: The new state of the step.
+        :param log: The new log of the step, it is copied so it can be
+            modified after calling this method.
+        :returns: Nothing.
+        """
+        self._add_update(
+            {
+                'type': 'step_result',
+                'result_id': self._result_id,
+                'auto_test_step_id': step_id,
+                'state': state.name,
+                'log': copy.deepcopy(log),
+            }
+        )
+
+    def update_step_result_with_attachment(
+        self,
+        step_id: int,
+        state: 'models.AutoTestStepResultState',
+        log: t.Dict[str, object],
+        attachment: t.IO[bytes],
+    ) -> None:
+        """Update the result of a step and upload an attachment for it.
+
+        This is not done in the background, but only after all other updates
+        have been sent.
+
+        :param step_id: The id of the step of which the result should be
+            updated.
+        :param state: The new state of the step.
+        :param log: The new log of the step.
+        :param attachment: The attachment to upload.
+        :returns: Nothing.
+        """
+        self.flush()
+
+        data: t.Dict[str, object] = {
+            'state': state.name,
+            'auto_test_step_id': step_id,
+            'has_attachment': True,
+            'log': log,
+        }
+        if step_id in self._step_result_ids:
+            data['id'] = self._step_result_ids[step_id]
+
+        json_data = io.StringIO()
+        json.dump(data, json_data)
+        json_data.seek(0, 0)
+
+        with self.timings.timed('reporting'):
+            response = self._runner.req.put(
+                f'{self._runner.base_url}/results/{self._result_id}'
+                '/step_results/',
+                files={
+                    'attachment': attachment,
+                    'json': json_data,
+                },
+                timeout=_REQUEST_TIMEOUT,
+            )
+        logger.info('Posted result data', response=response)
+        response.raise_for_status()
+
+        self._step_result_ids[step_id] = response.json()['id']
+        self._server_logs[step_id] = copy.deepcopy(log)
+
+    def flush(self) -> None:
+        """Wait until all added updates have been sent.
+
+        :returns: Nothing.
+        """
+        self._wait_until_sent()
+        with self._cond:
+            self._maybe_raise_error()
+
+    def _wait_until_sent(self) -> None:
+        with self._cond:
+            while (self._queue or self._sending) and self._error is None:
+                self._cond.wait()
+
+    def _send_updates(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    if self._queue:
+                        logger.warning(
+                            'Discarding unsent updates',
+                            amount_of_updates=len(self._queue),
+                        )
+                    return
+                updates = self._queue
+                self._queue = []
+                self._sending = True
+
+            try:
+                self._send(updates)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning('Sending updates failed', exc_info=True)
+                with self._cond:
+                    self._error = exc
+                    self._queue.clear()
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
+
+    def _send(self, updates: t.List[t.Dict[str, t.Any]]) -> None:
+        to_send: t.List[t.Dict[str, t.Any]] = []
+        for update in updates:
+            prev = to_send[-1] if to_send else None
+            if (
+                prev is not None and prev['type'] == 'step_result' and
+                update['type'] == 'step_result' and
+                prev['auto_test_step_id'] == update['auto_test_step_id']
+            ):
+                # Only the last log and state of a step matter.
+                to_send[-1] = update
+            else:
+                to_send.append(update)
+
+        # The logs of the steps as they will be stored on the server after
+        # the earlier updates in this request have been applied.
+        logs = dict(self._server_logs)
+        for idx, update in enumerate(to_send):
+            if update['type'] != 'step_result':
+                continue
+
+            step_id = update['auto_test_step_id']
+            log = update['log']
+            log_patch = None
+            if step_id in logs:
+                log_patch = get_log_patch(logs[step_id], log)
+            logs[step_id] = log
+
+            if log_patch is not None:
+                to_send[idx] = {
+                    **{k: v for k, v in update.items() if k != 'log'},
+                    'log_patch': log_patch,
+                }
+
+        logger.info('Posting updates', amount_of_updates=len(to_send))
+        with self.timings.timed('reporting'):
+            response = self._runner.req.put(
+                self._url,
+                json={'updates': to_send},
+                timeout=_REQUEST_TIMEOUT,
+            )
+        logger.info('Posted updates', response=response)
+        response.raise_for_status()
+        _LAST_REPORT_TIME.value = time.monotonic()
+
+        self._server_logs = logs
+        for update, res in zip(to_send, response.json()):
+            if update['type'] == 'step_result':
+                self._step_result_ids[update['auto_test_step_id']] = res['id']
+
+
 class AutoTestRunner:
     """This class contains all functionality needed to run a single AutoTest.
     """
@@ -1710,9 +2862,13 @@ class AutoTestRunner:
         self._global_password = global_password
         self.instructions = instructions
         result_ids = instructions['result_ids']
+        expected_runtimes = instructions.get('expected_runtimes', {})
         self.work = [
-            cg_worker_pool.Work(result_id=result_id, student_id=student_id)
-            for result_id, student_id in
+            cg_worker_pool.Work(
+                result_id=result_id,
+                student_id=student_id,
+                expected_runtime=expected_runtimes.get(str(result_id)),
+            ) for result_id, student_id in
             zip(result_ids, instructions.get('student_ids', result_ids))
         ]
         self.auto_test_id = instructions['auto_test_id']
@@ -1725,6 +2881,18 @@ class AutoTestRunner:
         self.fixtures = self.instructions['fixtures']
         self._reqs: t.Dict[t.Tuple[int, int], requests.Session] = {}
 
+        self._cache: t.Optional[_DownloadCache] = None
+        if config['AUTO_TEST_CACHE_DIR']:
+            # Every server gets its own cache, as ids are not unique across
+            # servers.
+            server_key = hashlib.sha256(str(base_url).encode('utf8'))
+            self._cache = _DownloadCache(
+                os.path.join(
+                    config['AUTO_TEST_CACHE_DIR'],
+                    server_key.hexdigest(),
+                )
+            )
+
     @staticmethod
     def _get_amount_of_needed_workers() -> int:
         """Get the amount of needed workers.
@@ -1762,17 +2930,97 @@ class AutoTestRunner:
             initial_work=self.work,
         )
 
-    def _work_producer(self, last_call: bool) -> t.List[cg_worker_pool.Work]:
+    def _work_producer(
+        self, last_call: bool, amount: int
+    ) -> t.List[cg_worker_pool.Work]:
         url = furl.furl(self.base_url).add(
             path=['runs', self.instructions['run_id'], 'results', ''],
             args={
                 'last_call': last_call,
-                'limit': _get_amount_cpus() * 4,
+                'limit': max(amount, _get_amount_cpus() * 4),
             },
         )
         res = self.req.get(str(url), timeout=_REQUEST_TIMEOUT)
         res.raise_for_status()
-        return [cg_worker_pool.Work(**item) for item in res.json()]
+        work = [cg_worker_pool.Work(**item) for item in res.json()]
+        self._prefetch_submissions(work)
+        return work
+
+    def _prefetch_submissions(
+        self, work: t.Sequence[cg_worker_pool.Work]
+    ) -> None:
+        """Download the submission files of the given work in the background.
+
+        Only the first ``AUTO_TEST_PREFETCH_AMOUNT`` items of work, in the
+        order in which they will be run (see :meth:`_sort_by_priority`), are
+        prefetched. The prefetched files are used by
+        :meth:`.AutoTestRunner.download_student_code`.
+
+        :param work: The work that will be done soon.
+        :returns: Nothing.
+        """
+        cache = self._cache
+        amount = self.config['AUTO_TEST_PREFETCH_AMOUNT']
+        if cache is None or amount <= 0 or not work:
+            return
+
+        run_id = self.instructions['run_id']
+        result_ids = [
+            w.result_id for w in self._sort_by_priority(work)[:amount]
+        ]
+
+        def prefetch() -> None:
+            assert cache is not None
+            try:
+                with timed_code(
+                    'prefetch_submissions', amount=len(result_ids)
+                ):
+                    cache.prefetch_submissions(
+                        self.req,
+                        f'{self.base_url}/runs/{run_id}/results/submissions/',
+                        run_id,
+                        result_ids,
+                    )
+            except:  # pylint: disable=bare-except
+                logger.warning('Could not prefetch submissions', exc_info=True)
+
+        threading.Thread(target=prefetch, daemon=True).start()
+
+    @staticmethod
+    def _sort_by_priority(
+        work: t.Sequence[cg_worker_pool.Work]
+    ) -> t.List[cg_worker_pool.Work]:
+        """Sort the given work in the order in which the work queue of the
+        worker pool hands it out.
+
+        Work with the longest expected runtime is done first, work without an
+        expected runtime is treated as taking the average time. Ties keep
+        their original order.
+
+        >>> Work = cg_worker_pool.Work
+        >>> work = [
+        ...     Work(1, 1, None), Work(2, 2, 1.0), Work(3, 3, 5.0),
+        ...     Work(4, 4, 3.0), Work(5, 5, None),
+        ... ]
+        >>> [w.result_id for w in AutoTestRunner._sort_by_priority(work)]
+        [3, 1, 4, 5, 2]
+        >>> AutoTestRunner._sort_by_priority([])
+        []
+
+        :param work: The work to sort.
+        :returns: The sorted work.
+        """
+        known = [
+            w.expected_runtime for w in work if w.expected_runtime is not None
+        ]
+        average = sum(known) / len(known) if known else 0.0
+
+        def get_runtime(w: cg_worker_pool.Work) -> float:
+            if w.expected_runtime is None:
+                return average
+            return w.expected_runtime
+
+        return sorted(work, key=lambda w: -get_runtime(w))
 
     @staticmethod
     def _make_req_key() -> t.Tuple[int, int]:
@@ -1888,18 +3136,38 @@ class AutoTestRunner:
         cont.run_command(['chmod', '-R', '750', dst], user=CODEGRADE_USER)
         logger.info('Downloaded file', dst=dst, url=url)
 
+    @staticmethod
+    def _copy_into_container(
+        cont: StartedContainer, content: bytes, dst: str
+    ) -> None:
+        cont.run_command(
+            ['cp', '/dev/stdin', dst],
+            stdin=content,
+            user=CODEGRADE_USER,
+        )
+        cont.run_command(['chmod', '-R', '750', dst], user=CODEGRADE_USER)
+
     def download_fixtures(self, cont: StartedContainer) -> None:
         """Download all the fixtures of this test.
 
+        When a download cache is configured the fixtures are only downloaded
+        when their contents changed since they were last downloaded.
+
         :param cont: The container in which the fixtures should be downloaded.
         """
         for name, fixture_id in self.fixtures:
-            self.download_file(
-                cont,
-                f'fixtures/{fixture_id}',
-                f'{cont.fixtures_dir}{name}',
-                from_home=False,
+            dst = f'{cont.fixtures_dir}{name}'
+            if self._cache is None:
+                self.download_file(
+                    cont, f'fixtures/{fixture_id}', dst, from_home=False
+                )
+                continue
+
+            path = self._cache.download(
+                self.req, f'{self.base_url}/fixtures/{fixture_id}'
             )
+            with open(path, 'rb') as f:
+                self._copy_into_container(cont, f.read(), dst)
 
         cont.run_command(
             ['ls', '-hl', cont.fixtures_dir],
@@ -1915,8 +3183,21 @@ class AutoTestRunner:
         :param cont: The lxc container in which to download the code.
         :param result_id: The id of the code which should be downloaded.
         """
-        url = f'results/{result_id}?type=submission_files'
-        self.download_file(cont, url, 'student.zip')
+        prefetched = None
+        if self._cache is not None:
+            prefetched = self._cache.pop_submission(
+                self.instructions['run_id'], result_id
+            )
+
+        if prefetched is None:
+            url = f'results/{result_id}?type=submission_files'
+            self.download_file(cont, url, 'student.zip')
+        else:
+            logger.info('Using prefetched student code')
+            self._copy_into_container(
+                cont, prefetched,
+                f'{_get_home_dir(CODEGRADE_USER)}/student.zip'
+            )
 
         cont.run_command(
             [
@@ -1942,48 +3223,71 @@ class AutoTestRunner:
         result_id: int,
         test_suite: SuiteInstructions,
     ) -> None:
-        has_files = False
-
-        def stdout_callback(output: bytes) -> None:
-            nonlocal has_files
-            if output:
-                has_files = True
-
-        cont.run_command(
-            ['find', cont.output_dir, '-type', 'f'],
-            stdout=stdout_callback,
-        )
-        if not has_files:
-            return
-
         with tempfile.NamedTemporaryFile() as tfile:
             os.chmod(tfile.name, 0o622)
             cont.run_command(
-                ['tar', 'cjf', '/dev/stdout', cont.output_dir],
+                ['tar', 'cf', '/dev/stdout', '-C', cont.output_dir, '.'],
                 user=CODEGRADE_USER,
                 stdout=tfile.name
             )
             tfile.seek(0, 0)
 
-            suite_id = test_suite['id']
-            base = self.base_url
-            url = f'{base}/results/{result_id}/suites/{suite_id}/files/'
-            response = self.req.post(
-                url,
-                files={
-                    'file': ('f.tar.bz2', tfile, 'application/octet-stream'),
-                },
-            )
-            logger.info(
-                'Uploaded files to server',
-                response=response,
-                response_content=response.content
-            )
+            with tarfile.open(fileobj=tfile, mode='r:') as tar:
+                output_files = _get_output_files(tar)
+                if not output_files:
+                    return
+
+                suite_id = test_suite['id']
+                base = self.base_url
+                url = f'{base}/results/{result_id}/suites/{suite_id}/files/'
+                all_digests = {f.digest for f in output_files}
+
+                response = self.req.post(
+                    f'{url}missing_blobs/',
+                    json={'digests': list(all_digests)},
+                    timeout=_REQUEST_TIMEOUT,
+                )
+                if response.ok:
+                    missing = set(response.json()['missing'])
+                else:
+                    missing = all_digests
+
+                while True:
+                    with tempfile.TemporaryFile() as upload:
+                        _write_output_archive(
+                            upload, tar, output_files, missing
+                        )
+                        upload.seek(0, 0)
+                        response = self.req.put(
+                            f'{url}tree/',
+                            data=upload,
+                            headers={'Content-Type': 'application/gzip'},
+                        )
+
+                    logger.info(
+                        'Uploaded files to server',
+                        response=response,
+                        response_content=response.content,
+                        amount_of_files=len(output_files),
+                        amount_uploaded=len(missing),
+                    )
+                    # Files that were stored on the server might have been
+                    # deleted in the meantime, in that case we simply upload
+                    # everything.
+                    if response.ok or missing == all_digests:
+                        break
+                    missing = all_digests
 
     @timed_function
     def _run_test_suite(
-        self, student_container: StartedContainer, result_id: int,
-        test_suite: SuiteInstructions, cpu_core: CpuCores.Core
+        self,
+        student_container: StartedContainer,
+        result_id: int,
+        test_suite: SuiteInstructions,
+        cpu_core: CpuCores.Core,
+        reporter: _ResultReporter,
+        *,
+        is_last_suite: bool = False,
     ) -> t.Tuple[float, float]:
         total_points = 0.0
         possible_points = 0.0
@@ -1998,56 +3302,30 @@ class AutoTestRunner:
             submission_info=test_suite.get('submission_info', False),
         )
 
-        step_result_id: t.Optional[int] = None
-
         def outer_update_test_result(
             state: models.AutoTestStepResultState,
             log: t.Dict[str, object],
             test_step: StepInstructions,
             attachment: t.Optional[t.IO[bytes]],
         ) -> None:
-            nonlocal step_result_id
-            data = {
-                'log': log,
-                'state': state.name,
-                'auto_test_step_id': test_step['id'],
-                'has_attachment': attachment is not None,
-            }
-            if step_result_id is not None:
-                data['id'] = step_result_id
-
-            logger.info('Posting result data', json=data, url=url)
-            if attachment is not None:
-                json_data = io.StringIO()
-                json.dump(data, json_data)
-                json_data.seek(0, 0)
-
-                response = self.req.put(
-                    url,
-                    files={
-                        'attachment': attachment,
-                        'json': json_data,
-                    },
-                    timeout=_REQUEST_TIMEOUT,
-                )
+            if attachment is None:
+                reporter.update_step_result(test_step['id'], state, log)
             else:
-                response = self.req.put(
-                    url,
-                    json=data,
-                    timeout=_REQUEST_TIMEOUT,
+                reporter.update_step_result_with_attachment(
+                    test_step['id'], state, log, attachment
                 )
-            logger.info('Posted result data', response=response)
-            response.raise_for_status()
-            step_result_id = response.json()['id']
-
-        with student_container.as_snapshot(
-            test_suite['network_disabled']
-        ) as snap, snap.extra_env(extra_env):
-            url = f'{self.base_url}/results/{result_id}/step_results/'
 
+        # The state of the container after the last suite is never used, so
+        # we don't need to restore it.
+        with reporter.timings.timed_context(
+            'snapshot',
+            student_container.as_snapshot(
+                test_suite['network_disabled'],
+                restore=not is_last_suite,
+            ),
+        ) as snap, snap.extra_env(extra_env), cpu_core.measured_usage(snap):
             for idx, test_step in enumerate(test_suite['steps']):
                 logger.info('Running step', step=test_step)
-                step_result_id = None
 
                 def update_test_result(
                     state: models.AutoTestStepResultState,
@@ -2102,8 +3380,18 @@ class AutoTestRunner:
                         logger.info('Finished step', total_points=total_points)
                     finally:
                         possible_points += test_step['weight']
+                        reporter.timings.add_step(
+                            test_step['id'], get_step_time()
+                        )
 
-            self._upload_output_folder(snap, result_id, test_suite)
+            # Make sure the results of all steps are stored before the suite
+            # is finished. The time spent sending is already added to the
+            # ``reporting`` phase, so only the time we are blocked is added
+            # here.
+            with reporter.timings.timed('reporting_wait'):
+                reporter.flush()
+            with reporter.timings.timed('upload_output'):
+                self._upload_output_folder(snap, result_id, test_suite)
 
         return total_points, possible_points
 
@@ -2152,15 +3440,16 @@ class AutoTestRunner:
         cont: StartedContainer,
         cpu: CpuCores.Core,
         result_id: int,
+        reporter: _ResultReporter,
     ) -> bool:
         # TODO: Split this function
-        result_url = f'{self.base_url}/results/{result_id}'
-
         result_state: t.Optional[models.AutoTestStepResultState]
         result_state = models.AutoTestStepResultState.passed
 
+        timings = reporter.timings
+
         try:
-            with timed_code('set_cgroup_limits'):
+            with timed_code('set_cgroup_limits'), timings.timed('cgroups'):
                 cont.set_cgroup_item(
                     'memory.limit_in_bytes',
                     self.config['AUTO_TEST_MEMORY_LIMIT']
@@ -2171,10 +3460,14 @@ class AutoTestRunner:
                     self.config['AUTO_TEST_MEMORY_LIMIT']
                 )
 
-            self.download_student_code(cont, result_id)
+            with timings.timed('download_code'):
+                self.download_student_code(cont, result_id)
 
             cont.move_fixtures_dir(uuid.uuid4().hex)
-            self._maybe_run_setup(cont, self.setup_script, result_url)
+            with timings.timed('setup'):
+                self._maybe_run_setup(
+                    cont, self.setup_script, reporter.update_result
+                )
 
             logger.info('Dropping sudo rights')
             cont.run_command(['deluser', CODEGRADE_USER, 'sudo'])
@@ -2204,11 +3497,20 @@ class AutoTestRunner:
             total_points = 0.0
             possible_points = 0.0
 
-            for test_set in self.instructions['sets']:
+            sets = self.instructions['sets']
+            for test_set in sets:
                 for test_suite in test_set['suites']:
                     cont.move_fixtures_dir(uuid.uuid4().hex)
                     achieved_points, suite_points = self._run_test_suite(
-                        cont, result_id, test_suite, cpu
+                        cont,
+                        result_id,
+                        test_suite,
+                        cpu,
+                        reporter,
+                        is_last_suite=(
+                            test_set is sets[-1] and
+                            test_suite is test_set['suites'][-1]
+                        ),
                     )
                     total_points += achieved_points
                     possible_points += suite_points
@@ -2257,11 +3559,30 @@ class AutoTestRunner:
             return True
         finally:
             if result_state is not None:
-                self.req.patch(
-                    result_url,
-                    json={'state': result_state.name},
-                    timeout=_REQUEST_TIMEOUT,
-                )
+                try:
+                    # Wait until all other updates are sent, so that the time
+                    # spent sending them is included in the timings.
+                    with timings.timed('reporting_wait'):
+                        reporter.flush()
+                    reporter.update_result(
+                        {
+                            'state': result_state.name,
+                            'timings': timings.to_json(),
+                        }
+                    )
+                    reporter.flush()
+                except NETWORK_EXCEPTIONS as e:
+                    # Raising here would replace the result of this function
+                    # (or the exception that is being raised).
+                    if self._is_old_submission_error(e):
+                        logger.warning(
+                            'Was running old submission', exc_info=True
+                        )
+                    else:
+                        logger.warning(
+                            'HTTP error while reporting the result',
+                            exc_info=True,
+                        )
 
     def run_student(
         self, base_container_name: str, cpu_cores: CpuCores,
@@ -2276,7 +3597,13 @@ class AutoTestRunner:
         :returns: Nothing.
         """
         base_container = AutoTestContainer(base_container_name, self.config)
-        student_container = base_container.clone()
+        # The base container already contains the fixtures and the output of
+        # the run setup script, so a thin writable layer on top of it is
+        # enough for a single student.
+        clone_start = time.monotonic()
+        student_container = base_container.clone(
+            snapshot=self.config['AUTO_TEST_SNAPSHOT_CLONES']
+        )
 
         def retry_work(work: cg_worker_pool.Work) -> None:
             try:
@@ -2294,21 +3621,27 @@ class AutoTestRunner:
                 opts.retry_work(work)
 
         with student_container.started_container() as cont:
+            clone_time: t.Optional[float] = time.monotonic() - clone_start
             while True:
                 work = opts.get_work()
                 if work is None:
                     return
                 result_id = work.result_id
+                timings = _StudentTimings()
+                if clone_time is not None:
+                    timings.add('clone_container', clone_time)
+                    clone_time = None
 
                 with cpu_cores.reserved_core() as cpu:
-                    patch_res = self.req.patch(
-                        f'{self.base_url}/results/{result_id}',
-                        json={
-                            'state':
-                                models.AutoTestStepResultState.running.name
-                        },
-                        timeout=_REQUEST_TIMEOUT,
-                    )
+                    with timings.timed('reporting'):
+                        patch_res = self.req.patch(
+                            f'{self.base_url}/results/{result_id}',
+                            json={
+                                'state':
+                                    models.AutoTestStepResultState.running.name
+                            },
+                            timeout=_REQUEST_TIMEOUT,
+                        )
 
                     try:
                         patch_res.raise_for_status()
@@ -2322,8 +3655,14 @@ class AutoTestRunner:
                     if patch_res.json()['taken']:
                         opts.mark_work_as_finished(work)
                     else:
-                        with cg_logger.bound_to_logger(result_id=result_id):
-                            if self._run_student(cont, cpu, result_id):
+                        with cg_logger.bound_to_logger(
+                            result_id=result_id
+                        ), _ResultReporter(
+                            self, result_id, timings
+                        ).started() as reporter:
+                            if self._run_student(
+                                cont, cpu, result_id, reporter
+                            ):
                                 opts.mark_work_as_finished(work)
                             else:
                                 # Student didn't finish correctly. So put back
@@ -2401,7 +3740,10 @@ class AutoTestRunner:
 
     def _started_heartbeat(self) -> 'RepeatedTimer':
         def push_heartbeat() -> None:
-            if not _STOP_RUNNING.is_set():
+            # Sending updates of results also counts as a heartbeat, so there
+            # is no need to send one if that happened recently.
+            last_report = time.monotonic() - _LAST_REPORT_TIME.value
+            if not _STOP_RUNNING.is_set() and last_report >= interval:
                 self.req.post(
                     f'{self.base_url}/runs/{self.instructions["run_id"]}/'
                     'heartbeats/',
@@ -2441,21 +3783,19 @@ class AutoTestRunner:
         self,
         cont: 'StartedContainer',
         cmd: str,
-        url: str,
+        update_result: t.Callable[[t.Dict[str, object]], None],
         cwd: str = None,
     ) -> None:
         if cmd:
             with timed_code('run_setup_script', setup_cmd=cmd):
                 res = cont.run_student_command(cmd, 900, cwd=cwd)
 
-            self.req.patch(
-                url,
-                json={
+            update_result(
+                {
                     'setup_time_spend': res.time_spend,
                     'setup_stdout': res.stdout,
                     'setup_stderr': res.stderr
-                },
-                timeout=_REQUEST_TIMEOUT,
+                }
             )
 
     def _run_test(self, cont: StartedContainer) -> None:
@@ -2493,12 +3833,21 @@ class AutoTestRunner:
             cont.run_command(['grep', CODEGRADE_USER, '/etc/sudoers'])
 
         with timed_code('download_fixtures'):
+            if self._cache is not None:
+                self._cache.remove_old_files()
             self.download_fixtures(cont)
 
+        def update_run(data: t.Dict[str, object]) -> None:
+            self.req.patch(
+                f'{self.base_url}/runs/{self.instructions["run_id"]}',
+                json=data,
+                timeout=_REQUEST_TIMEOUT,
+            )
+
         self._maybe_run_setup(
             cont,
             self.instructions['run_setup_script'],
-            f'{self.base_url}/runs/{self.instructions["run_id"]}',
+            update_run,
             cwd=f'{FIXTURES_ROOT}/{PRE_STUDENT_FIXTURES_DIR}',
         )
 
@@ -2507,8 +3856,12 @@ class AutoTestRunner:
         ), _Manager() as manager:
             # Known issue from typeshed:
             # https://github.com/python/typeshed/issues/3018
-            cpu_cores: CpuCores = CpuCores(manager)  # type: ignore
+            cpu_cores: CpuCores = CpuCores(
+                manager,  # type: ignore
+                max_per_core=self.config['AUTO_TEST_MAX_CONTAINERS_PER_CORE'],
+            )
             pool = self._make_worker_pool(base_container.name, cpu_cores)
+            self._prefetch_submissions(self.work)
 
             try:
                 pool.start(self._work_producer)
@@ -2519,3 +3872,9 @@ class AutoTestRunner:
                 logger.info('Done with containers, cleaning up')
             finally:
                 _STOP_RUNNING.set()
+                logger.info(
+                    'Core utilisation of run',
+                    core_utilisation=cpu_cores.get_utilisation(),
+                )
+                if self._cache is not None:
+                    self._cache.clear_submissions(self.instructions['run_id'])
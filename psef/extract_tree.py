@@ -2,7 +2,6 @@
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
-import os
 import abc
 import typing as t
 import dataclasses
@@ -101,7 +100,7 @@ class ExtractFileTreeFile(ExtractFileTreeBase):
         super().delete(base_dir)
         path = psef.files.safe_join(base_dir, self.disk_name)
         assert path.startswith(base_dir)
-        os.unlink(path)
+        psef.files.remove_stored_file(path)
 
     @property
     def is_dir(self) -> bool:
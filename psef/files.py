@@ -9,12 +9,16 @@ import os
 import re
 import sys
 import copy
+import enum
 import uuid
+import fcntl
 import shutil
 import typing as t
+import hashlib
 import tarfile
 import zipfile
 import tempfile
+import contextlib
 import dataclasses
 from collections import defaultdict
 
@@ -79,6 +83,24 @@ SPECIAL_FILENAMES = {
     *SPECIAL_FILES,
 }
 
+# The directory, relative to the ``UPLOAD_DIR``, in which the content addressed
+# blobs are stored. See :func:`store_file`.
+_BLOB_DIR = '.blobs'
+
+# The directory, relative to the ``UPLOAD_DIR``, in which temporary trees are
+# restored, see :func:`restore_temp_dir`.
+_RESTORE_DIR = '.restore'
+
+# The suffix of the lock files of the directories in ``_RESTORE_DIR``.
+_RESTORE_LOCK_SUFFIX = '.lock'
+
+# The mode of stored files. Their contents might be shared with other stored
+# files and with restored trees, so they should never be written to.
+_STORED_FILE_MODE = 0o444
+
+# The ``ioctl`` request to create a reflink of a file, from ``linux/fs.h``.
+_FICLONE = 0x40049409
+
 
 def init_app(_: t.Any) -> None:
     pass
@@ -312,8 +334,11 @@ def get_file_contents(code: models.FileMixin[T]) -> bytes:
         return codefile.read()
 
 
-def search_path_in_filetree(filetree: FileTree[T], path: str) -> T:
-    """Search for a path in a filetree.
+def build_filetree_index(filetree: FileTree[T]) -> t.Dict[str, T]:
+    """Build an index from path to file id for the given filetree.
+
+    Building the index is linear in the size of the tree, after which a path
+    can be looked up in constant time with :func:`search_filetree_index`.
 
     >>> def to_ftree(dct):
     ...    entries = None
@@ -345,39 +370,182 @@ def search_path_in_filetree(filetree: FileTree[T], path: str) -> T:
     ...    ],
     ... }
     ...
-    >>> filetree = to_ftree(filetree)
-    >>> search_path_in_filetree(filetree, "file1.txt")
+    >>> index = build_filetree_index(to_ftree(filetree))
+    >>> sorted(index)
+    ['', 'file1.txt', 'subdir', 'subdir/file2.txt', 'subdir/file3.txt']
+    >>> index['subdir/file2.txt']
+    4
+
+    :param filetree: The filetree to index.
+    :returns: A mapping from the path of each file, relative to the given
+        tree, to its id.
+    """
+    res = {'': filetree.id}
+
+    def __add(tree: FileTree[T], prefix: str) -> None:
+        for entry in tree.entries or []:
+            path = f'{prefix}{entry.name}'
+            # Just like a search in the tree the first entry with a given name
+            # should win.
+            res.setdefault(path, entry.id)
+            if entry.entries is not None:
+                __add(entry, f'{path}/')
+
+    __add(filetree, '')
+    return res
+
+
+def search_filetree_index(index: t.Mapping[str, T], path: str) -> T:
+    """Search for a path in a filetree index.
+
+    >>> index = {'': 1, 'file1.txt': 2, 'subdir': 3, 'subdir/file2.txt': 4}
+    >>> search_filetree_index(index, "file1.txt")
     2
-    >>> search_path_in_filetree(filetree, "/subdir/")
+    >>> search_filetree_index(index, "/subdir/")
     3
-    >>> search_path_in_filetree(filetree, "/subdir//file2.txt")
+    >>> search_filetree_index(index, "/subdir//file2.txt")
     4
-    >>> search_path_in_filetree(filetree, "Non existing/path")
+    >>> search_filetree_index(index, "Non existing/path")
     Traceback (most recent call last):
     ...
     KeyError: 'Path (Non existing/path) not in tree'
 
-    :param filetree: The filetree to search.
+    :param index: The index to search, as created by
+        :func:`build_filetree_index`.
     :param path: The path the search for.
     :returns: The id of the file associated with the path in the filetree.
     """
-    cur = filetree
-    for part in path.split('/'):
-        if not part:
+    key = '/'.join(part for part in path.split('/') if part)
+    if key not in index:
+        raise KeyError(f'Path ({path}) not in tree')
+    return index[key]
+
+
+@enum.unique
+class RestoreMode(enum.Enum):
+    """How files should be restored by :func:`restore_directory_structure`.
+
+    :param copy: Every file is copied, the resulting tree can be modified.
+    :param link: Every file is hard linked (or reflinked if that is not
+        possible) to the stored file, and only copied when both are not
+        possible. The restored files are read-only, as they share their
+        contents with the stored files. Restore the tree in a directory given
+        by :func:`restore_temp_dir` to make sure linking is possible.
+    """
+    copy = enum.auto()
+    link = enum.auto()
+
+
+@contextlib.contextmanager
+def restore_temp_dir() -> t.Iterator[str]:
+    """Get a temporary directory to restore files in.
+
+    The directory is located in the upload directory, so files can be restored
+    into it with :attr:`RestoreMode.link`. Next to the directory a lock file
+    is kept, which is locked for as long as the directory is in use, see
+    :func:`remove_stale_restore_dirs`.
+
+    :returns: A context manager that yields the path of the directory.
+    """
+    root = safe_join(app.config['UPLOAD_DIR'], _RESTORE_DIR)
+    os.makedirs(root, exist_ok=True)
+
+    # The lock file is locked before it gets its final name, so that it can
+    # never be taken by :func:`remove_stale_restore_dirs` while in use.
+    fd, tmp_lock = tempfile.mkstemp(dir=root, prefix='.')
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        path = tempfile.mkdtemp(dir=root)
+        lock = f'{path}{_RESTORE_LOCK_SUFFIX}'
+        os.rename(tmp_lock, lock)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            os.unlink(lock)
+    except:
+        if os.path.lexists(tmp_lock):
+            os.unlink(tmp_lock)
+        raise
+    finally:
+        os.close(fd)
+
+
+def remove_stale_restore_dirs() -> int:
+    """Remove all directories created by :func:`restore_temp_dir` that are
+    not used anymore.
+
+    These directories are normally removed when they are no longer used, but
+    are left behind when a process is killed. As they contain hard links to
+    stored files they would otherwise prevent blobs from being collected by
+    :func:`collect_orphaned_blobs`. A directory is not used anymore when its
+    lock file is not locked, as the lock is released by the operating system
+    when the process that holds it exits.
+
+    :returns: The amount of directories removed.
+    """
+    root = safe_join(app.config['UPLOAD_DIR'], _RESTORE_DIR)
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    for entry in os.scandir(root):
+        if not entry.name.endswith(_RESTORE_LOCK_SUFFIX):
             continue
-        for entry in (cur.entries or []):
-            if entry.name == part:
-                cur = entry
-                break
-        else:
-            raise KeyError(f'Path ({path}) not in tree')
-    return cur.id
+
+        try:
+            fd = os.open(entry.path, os.O_RDWR)
+        except FileNotFoundError:
+            # The directory was removed by its owner in the meantime.
+            continue
+
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            if not os.path.lexists(entry.path):
+                # The owner removed the directory just before we got the lock.
+                continue
+            path = entry.path[:-len(_RESTORE_LOCK_SUFFIX)]
+            shutil.rmtree(path, ignore_errors=True)
+            os.unlink(entry.path)
+            removed += 1
+        finally:
+            os.close(fd)
+    return removed
+
+
+def _reflink_file(src: str, dst: str) -> None:
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+
+
+def _link_file(src: str, dst: str) -> None:
+    # Restoring by copying overwrites existing files, so we should do the same.
+    if os.path.lexists(dst):
+        os.unlink(dst)
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Probably a different filesystem, try a reflink so that we at least
+        # don't have to copy the data.
+        try:
+            _reflink_file(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst, follow_symlinks=False)
+    # A hard link shares its mode with the stored file, which should already
+    # be read-only (see :func:`store_file`), but files stored by older
+    # versions might not be.
+    os.chmod(dst, _STORED_FILE_MODE)
 
 
 def restore_directory_structure(
     work: models.Work,
     parent: str,
-    exclude: models.FileOwner = models.FileOwner.teacher
+    exclude: models.FileOwner = models.FileOwner.teacher,
+    mode: RestoreMode = RestoreMode.copy,
 ) -> FileTree[int]:
     """Restores the directory structure recursively for a submission
     (a :class:`.models.Work`).
@@ -414,43 +582,232 @@ def restore_directory_structure(
     :param work: A submissions.
     :param parent: Path to parent directory.
     :param exclude: The file owner to exclude.
+    :param mode: How the files should be restored.
     :returns: A tree as described.
     """
-    code = helpers.filter_single_or_404(
-        models.File,
-        models.File.work_id == work.id,
-        models.File.parent_id.is_(None),
-        models.File.fileowner != exclude,
-        ~models.File.self_deleted,
-    )
-    cache = work.get_file_children_mapping(exclude)
-    return _restore_directory_structure(code, parent, cache)
+    return RestorePlan.from_work(work, exclude).execute(parent, mode)
+
+
+@dataclasses.dataclass(frozen=True)
+class RestorePlan(t.Generic[T]):
+    """A plan to restore the files of a submission to disk.
+
+    A plan can be executed without access to the database or the application,
+    so it can be executed in another thread.
+
+    :ivar tree: The tree that will be restored, as described in
+        :py:func:`.restore_directory_structure`.
+    :ivar entries: The files and directories to restore, as tuples of their
+        path and the path of their contents on disk, which is ``None`` for
+        directories. Directories always precede their children.
+    """
+    tree: FileTree[T]
+    entries: t.Sequence[t.Tuple[str, t.Optional[str]]]
+
+    @classmethod
+    def from_work(
+        cls,
+        work: models.Work,
+        exclude: models.FileOwner = models.FileOwner.teacher,
+    ) -> 'RestorePlan[int]':
+        """Create a plan to restore the given submission.
+
+        :param work: The submission to restore.
+        :param exclude: The file owner to exclude.
+        :returns: The created plan.
+        """
+        code = helpers.filter_single_or_404(
+            models.File,
+            models.File.work_id == work.id,
+            models.File.parent_id.is_(None),
+            models.File.fileowner != exclude,
+            ~models.File.self_deleted,
+        )
+        cache = work.get_file_children_mapping(exclude)
+        return RestorePlan.from_tree(code, cache)
+
+    @classmethod
+    def from_tree(
+        cls,
+        code: models.FileMixin[T],
+        cache: t.Mapping[t.Optional[T], t.Sequence[models.FileMixin[T]]],
+    ) -> 'RestorePlan[T]':
+        """Create a plan to restore the given file tree.
+
+        :param code: The top file of the tree.
+        :param cache: The cache to use to get file children, see
+            :meth:`.models.Work.get_file_children_mapping`.
+        :returns: The created plan.
+        """
+        entries: t.List[t.Tuple[str, t.Optional[str]]] = []
+
+        def __add(code: models.FileMixin[T], parent: str) -> FileTree[T]:
+            path = f'{parent}{code.name}'
+            if code.is_directory:
+                entries.append((path, None))
+                subtree = [
+                    __add(child, f'{path}/') for child in cache[code.get_id()]
+                ]
+                return FileTree(
+                    name=code.name, id=code.get_id(), entries=subtree
+                )
+            else:
+                entries.append((path, code.get_diskname()))
+                return FileTree(name=code.name, id=code.get_id(), entries=None)
+
+        tree = __add(code, '')
+        return RestorePlan(tree=tree, entries=entries)
+
+    def execute(
+        self,
+        parent: str,
+        mode: RestoreMode = RestoreMode.copy,
+    ) -> FileTree[T]:
+        """Restore the files of this plan.
+
+        :param parent: Path to parent directory.
+        :param mode: How the files should be restored.
+        :returns: The restored tree.
+        """
+        for path, disk_path in self.entries:
+            out = safe_join(parent, path)
+            if disk_path is None:
+                os.mkdir(out)
+            elif mode == RestoreMode.link:
+                _link_file(disk_path, out)
+            else:
+                shutil.copyfile(disk_path, out, follow_symlinks=False)
+        return self.tree
 
+    def get_entries_with_ids(
+        self
+    ) -> t.Iterator[t.Tuple[T, str, t.Optional[str]]]:
+        """Get the entries of this plan together with the ids of their files.
+
+        :returns: An iterator of tuples of the id of the file, its path and the
+            path of its contents on disk, as described for ``entries``.
+        """
+
+        def __get_ids(tree: FileTree[T]) -> t.Iterator[T]:
+            yield tree.id
+            for child in tree.entries or []:
+                yield from __get_ids(child)
+
+        for file_id, (path, disk_path) in zip(
+            __get_ids(self.tree), self.entries
+        ):
+            yield file_id, path, disk_path
+
+    def get_fingerprint(self) -> str:
+        """Get a fingerprint of the files of this plan.
+
+        The fingerprint changes when a file is added, removed, renamed or
+        changed, so it can be used to detect that a submission changed after
+        it was last restored. The contents of the files are not read, instead
+        the inode, size and modification time of the stored files are used.
+        Stored files are never changed in place (see
+        :func:`replace_stored_file`), so a changed file always gets a new
+        inode. Moving the upload directory can change the fingerprint without
+        the files changing, which only causes unneeded work.
+
+        :returns: A hex digest of the ids, paths and stored files of all
+            files.
+        """
+        digest = hashlib.sha256()
+        for file_id, path, disk_path in self.get_entries_with_ids():
+            content = ''
+            if disk_path is not None:
+                stat = os.stat(disk_path)
+                content = f'{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}'
+            digest.update(f'{file_id}\0{path}\0{content}\0'.encode('utf8'))
+        return digest.hexdigest()
 
-def _restore_directory_structure(
+
+def walk_file_tree(
     code: models.FileMixin[T],
-    parent: str,
     cache: t.Mapping[t.Optional[T], t.Sequence[models.FileMixin[T]]],
-) -> FileTree[T]:
-    """Worker function for :py:func:`.restore_directory_structure`
-
-    :param code: A file
-    :param parent: Path to parent directory
-    :param cache: The cache to use to get file children.
-    :returns: A tree as described in :py:func:`.restore_directory_structure`
+    parent: str = '',
+) -> t.Iterator[t.Tuple[str, models.FileMixin[T]]]:
+    """Walk a file tree as stored in the database without restoring it.
+
+    :param code: The file to start walking from.
+    :param cache: The cache to use to get file children, see
+        :meth:`.models.Work.get_file_children_mapping`.
+    :param parent: The path to prefix all paths with.
+    :returns: An iterator of tuples with the path of a file (or directory, in
+        which case the path ends with a ``/``) and the file itself, where
+        parents are yielded before their children.
     """
-    out = safe_join(parent, code.name)
+    path = f'{parent}{code.name}'
     if code.is_directory:
-        os.mkdir(out)
+        yield f'{path}/', code
+        for child in cache[code.get_id()]:
+            yield from walk_file_tree(child, cache, f'{path}/')
+    else:
+        yield path, code
+
+
+class _ZipStream(io.RawIOBase):
+    """An unseekable stream that buffers everything written to it until it is
+    drained.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: t.List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: t.Any) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        """Get and remove everything that was written so far.
+        """
+        res = b''.join(self._chunks)
+        self._chunks = []
+        return res
+
+
+def stream_zip(entries: t.Iterable[t.Tuple[str, t.Optional[str]]]
+               ) -> t.Iterator[bytes]:
+    """Create a zip archive on the fly.
+
+    The archive is never stored completely, neither in memory nor on disk, so
+    this can be used to stream arbitrarily large archives.
+
+    :param entries: The entries of the archive as tuples of the name in the
+        archive and the path of the file on disk. Directories should have a
+        name ending with a ``/`` and ``None`` as path.
+    :returns: An iterator of the bytes of the archive.
+    """
+    stream = _ZipStream()
+
+    def __write() -> t.Iterator[bytes]:
+        with zipfile.ZipFile(
+            t.cast(t.IO[bytes], stream), 'w', compression=zipfile.ZIP_DEFLATED
+        ) as zipf:
+            for name, path in entries:
+                if path is None:
+                    zipf.writestr(name, b'')
+                    yield stream.drain()
+                    continue
+
+                info = zipfile.ZipInfo.from_file(path, name)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as src, zipf.open(
+                    info, 'w', force_zip64=True
+                ) as dst:
+                    for chunk in iter(lambda: src.read(1 << 16), b''):
+                        dst.write(chunk)
+                        yield stream.drain()
+                yield stream.drain()
+
+        yield stream.drain()
 
-        subtree: t.List[FileTree] = [
-            _restore_directory_structure(child, out, cache)
-            for child in cache[code.get_id()]
-        ]
-        return FileTree(name=code.name, id=code.get_id(), entries=subtree)
-    else:  # this is a file
-        shutil.copyfile(code.get_diskname(), out, follow_symlinks=False)
-        return FileTree(name=code.name, id=code.get_id(), entries=None)
+    return (chunk for chunk in __write() if chunk)
 
 
 def rename_directory_structure(
@@ -528,8 +885,7 @@ def rename_directory_structure(
                     )
                     break
 
-                new_name, filename = random_file_path()
-                shutil.move(path, new_name)
+                _, filename = store_file(path)
                 res.append(
                     ExtractFileTreeFile(
                         name=key,
@@ -688,6 +1044,205 @@ def random_file_path(use_mirror_dir: bool = False) -> t.Tuple[str, str]:
     return candidate, name
 
 
+def get_file_digest(path: str) -> str:
+    """Get the hex digest of the contents of the file at the given path.
+
+    :param path: The path of the file to hash.
+    :returns: The sha256 hex digest of the contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_blob_path(digest: str) -> str:
+    return safe_join(app.config['UPLOAD_DIR'], _BLOB_DIR, digest[:2], digest)
+
+
+def store_file(path: str) -> t.Tuple[str, str]:
+    """Move the file at the given path into the upload directory.
+
+    If deduplication is enabled the file is stored content addressed: every
+    stored file gets its own random name (so :meth:`.models.FileMixin.open`
+    keeps working as before), but this name is a hard link to a blob named
+    after the hash of the contents. If a blob with the same contents already
+    exists the given file is not moved at all, we simply create a new link to
+    the existing blob. The link count of the blob is its reference count, see
+    :func:`remove_stored_file` for the other side of this.
+
+    .. warning::
+
+        As the contents of stored files may be shared, stored files are
+        read-only and should never be written to in place, use
+        :func:`replace_stored_file` instead.
+
+    :param path: The file to store, it is removed after calling this function.
+    :returns: The path to the new file and the name of the file, just like
+        :func:`random_file_path`.
+    """
+    new_path, filename = random_file_path()
+    if not app.config['DEDUPLICATE_UPLOADS']:
+        shutil.move(path, new_path)
+        os.chmod(new_path, _STORED_FILE_MODE)
+        return new_path, filename
+
+    blob_path = _get_blob_path(get_file_digest(path))
+    try:
+        os.link(blob_path, new_path)
+    except OSError:
+        # The blob doesn't exist yet, or it has reached the maximum amount of
+        # links.
+        shutil.move(path, new_path)
+        os.chmod(new_path, _STORED_FILE_MODE)
+        try:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.link(new_path, blob_path)
+        except OSError:
+            # We don't care if another request created the same blob in the
+            # meantime, the file is simply not shared in that case.
+            logger.info('Could not create blob', exc_info=True)
+    else:
+        os.unlink(path)
+
+    return new_path, filename
+
+
+def link_blob(digest: str) -> t.Optional[t.Tuple[str, str]]:
+    """Store a new file with the contents of an existing blob.
+
+    This is the same as calling :func:`store_file` with a file with the given
+    contents, but without needing the contents.
+
+    :param digest: The sha256 hex digest of the contents of the file.
+    :returns: The path to the new file and the name of the file, just like
+        :func:`store_file`, or ``None`` if no blob with the given digest
+        exists.
+    """
+    if not app.config['DEDUPLICATE_UPLOADS'] or not re.fullmatch(
+        '[0-9a-f]{64}', digest
+    ):
+        return None
+
+    new_path, filename = random_file_path()
+    try:
+        os.link(_get_blob_path(digest), new_path)
+    except OSError:
+        return None
+    return new_path, filename
+
+
+def has_blob(digest: str) -> bool:
+    """Check if a blob with the given digest is stored.
+
+    :param digest: The sha256 hex digest of the contents of the blob.
+    :returns: ``True`` if the contents can be stored using
+        :func:`link_blob`.
+    """
+    return bool(
+        app.config['DEDUPLICATE_UPLOADS'] and
+        re.fullmatch('[0-9a-f]{64}', digest) and
+        os.path.isfile(_get_blob_path(digest))
+    )
+
+
+def copy_stored_file(src: str, dst: str) -> None:
+    """Copy a file in the upload directory to a new file.
+
+    If deduplication is enabled the new file will share its contents with the
+    given file, so nothing is copied.
+
+    :param src: The path of the file to copy.
+    :param dst: The path the copy should be stored, this path should be
+        generated by :func:`random_file_path`.
+    :returns: Nothing.
+    """
+    if app.config['DEDUPLICATE_UPLOADS']:
+        try:
+            os.link(src, dst)
+        except OSError:
+            pass
+        else:
+            return
+
+    shutil.copyfile(src, dst)
+    os.chmod(dst, _STORED_FILE_MODE)
+
+
+def replace_stored_file(path: str, data: bytes) -> None:
+    """Replace the contents of a file in the upload directory.
+
+    The file is not written to in place, as its contents might be shared with
+    other files (see :func:`store_file`). Instead the new contents are written
+    to a new file that atomically replaces the old one.
+
+    :param path: The path of the file to replace.
+    :param data: The new contents of the file.
+    :returns: Nothing.
+    """
+    tmp_path, _ = random_file_path()
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, _STORED_FILE_MODE)
+    os.replace(tmp_path, path)
+
+
+def remove_stored_file(path: str) -> None:
+    """Remove a file stored by :func:`store_file`.
+
+    If this file is the last reference to its blob, the blob is removed too.
+    Blobs that were not removed this way, for example because their last
+    reference was replaced by :func:`replace_stored_file`, are removed by
+    :func:`collect_orphaned_blobs`.
+
+    >>> remove_stored_file('NON_EXISTING') is None
+    True
+
+    :param path: The path of the file to remove.
+    :returns: Nothing.
+    """
+    try:
+        links = os.stat(path).st_nlink
+    except FileNotFoundError:
+        return
+
+    # If there are exactly two links the other link might be the blob, in
+    # which case we are its last user.
+    blob_path = _get_blob_path(get_file_digest(path)) if links == 2 else None
+    os.unlink(path)
+
+    if blob_path is not None:
+        _maybe_remove_blob(blob_path)
+
+
+def _maybe_remove_blob(blob_path: str) -> None:
+    # Removing a blob that got a new reference between the check and the
+    # unlink is not a problem: the new reference is a hard link so its
+    # contents are still there, they are only not shared anymore.
+    try:
+        if os.stat(blob_path).st_nlink == 1:
+            os.unlink(blob_path)
+    except FileNotFoundError:
+        pass
+
+
+def collect_orphaned_blobs() -> int:
+    """Remove all blobs that are not referenced by any stored file anymore.
+
+    :returns: The amount of blobs removed.
+    """
+    blob_root = safe_join(app.config['UPLOAD_DIR'], _BLOB_DIR)
+    removed = 0
+    for root, _, blobs in os.walk(blob_root):
+        for blob in blobs:
+            blob_path = os.path.join(root, blob)
+            if os.lstat(blob_path).st_nlink == 1:
+                _maybe_remove_blob(blob_path)
+                removed += 1
+    return removed
+
+
 def save_stream(stream: FileStorage) -> str:
     """Save the data from a stream to a new random filepath in the upload
     directory.
@@ -703,6 +1258,7 @@ def save_stream(stream: FileStorage) -> str:
         helpers.raise_file_too_big_exception(
             app.max_single_file_size, single_file=True
         )
+    _, filename = store_file(new_file_name)
     return filename
 
 
@@ -754,6 +1310,7 @@ def process_files(
             else:
                 new_file_name, filename = random_file_path()
                 file.save(new_file_name)
+                new_file_name, filename = store_file(new_file_name)
                 tree.add_child(
                     ExtractFileTreeFile(
                         name=file.filename,
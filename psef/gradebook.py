@@ -0,0 +1,298 @@
+"""
+This module contains the functionality to export the grades and feedback of
+the latest submissions in assignments.
+
+The rows of the gradebook are produced in batches, using a few queries per
+batch, so that gradebooks of large courses can be streamed to the client.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import io
+import csv
+import json
+import typing as t
+from collections import defaultdict
+
+import flask
+import structlog
+from sqlalchemy.orm import undefer
+from typing_extensions import TypedDict
+
+from . import models, helpers, current_user
+from .exceptions import APICodes, APIException
+from .models import db
+from .permissions import CoursePermission as CPerm
+
+logger = structlog.get_logger()
+
+# The amount of submissions for which the data is loaded at once.
+_BATCH_SIZE = 100
+
+
+class GradebookRow(TypedDict):
+    """A single row in the gradebook, which is the data of a single submission.
+    """
+    #: The id of the assignment of the submission.
+    assignment_id: int
+    #: The name of the assignment of the submission.
+    assignment_name: str
+    #: The id of the submission.
+    submission_id: int
+    #: The username of the author, for groups this is the name of the
+    #: virtual user of the group.
+    username: str
+    #: The name of the author.
+    name: str
+    #: The moment the submission was created, in ISO-8601 format.
+    created_at: str
+    #: The grade of the submission.
+    grade: t.Optional[float]
+    #: The amount of rubric points achieved.
+    rubric_points: t.Optional[float]
+    #: The selected rubric items, as ``row header: item header``.
+    rubric_items: t.List[str]
+    #: Does the submission have general feedback, ``None`` if the user
+    #: cannot see the feedback.
+    has_general_feedback: t.Optional[bool]
+    #: The amount of inline feedback replies, ``None`` if the user cannot see
+    #: the feedback.
+    inline_feedback: t.Optional[int]
+    #: The amount of linter comments, ``None`` if the user cannot see the
+    #: linter feedback.
+    linter_feedback: t.Optional[int]
+
+
+COLUMNS: t.Sequence[str] = list(GradebookRow.__annotations__)
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    # pylint: disable=unused-import
+    import werkzeug
+
+
+def _count_per_work(
+    query: 'models.MyQuery[t.Tuple[int, int]]'
+) -> t.Mapping[int, int]:
+    return defaultdict(int, query)
+
+
+def _get_rows_for_batch(
+    assignment: 'models.Assignment',
+    work_ids: t.List[int],
+    *,
+    include_feedback: bool,
+    include_linter_feedback: bool,
+) -> t.Iterator[GradebookRow]:
+    works = models.Work.query.filter(
+        models.Work.id.in_(work_ids),
+    ).options(undefer(models.Work.comment)).order_by(models.Work.id).all()
+
+    grades = dict(models.Work.get_grade_per_work(assignment, work_ids))
+
+    rubric_points: t.Dict[int, float] = {}
+    rubric_items: t.Dict[int, t.List[str]] = defaultdict(list)
+    for work_id, row_header, item_header, points in db.session.query(
+        models.WorkRubricItem.work_id,
+        models.RubricRow.header,
+        models.RubricItem.header,
+        models.WorkRubricItem.multiplier * models.RubricItem.points,
+    ).join(
+        models.RubricItem,
+        models.RubricItem.id == models.WorkRubricItem.rubricitem_id,
+    ).join(
+        models.RubricRow,
+        models.RubricRow.id == models.RubricItem.rubricrow_id,
+    ).filter(
+        models.WorkRubricItem.work_id.in_(work_ids),
+    ).order_by(
+        models.WorkRubricItem.work_id,
+        models.RubricRow.id,
+    ):
+        rubric_points[work_id] = rubric_points.get(work_id, 0) + points
+        rubric_items[work_id].append(f'{row_header}: {item_header}')
+
+    inline_counts: t.Mapping[int, int] = {}
+    if include_feedback:
+        inline_counts = _count_per_work(
+            db.session.query(
+                models.File.work_id,
+                db.func.count(models.CommentReply.id),
+            ).join(
+                models.CommentBase,
+                models.CommentBase.file_id == models.File.id,
+            ).join(
+                models.CommentReply,
+                models.CommentReply.comment_base_id == models.CommentBase.id,
+            ).filter(
+                models.File.work_id.in_(work_ids),
+                ~models.File.self_deleted,
+                ~models.CommentReply.deleted,
+            ).group_by(models.File.work_id)
+        )
+
+    linter_counts: t.Mapping[int, int] = {}
+    if include_linter_feedback:
+        linter_counts = _count_per_work(
+            db.session.query(
+                models.File.work_id,
+                db.func.count(models.LinterComment.id),
+            ).join(
+                models.LinterComment,
+                models.LinterComment.file_id == models.File.id,
+            ).filter(
+                models.File.work_id.in_(work_ids),
+            ).group_by(models.File.work_id)
+        )
+
+    for work in works:
+        yield {
+            'assignment_id': assignment.id,
+            'assignment_name': assignment.name,
+            'submission_id': work.id,
+            'username': work.user.username,
+            'name': work.user.name,
+            'created_at': work.created_at.isoformat(),
+            'grade': grades.get(work.id),
+            'rubric_points': rubric_points.get(work.id),
+            'rubric_items': rubric_items[work.id],
+            'has_general_feedback': (
+                bool(work.comment) if include_feedback else None
+            ),
+            'inline_feedback': (
+                inline_counts[work.id] if include_feedback else None
+            ),
+            'linter_feedback': (
+                linter_counts[work.id] if include_linter_feedback else None
+            ),
+        }
+
+
+def get_rows(assignments: t.Iterable['models.Assignment']
+             ) -> t.Iterator[GradebookRow]:
+    """Get the gradebook rows of the latest submissions in the given
+    assignments.
+
+    .. warning::
+
+        This function does not check if the current user may see the grades
+        of the submissions, this is the responsibility of the caller. Feedback
+        is only included if the current user may see it.
+
+    :param assignments: The assignments to get the rows for.
+    :returns: An iterator producing a row for every latest submission, ordered
+        by assignment and then by submission id.
+    """
+    for assignment in assignments:
+        course_id = assignment.course_id
+        include_feedback = assignment.is_done or current_user.has_permission(
+            CPerm.can_see_user_feedback_before_done, course_id
+        )
+        include_linter_feedback = (
+            assignment.is_done or current_user.has_permission(
+                CPerm.can_see_linter_feedback_before_done, course_id
+            )
+        )
+
+        # We only load the ids upfront, all other data is loaded in batches.
+        work_ids = [
+            work_id for work_id, in assignment.
+            get_from_latest_submissions(models.Work.id).order_by(models.Work.id)
+        ]
+        logger.info(
+            'Exporting gradebook',
+            assignment=assignment,
+            amount_of_submissions=len(work_ids),
+        )
+        for batch in helpers.chunkify(work_ids, _BATCH_SIZE):
+            yield from _get_rows_for_batch(
+                assignment,
+                batch,
+                include_feedback=include_feedback,
+                include_linter_feedback=include_linter_feedback,
+            )
+
+
+def _csv_value(value: object) -> object:
+    if value is None:
+        return ''
+    return value
+
+
+def to_csv(rows: t.Iterable[GradebookRow]) -> t.Iterator[bytes]:
+    """Serialize the given rows to CSV.
+
+    :param rows: The rows to serialize.
+    :returns: An iterator producing the CSV file, starting with a header.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def __flush() -> bytes:
+        res = buf.getvalue().encode('utf8')
+        buf.seek(0)
+        buf.truncate()
+        return res
+
+    writer.writerow(COLUMNS)
+    for batch in helpers.chunkify(rows, _BATCH_SIZE):
+        for row in batch:
+            writer.writerow(
+                [
+                    '; '.join(row['rubric_items'])
+                    if col == 'rubric_items' else _csv_value(row[col])
+                    for col in COLUMNS
+                ]
+            )
+        yield __flush()
+
+    rest = __flush()
+    if rest:
+        yield rest
+
+
+def to_ndjson(rows: t.Iterable[GradebookRow]) -> t.Iterator[bytes]:
+    """Serialize the given rows to newline delimited JSON.
+
+    :param rows: The rows to serialize.
+    :returns: An iterator producing a JSON object for every row on a separate
+        line.
+    """
+    for batch in helpers.chunkify(rows, _BATCH_SIZE):
+        yield ''.join(
+            json.dumps(row, separators=(',', ':')) + '\n' for row in batch
+        ).encode('utf8')
+
+
+def make_response(
+    assignments: t.Iterable['models.Assignment'],
+    name: str,
+) -> 'werkzeug.wrappers.Response':
+    """Create a response that streams the gradebook of the given assignments.
+
+    The format of the gradebook is determined by the ``format`` request
+    parameter, which should be ``csv`` (the default) or ``ndjson``.
+
+    :param assignments: The assignments to export.
+    :param name: The name of the exported file, without extension.
+    :returns: A response streaming the gradebook.
+
+    :raises APIException: If the requested format is not supported.
+        (INVALID_PARAM)
+    """
+    fmt = flask.request.args.get('format', 'csv')
+    rows = get_rows(assignments)
+
+    if fmt == 'csv':
+        return helpers.make_stream_response(
+            to_csv(rows), f'{name}.csv', mimetype='text/csv'
+        )
+    elif fmt == 'ndjson':
+        return helpers.make_stream_response(
+            to_ndjson(rows),
+            f'{name}.ndjson',
+            mimetype='application/x-ndjson',
+        )
+    raise APIException(
+        'The requested format is not supported',
+        f'The format "{fmt}" is not one of "csv" or "ndjson"',
+        APICodes.INVALID_PARAM, 400
+    )
@@ -1216,6 +1216,34 @@ def extended_requested() -> bool:
     return request_arg_true('extended')
 
 
+def make_stream_response(
+    chunks: t.Iterable[bytes],
+    filename: str,
+    mimetype: str = 'application/octet-stream',
+) -> 'werkzeug.wrappers.Response':
+    """Create a response that streams the given chunks as a download.
+
+    The chunks are produced while the response is being sent, within the
+    context of the current request, so the database can still be used to
+    produce them.
+
+    :param chunks: The data of the file that should be sent.
+    :param filename: The name the downloaded file should get.
+    :param mimetype: The mimetype of the file.
+    :returns: A response that can be returned from a route.
+    """
+    return flask.Response(
+        flask.stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': (
+                "attachment; filename*=UTF-8''"
+                f'{urllib.parse.quote(filename.replace("/", "_"))}'
+            ),
+        },
+    )
+
+
 @contextlib.contextmanager
 def defer(*functions: t.Callable[[], object]) -> t.Generator[None, None, None]:
     """Defer a function call to the end of the context manager.
@@ -12,6 +12,7 @@ import copy
 import enum
 import typing as t
 import os.path
+import functools
 from dataclasses import dataclass
 
 import structlog
@@ -155,7 +156,27 @@ class SubmissionFilter:
 
         return tree, changes
 
-    def _delete_file(self, cur: ExtractFileTreeBase) -> t.List[FileDeletion]:
+    def _get_file_checker(self, tree: ExtractFileTree
+                          ) -> t.Callable[[ExtractFileTreeBase], t.
+                                          Optional[FileDeletion]]:
+        """Get a function that checks if files of the given tree are allowed.
+
+        Subclasses can override this method to check the entire tree at once,
+        instead of checking every file separately.
+
+        :param tree: The tree of which files will be checked.
+        :returns: A function that behaves like
+            :meth:`.SubmissionFilter.file_allowed` for files in ``tree``.
+        """
+        # pylint: disable=unused-argument
+        return self.file_allowed
+
+    def _delete_file(
+        self,
+        cur: ExtractFileTreeBase,
+        file_allowed: t.Callable[[ExtractFileTreeBase], t.
+                                 Optional[FileDeletion]],
+    ) -> t.List[FileDeletion]:
         if cur.is_dir:
             tree = t.cast(ExtractFileTreeDirectory, cur)
             res: t.List[FileDeletion] = []
@@ -163,17 +184,17 @@ class SubmissionFilter:
             # Copy is needed here as we modify values by doing a `.delete` call
             # on one of the children.
             for child in copy.copy(tree.values):
-                res.extend(self._delete_file(child))
+                res.extend(self._delete_file(child, file_allowed))
 
             if not tree.values:
-                deleted_tree = self.file_allowed(tree)
+                deleted_tree = file_allowed(tree)
                 if deleted_tree is not None:
                     res.append(deleted_tree)
                     tree.delete(app.config['UPLOAD_DIR'])
 
             return res
         else:
-            deleted_file = self.file_allowed(cur)
+            deleted_file = file_allowed(cur)
             if deleted_file is None:
                 return []
             cur.delete(app.config['UPLOAD_DIR'])
@@ -202,10 +223,11 @@ class SubmissionFilter:
         total_changes.extend(removed_top_dirs)
 
         if handle_ignore != IgnoreHandling.keep:
+            file_allowed = self._get_file_checker(tree)
             # Copy is needed here as we modify values by doing a `.delete` call
             # on one of the children.
             for child in copy.copy(tree.values):
-                total_changes.extend(self._delete_file(child))
+                total_changes.extend(self._delete_file(child, file_allowed))
 
             tree, removed_top_dirs = self._remove_leading_directories(tree)
             total_changes.extend(removed_top_dirs)
@@ -258,6 +280,9 @@ class EmptySubmissionFilter(SubmissionFilter):
 class Pattern:
     """A single ignore pattern."""
 
+    #: The inline flags used by the regexes of all patterns.
+    REGEX_FLAGS = '(?ms)'
+
     def __init__(self, pattern: str, orig_line: str) -> None:
         self.pattern = pattern
         self.original_line = orig_line
@@ -269,7 +294,8 @@ class Pattern:
                 pattern = pattern[1:]
             self.is_exclude = True
         flags = 0
-        self._re = re.compile(self.translate(pattern), flags)
+        self.regex = self.translate_without_flags(pattern)
+        self._re = re.compile(self.REGEX_FLAGS + self.regex, flags)
 
     def match(self, path: str) -> bool:
         """Try to match a path against this ignore pattern.
@@ -324,12 +350,21 @@ class Pattern:
         """Translate a shell PATTERN to a regular expression.
 
         There is no way to quote meta-characters.
+        """
+        return cls.REGEX_FLAGS + cls.translate_without_flags(pat)
+
+    @classmethod
+    def translate_without_flags(cls, pat: str) -> str:
+        """Translate a shell PATTERN to a regular expression, without the
+        :attr:`.Pattern.REGEX_FLAGS`.
+
+        Inline flags are only allowed at the start of a regex, so this is
+        needed to combine multiple patterns into a single regex.
 
         Originally copied from fnmatch in Python 2.7, but modified for Dulwich
         to cope with features in Git ignore patterns.
         """
-
-        res = '(?ms)'
+        res = ''
 
         if '/' not in pat[:-1]:
             # If there's no slash, this is a filename-based match
@@ -358,6 +393,109 @@ class Pattern:
         return res + r'\Z'
 
 
+class CompiledIgnoreFilter:
+    """A set of :class:`.Pattern` merged into a single regex.
+
+    The patterns are combined in reverse order, so the alternative that
+    matches is always the last pattern of the set that matches, which is the
+    pattern that determines if a path is ignored.
+    """
+
+    def __init__(self, patterns: t.Sequence[Pattern]) -> None:
+        self._patterns = list(patterns)
+        self._re: t.Optional[t.Pattern[str]] = None
+
+        if self._patterns:
+            self._re = re.compile(
+                Pattern.REGEX_FLAGS + '|'.join(
+                    f'(?P<p{idx}>{pattern.regex})'
+                    for idx, pattern in reversed(list(enumerate(patterns)))
+                )
+            )
+
+    def last_match(self, path: str) -> t.Optional[Pattern]:
+        """Get the last pattern that matches the given path.
+
+        :param path: The path to match.
+        :returns: The last pattern that matches, or ``None`` if no pattern
+            matches.
+        """
+        if self._re is None:
+            return None
+
+        match = self._re.match(path)
+        if match is None:
+            return None
+
+        # The group of the alternative is always the last group that is
+        # closed, so it is the ``lastgroup`` even when the pattern of the
+        # alternative contains groups itself.
+        assert match.lastgroup is not None
+        return self._patterns[int(match.lastgroup[1:])]
+
+    def match_path(self, path: str) -> t.Optional[Pattern]:
+        """Get the pattern that determines if the given path is ignored.
+
+        This is the last pattern that matches the first directory leading up
+        to ``path`` (or ``path`` itself) that is matched by any pattern.
+
+        :param path: The path to check, directories should end with a ``/``.
+        :returns: The deciding pattern, or ``None`` if no pattern matches.
+        """
+        parts = path.split('/')
+
+        for i in range(len(parts) + 1):
+            relpath = '/'.join(parts[:i])
+
+            if i < len(parts):
+                # Paths leading up to the final part are all directories,
+                # so need a trailing slash.
+                relpath += '/'
+            match = self.last_match(relpath)
+            if match is not None:
+                return match
+        return None
+
+    def match_tree(self, tree: ExtractFileTreeDirectory
+                   ) -> t.Dict[int, Pattern]:
+        """Find the deciding pattern for every entry of the given tree.
+
+        This does a single traversal of the tree, only matching each
+        directory once instead of once for every file in it.
+
+        :param tree: The tree to match. The paths of entries are determined
+            relative to the root of this tree.
+        :returns: A mapping from the ``id`` of every entry for which a pattern
+            matched to the pattern that decides if this entry is ignored.
+        """
+        res: t.Dict[int, Pattern] = {}
+        todo: t.List[t.Tuple[str, t.Optional[Pattern],
+                             ExtractFileTreeBase]] = []
+        root_match = self.last_match('/')
+        todo.extend(('', root_match, child) for child in tree.values)
+
+        while todo:
+            path, match, cur = todo.pop()
+            parts = cur.name.replace('/', '\\/').split('/')
+
+            for idx, part in enumerate(parts):
+                path += part
+                if cur.is_dir or idx + 1 < len(parts):
+                    path += '/'
+                if match is None:
+                    match = self.last_match(path)
+
+            if match is not None:
+                res[id(cur)] = match
+            if cur.is_dir:
+                todo.extend(
+                    (path, match, child) for child in
+                    t.cast(ExtractFileTreeDirectory, cur).values
+                )
+
+        return res
+
+
 class IgnoreFilter:
     """A ignore filter. This filter consists of multiple :class:`.Filter`.
     """
@@ -366,12 +504,22 @@ class IgnoreFilter:
         self.original_input = patterns
 
         self._patterns: t.List[Pattern] = []
+        self._compiled: t.Optional[CompiledIgnoreFilter] = None
         for pattern, orig_line in self.read_ignore_patterns(patterns):
             self.append_pattern(pattern, orig_line)
 
     def append_pattern(self, pattern: str, orig_line: str) -> None:
         """Add a pattern to the set."""
         self._patterns.append(Pattern(pattern, orig_line))
+        self._compiled = None
+
+    @property
+    def compiled(self) -> CompiledIgnoreFilter:
+        """All patterns of this filter merged into a single regex.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledIgnoreFilter(self._patterns)
+        return self._compiled
 
     def find_matching(self, path: str) -> t.Iterable[Pattern]:
         """Yield all matching patterns for path.
@@ -412,6 +560,19 @@ class IgnoreFilter:
             yield line, original_line
 
 
+@functools.lru_cache(maxsize=128)
+def _parse_ignore_filter(lines: t.Tuple[str, ...]) -> IgnoreFilter:
+    """Parse the given lines of a cgignore file.
+
+    The result is cached, so the patterns of an assignment are only compiled
+    once, instead of every time its cgignore is used.
+
+    :param lines: The lines of the cgignore file.
+    :returns: The parsed filter, this filter should not be modified.
+    """
+    return IgnoreFilter(lines)
+
+
 @filter_handlers.register('IgnoreFilterManager')
 class IgnoreFilterManager(SubmissionFilter):
     """Ignore file manager."""
@@ -426,7 +587,7 @@ class IgnoreFilterManager(SubmissionFilter):
 
         if isinstance(global_filters, str):
             global_filters = global_filters.split('\n')
-        self._filter = IgnoreFilter(global_filters)
+        self._filter = _parse_ignore_filter(tuple(global_filters))
 
     @classmethod
     def parse(cls, data: 'helpers.JSONType') -> 'IgnoreFilterManager':
@@ -469,12 +630,31 @@ class IgnoreFilterManager(SubmissionFilter):
         :return: None if the file is not mentioned, True if it is included,
             False if it is explicitly excluded.
         """
-        matches = self.find_matching(path)
-        if matches:
-            return matches[-1].is_exclude, matches[-1].original_line
+        assert not os.path.isabs(path), f'File "{path}" is an absolute path'
+
+        match = self._filter.compiled.match_path(path)
+        if match is not None:
+            return match.is_exclude, match.original_line
 
         return None, None
 
+    def _get_file_checker(self, tree: ExtractFileTree
+                          ) -> t.Callable[[ExtractFileTreeBase], t.
+                                          Optional[FileDeletion]]:
+        matches = self._filter.compiled.match_tree(tree)
+
+        def file_allowed(f: ExtractFileTreeBase) -> t.Optional[FileDeletion]:
+            match = matches.get(id(f))
+            if match is None or not match.is_exclude:
+                return None
+            return FileDeletion(
+                deletion_type=DeletionType.denied_file,
+                deleted_file=f,
+                reason=match.original_line,
+            )
+
+        return file_allowed
+
     def file_allowed(self, f: ExtractFileTreeBase) -> t.Optional[FileDeletion]:
         """Check if the given file adheres to this validator.
 
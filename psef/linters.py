@@ -11,11 +11,15 @@ import abc
 import csv
 import json
 import uuid
+import shutil
 import typing as t
+import hashlib
 import tempfile
 import subprocess
+import dataclasses
 import xml.etree.ElementTree as ET
 from io import StringIO
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import structlog
 from defusedxml.ElementTree import fromstring as defused_xml_fromstring
@@ -31,6 +35,10 @@ T_LINTER = t.TypeVar('T_LINTER', bound='Linter')  # pylint: disable=invalid-name
 _NICE_LEVEL = 10
 
 ProcessCompletedCallback = t.Callable[[subprocess.CompletedProcess], None]
+LinterOutput = t.Dict[str, t.Dict[int, t.List[t.Tuple[str, str]]]]
+
+# The name of the directory in which all submissions of a batch are restored.
+_BATCH_DIR = 'submissions'
 
 
 def init_app(_: t.Any) -> None:
@@ -103,6 +111,15 @@ class Linter(abc.ABC):
     """
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {}
     RUN_LINTER: t.ClassVar[bool] = True
+    # Can this linter lint multiple submissions in a single run. If so the
+    # linter should check all files in the directory passed to ``run``
+    # recursively.
+    SUPPORTS_BATCHES: t.ClassVar[bool] = True
+    # Are the comments for a file only determined by the file itself and its
+    # path. If so the comments are cached (see
+    # :class:`.models.LinterResultCache`) and files that were linted before
+    # are not linted again.
+    CACHE_RESULTS: t.ClassVar[bool] = False
 
     def __init__(self, cfg: str) -> None:
         self.config = cfg
@@ -151,6 +168,9 @@ class Pylint(Linter):
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Empty config file': ''
     }
+    # Pylint can only lint a single python module, and a directory containing
+    # multiple submissions is not a module.
+    SUPPORTS_BATCHES: t.ClassVar[bool] = False
 
     def run(
         self,
@@ -206,6 +226,7 @@ class Flake8(Linter):
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Empty config file': ''
     }
+    CACHE_RESULTS: t.ClassVar[bool] = True
 
     def run(
         self,
@@ -502,6 +523,8 @@ class ESLint(Linter):
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Standard': _read_config_file('eslint', 'standard.json')
     }
+    # The results of ESLint are not cached, as rules of plugins (for example
+    # ``eslint-plugin-import``) can depend on other files in the submission.
 
     @classmethod
     def validate_config(cls: t.Type['ESLint'], config: str) -> None:
@@ -601,6 +624,32 @@ class ESLint(Linter):
                     emit(filename, line_number, code, msg)
 
 
+@dataclasses.dataclass
+class _RestoredInstance:
+    """A linter instance of which the submission has been restored to disk.
+    """
+    linter_instance: models.LinterInstance
+    tree_root: files.FileTree[int]
+    # The directory in which the submission was restored, the files of the
+    # submission are in the ``tree_root.name`` directory of this directory.
+    restore_dir: str
+    # The hashes of the restored files of which the results should be cached,
+    # by their path in the restored tree.
+    file_hashes: t.Dict[str, str] = dataclasses.field(default_factory=dict)
+    # The cached comments of the files that were not restored, by their path
+    # in the restored tree.
+    cached_output: LinterOutput = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class _LinterBatch:
+    """A set of linter instances that are linted in a single linter run.
+    """
+    instances: t.List[_RestoredInstance]
+    future: t.Optional['Future[LinterOutput]'] = None
+    proc: t.Optional[subprocess.CompletedProcess] = None
+
+
 class LinterRunner:
     """This class is used to run a :class:`Linter` with a specific config on
     sets of :class:`.models.Work`.
@@ -616,10 +665,27 @@ class LinterRunner:
         :param str cfg: The config as as `str` to pass to the linter.
         """
         self.linter = cls(cfg)
+        self.linter_name = cls.__name__
+        self.config_hash = models.LinterResultCache.hash_config(cfg)
 
     def run(self, linter_instance_ids: t.Sequence[str]) -> None:
         """Run this linter runner on the given works.
 
+        All submissions are restored into a single directory, and divided in
+        as many batches as there are cores. The linter is run once for every
+        batch, and these runs are done in parallel. If the linter cannot lint
+        multiple submissions at once (see :attr:`.Linter.SUPPORTS_BATCHES`)
+        every batch contains a single submission.
+
+        If the run for a batch fails, every submission in the batch is linted
+        separately, so that only the submissions causing the failure will be
+        marked as crashed.
+
+        If the results of the linter are cached (see
+        :attr:`.Linter.CACHE_RESULTS`) only files that were not linted before
+        with the same config are restored and linted, submissions for which
+        all files were linted before are not linted at all.
+
         .. note:: This method takes a long time to execute, please run it in a
                   thread.
 
@@ -629,92 +695,376 @@ class LinterRunner:
 
         :returns: Nothing
         """
-        for linter_instance_id in linter_instance_ids:
-            linter_inst = db.session.query(models.LinterInstance
-                                           ).get(linter_instance_id)
-
+        linter_insts = [
+            linter_inst for linter_inst in
+            db.session.query(models.LinterInstance).filter(
+                t.cast(models.DbColumn[str], models.LinterInstance.id).in_(
+                    list(linter_instance_ids)
+                )
+            )
             # This should never happen however it is better to check here.
-            if linter_inst is None or linter_inst.work.deleted:  # pragma: no cover
-                continue
+            if not linter_inst.work.deleted
+        ]
+        if not linter_insts:  # pragma: no cover
+            return
+
+        restorable = []
+        plans = []
+        for linter_inst in linter_insts:
+            try:
+                plan = files.RestorePlan.from_work(linter_inst.work)
+            # We want to catch all exceptions here, as a single broken
+            # submission should not prevent the others from being linted.
+            except Exception:  # pylint: disable=broad-except
+                self._set_restore_crashed(linter_inst)
+            else:
+                restorable.append(linter_inst)
+                plans.append(plan)
+
+        planned = []
+        for linter_inst, plan, (file_hashes, cached_output) in zip(
+            restorable, plans, self._get_cached_output(plans)
+        ):
+            if self.linter.CACHE_RESULTS and not file_hashes:
+                self._add_comments(linter_inst, plan.tree, '', cached_output)
+            else:
+                planned.append((linter_inst, plan, file_hashes, cached_output))
+        db.session.commit()
+
+        if not planned:
+            return
+
+        amount_workers = min(len(planned), os.cpu_count() or 1)
+        if self.linter.SUPPORTS_BATCHES:
+            batches = [
+                planned[i::amount_workers] for i in range(amount_workers)
+            ]
+        else:
+            batches = [[item] for item in planned]
+
+        with files.restore_temp_dir() as tmpdir, ThreadPoolExecutor(
+            max_workers=amount_workers
+        ) as pool:
+            todo = []
+            for idx, batch in enumerate(batches):
+                batch_dir = files.safe_join(tmpdir, str(idx))
+                restored = []
+                for linter_inst, plan, file_hashes, cached_output in batch:
+                    restore_dir = files.safe_join(
+                        batch_dir, _BATCH_DIR, linter_inst.id
+                    )
+                    os.makedirs(restore_dir)
+                    try:
+                        # Only restore the files that are not cached, but
+                        # always restore all directories.
+                        tree_root = dataclasses.replace(
+                            plan,
+                            entries=[
+                                (path, disk_path)
+                                for path, disk_path in plan.entries if
+                                disk_path is None or path not in cached_output
+                            ],
+                        ).execute(restore_dir, mode=files.RestoreMode.link)
+                    except Exception:  # pylint: disable=broad-except
+                        shutil.rmtree(restore_dir, ignore_errors=True)
+                        self._set_restore_crashed(linter_inst)
+                        continue
+                    restored.append(
+                        _RestoredInstance(
+                            linter_inst,
+                            tree_root,
+                            restore_dir,
+                            file_hashes=file_hashes,
+                            cached_output=cached_output,
+                        )
+                    )
+                if restored:
+                    todo.append(self._start_batch(pool, restored, batch_dir))
+            db.session.commit()
 
-            compl_proc: t.Optional[subprocess.CompletedProcess] = None
+            while todo:
+                todo.extend(self._finish_batch(todo.pop(0), pool, tmpdir))
 
-            def set_proc(proc: subprocess.CompletedProcess) -> None:
-                nonlocal compl_proc
-                compl_proc = proc
+    @staticmethod
+    def _set_restore_crashed(linter_inst: models.LinterInstance) -> None:
+        """Mark the given instance as crashed because its submission could not
+        be restored.
 
-            try:
-                self.test(linter_inst, set_proc)
-            # We want to catch all exceptions here as need to set our linter to
-            # the crashed state.
-            except LinterCrash as e:
+        This should be called while handling the exception raised while
+        restoring.
+
+        :param linter_inst: The instance that could not be restored.
+        :returns: Nothing.
+        """
+        logger.warning(
+            'Could not restore the submission',
+            linter_instance_id=linter_inst.id,
+            exc_info=True,
+        )
+        linter_inst.state = models.LinterState.crashed
+        linter_inst.error_summary = 'The submission could not be restored.'
+
+    def _get_cached_output(
+        self,
+        plans: t.Sequence[files.RestorePlan[int]],
+    ) -> t.List[t.Tuple[t.Dict[str, str], LinterOutput]]:
+        """Get the cached comments for the files of the given plans.
+
+        :param plans: The plans to restore the submissions that will be
+            linted.
+        :returns: For every plan a tuple of the hashes of the files that are
+            not cached, by their path, and the cached comments of the other
+            files, by their path. If the results of the linter are not cached
+            both mappings are empty.
+        """
+        if not self.linter.CACHE_RESULTS:
+            return [({}, {}) for _ in plans]
+
+        all_hashes = []
+        for plan in plans:
+            all_hashes.append(
+                {
+                    path: self._get_file_hash(path, disk_path)
+                    for path, disk_path in plan.entries
+                    if disk_path is not None
+                }
+            )
+
+        cache = models.LinterResultCache.get_results(
+            self.linter_name,
+            self.config_hash,
+            [h for hashes in all_hashes for h in hashes.values()],
+        )
+
+        res = []
+        for hashes in all_hashes:
+            uncached = {}
+            cached_output: LinterOutput = {}
+            for path, file_hash in hashes.items():
+                if file_hash not in cache:
+                    uncached[path] = file_hash
+                    continue
+                comments: t.Dict[int, t.List[t.Tuple[str, str]]] = {}
+                for line, code, msg in cache[file_hash]:
+                    comments.setdefault(line, []).append((code, msg))
+                cached_output[path] = comments
+            res.append((uncached, cached_output))
+        return res
+
+    @staticmethod
+    def _get_file_hash(path: str, disk_path: str) -> str:
+        """Get the hash of a file used as key for the cached results.
+
+        The path of the file in the submission is part of the hash, as linters
+        can be configured to report different errors for different paths.
+
+        :param path: The path of the file, including the top directory of the
+            submission, this directory is not part of the hash.
+        :param disk_path: The path of the contents of the file.
+        :returns: The hash of the file.
+        """
+        _, path_in_submission = path.split('/', 1)
+        content = files.get_file_digest(disk_path)
+        return hashlib.sha256(
+            f'{path_in_submission}\0{content}'.encode('utf8')
+        ).hexdigest()
+
+    def _start_batch(
+        self,
+        pool: ThreadPoolExecutor,
+        instances: t.List[_RestoredInstance],
+        batch_dir: str,
+    ) -> _LinterBatch:
+        """Start running the linter on the given instances in the given pool.
+
+        :param pool: The pool in which the linter should run.
+        :param instances: The restored instances to lint.
+        :param batch_dir: The directory containing the submissions of all
+            given ``instances``, this is not used if only one instance is
+            given.
+        :returns: The started batch.
+        """
+        if len(instances) == 1:
+            base_dir = instances[0].restore_dir
+            lint_dir = files.safe_join(base_dir, instances[0].tree_root.name)
+        else:
+            base_dir = batch_dir
+            lint_dir = files.safe_join(base_dir, _BATCH_DIR)
+
+        batch = _LinterBatch(instances=instances)
+
+        def set_proc(proc: subprocess.CompletedProcess) -> None:
+            batch.proc = proc
+
+        flask_app = app._get_current_object()  # pylint: disable=protected-access
+
+        def run_linter() -> LinterOutput:
+            with flask_app.app_context():
+                return self._lint(base_dir, lint_dir, set_proc)
+
+        batch.future = pool.submit(run_linter)
+        return batch
+
+    def _finish_batch(
+        self,
+        batch: _LinterBatch,
+        pool: ThreadPoolExecutor,
+        tmpdir: str,
+    ) -> t.List[_LinterBatch]:
+        """Wait for the given batch to finish, and store its results.
+
+        :param batch: The batch to finish.
+        :param pool: The pool to use to lint the instances of this batch
+            separately if linting the batch failed.
+        :param tmpdir: The directory in which all submissions were restored.
+        :returns: The batches that were started because this batch failed.
+        """
+        assert batch.future is not None
+        linter_inst = batch.instances[0].linter_instance
+
+        try:
+            output = batch.future.result()
+        # We want to catch all exceptions here as need to set our linter to
+        # the crashed state.
+        except Exception as e:  # pylint: disable=broad-except
+            if len(batch.instances) > 1:
+                logger.info(
+                    'Linting the batch failed, retrying separately',
+                    linter_instance_ids=[
+                        inst.linter_instance.id for inst in batch.instances
+                    ],
+                    exc_info=True,
+                )
+                return [
+                    self._start_batch(pool, [inst], tmpdir)
+                    for inst in batch.instances
+                ]
+
+            linter_inst.state = models.LinterState.crashed
+            if isinstance(e, LinterCrash):
                 logger.warning(
                     'The linter crashed',
                     linter_instance_id=linter_inst.id,
                     exc_info=True,
                 )
-                linter_inst.state = models.LinterState.crashed
                 linter_inst.error_summary = (
                     e.error_summary or
                     'The linter program exited unsuccessfully.'
                 )
-            except Exception:  # pylint: disable=broad-except
+            else:
                 logger.warning(
                     'The linter crashed unexpectedly',
                     linter_instance_id=linter_inst.id,
                     exc_info=True,
                 )
-                linter_inst.state = models.LinterState.crashed
-            finally:
-                if compl_proc is not None:
-                    linter_inst.stdout = compl_proc.stdout.replace('\0', '')
-                    linter_inst.stderr = compl_proc.stderr.replace('\0', '')
-                db.session.commit()
-
-    def test(
+        else:
+            for inst in batch.instances:
+                prefix = '' if len(batch.instances) == 1 else os.path.join(
+                    _BATCH_DIR, inst.linter_instance.id
+                )
+                for path, comments in inst.cached_output.items():
+                    output[os.path.join(prefix, path)] = comments
+                self._cache_results(inst, prefix, output)
+                self._add_comments(
+                    inst.linter_instance, inst.tree_root, prefix, output
+                )
+
+            meth = logger.warning if output else logger.info
+            meth('Finished adding linter comments', comments_left=output)
+
+        # The output of a batch contains the output for all submissions in
+        # this batch, which is stored for every one of them.
+        if batch.proc is not None:
+            for inst in batch.instances:
+                inst.linter_instance.stdout = batch.proc.stdout.replace(
+                    '\0', ''
+                )
+                inst.linter_instance.stderr = batch.proc.stderr.replace(
+                    '\0', ''
+                )
+        db.session.commit()
+        return []
+
+    def _cache_results(
         self,
-        linter_instance: models.LinterInstance,
-        process_completed: ProcessCompletedCallback,
+        inst: _RestoredInstance,
+        prefix: str,
+        output: LinterOutput,
     ) -> None:
-        """Test the given code (:class:`.models.Work`) and add generated
-        comments.
+        """Store the comments of the linted files of the given instance in
+        the cache.
+
+        :param inst: The instance of which the results should be cached.
+        :param prefix: The path of the directory in which the tree was
+            restored in ``output``.
+        :param output: The output of the linter.
+        :returns: Nothing.
+        """
+        if not inst.file_hashes:
+            return
+
+        models.LinterResultCache.add_results(
+            self.linter_name,
+            self.config_hash,
+            {
+                file_hash: [
+                    (line, code, msg) for line, comments in
+                    output.get(os.path.join(prefix, path), {}).items()
+                    for code, msg in comments
+                ]
+                for path, file_hash in inst.file_hashes.items()
+            },
+        )
+
+    def _lint(
+        self,
+        base_dir: str,
+        lint_dir: str,
+        process_completed: ProcessCompletedCallback,
+    ) -> LinterOutput:
+        """Run the linter on the given directory.
 
-        :param linter_instance: The linter instance that will be run. This
-            linter instance is linked to a work from which all files will be
-            restored and the linter will be run on those files.
+        :param base_dir: The directory to which the returned filenames are
+            relative.
+        :param lint_dir: The directory passed to the linter.
         :param process_completed: The callback that should be called by the
-            linter instance after the process, like pylint or java, has been
-            completed.
-        :returns: Nothing
+            linter instance after the process has been completed.
+        :returns: The emitted comments for each file.
         """
-        temp_res: t.Dict[str, t.Dict[int, t.List[t.Tuple[str, str]]]]
-        temp_res = {}
-        res: t.Dict[int, t.Mapping[int, t.Sequence[t.Tuple[str, str]]]]
-        res = {}
+        res: LinterOutput = {}
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-
-            def __emit(f: str, line: int, code: str, msg: str) -> None:
-                if f.startswith(tmpdir):
-                    f = f[len(tmpdir) + 1:]
-                if f not in temp_res:
-                    temp_res[f] = {}
-                line = line - 1
-                if line not in temp_res[f]:
-                    temp_res[f][line] = []
-                temp_res[f][line].append((code, msg))
-
-            tree_root = files.restore_directory_structure(
-                linter_instance.work,
-                tmpdir,
-            )
+        def __emit(f: str, line: int, code: str, msg: str) -> None:
+            if f.startswith(base_dir):
+                f = f[len(base_dir) + 1:]
+            if f not in res:
+                res[f] = {}
+            line = line - 1
+            if line not in res[f]:
+                res[f][line] = []
+            res[f][line].append((code, msg))
 
-            self.linter.run(
-                files.safe_join(tmpdir, tree_root.name), __emit,
-                process_completed
-            )
+        self.linter.run(lint_dir, __emit, process_completed)
+        return res
 
-        del tmpdir
+    @staticmethod
+    def _add_comments(
+        linter_instance: models.LinterInstance,
+        tree_root: files.FileTree[int],
+        prefix: str,
+        output: LinterOutput,
+    ) -> None:
+        """Add the comments for the given instance and set it to done.
+
+        :param linter_instance: The instance to add the comments for.
+        :param tree_root: The restored tree of the instance.
+        :param prefix: The path of the directory in which the tree was
+            restored in ``output``.
+        :param output: The output of the linter, the found comments are
+            removed from this mapping.
+        :returns: Nothing.
+        """
+        res: t.Dict[int, t.Mapping[int, t.Sequence[t.Tuple[str, str]]]]
+        res = {}
 
         def __do(tree: files.FileTree[int], parent: str) -> None:
             # We can safely use os.path.join here as the contents of this path
@@ -723,25 +1073,17 @@ class LinterRunner:
             if tree.entries is not None:  # this is dir:
                 for entry in tree.entries:
                     __do(entry, parent)
-            elif parent in temp_res:
-                res[tree.id] = temp_res[parent]
-                del temp_res[parent]
-
-        __do(tree_root, '')
+            elif parent in output:
+                res[tree.id] = output.pop(parent)
 
-        meth = logger.warning if temp_res else logger.info
-        meth('Finished adding linter comments', comments_left=temp_res)
+        __do(tree_root, prefix)
 
         models.LinterComment.query.filter_by(linter_id=linter_instance.id
                                              ).delete()
-
-        for comment in linter_instance.add_comments(res):
-            db.session.add(comment)
+        db.session.bulk_save_objects(list(linter_instance.add_comments(res)))
 
         linter_instance.state = models.LinterState.done
 
-        db.session.commit()
-
 
 def get_all_linters(
 ) -> t.Dict[str, t.Dict[str, t.Union[str, t.Mapping[str, str]]]]:
@@ -170,7 +170,8 @@ if True:  # pylint: disable=using-constant-test
         Assignment, AssignmentLinter, AssignmentResult, AssignmentDoneType,
         AssignmentGraderDone, AssignmentAssignedGrader, AssignmentStateEnum,
         AssignmentAmbiguousSettingTag, AssignmentVisibilityState,
-        AssignmentPeerFeedbackSettings, AssignmentPeerFeedbackConnection
+        AssignmentPeerFeedbackSettings, AssignmentPeerFeedbackConnection,
+        LinterResultCache, AssignmentLatestSubmission
     )
     from .permission import Permission
     from .user import User
@@ -185,7 +186,8 @@ if True:  # pylint: disable=using-constant-test
     from .work import Work, GradeHistory, GradeOrigin, WorkOrigin
     from .linter import LinterState, LinterComment, LinterInstance
     from .plagiarism import (
-        PlagiarismState, PlagiarismRun, PlagiarismCase, PlagiarismMatch
+        PlagiarismState, PlagiarismRun, PlagiarismCase, PlagiarismMatch,
+        PlagiarismFingerprint
     )
     from .comment import (
         CommentBase, CommentReply, CommentReplyEdit, CommentReplyType,
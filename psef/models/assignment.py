@@ -7,6 +7,7 @@ import json
 import math
 import uuid
 import typing as t
+import hashlib
 import datetime
 import dataclasses
 from random import shuffle
@@ -19,6 +20,7 @@ from sqlalchemy.orm import validates
 from mypy_extensions import DefaultArg
 from sqlalchemy.types import JSON
 from typing_extensions import TypedDict
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
 import psef
@@ -26,9 +28,10 @@ import cg_cache
 import cg_sqlalchemy_helpers
 from cg_helpers import handle_none, on_not_none, zip_times_with_offset
 from cg_dt_utils import DatetimeWithTimezone
+from cg_sqlalchemy_helpers import JSONB
 from cg_sqlalchemy_helpers import expression as sql_expression
 from cg_sqlalchemy_helpers.types import (
-    _T_BASE, MyQuery, DbColumn, ColumnProxy, MyNonOrderableQuery,
+    _T_BASE, DbType, MyQuery, DbColumn, ColumnProxy, MyNonOrderableQuery,
     hybrid_property
 )
 from cg_sqlalchemy_helpers.mixins import IdMixin, TimestampMixin
@@ -442,6 +445,297 @@ class AssignmentLinter(Base):
         return self
 
 
+class LinterResultCache(Base):
+    """The comments a linter produced for a single file.
+
+    Linters that lint every file on its own (see
+    :attr:`.linters.Linter.CACHE_RESULTS`) always produce the same comments
+    for the same file with the same config. Students often hand in files that
+    were linted before, for example starter code or resubmissions, so these
+    comments are cached and the linter is only run for files that were not
+    seen before.
+
+    The hash of the config is part of the key, so results produced with an
+    old config are never used.
+
+    :ivar linter_name: The name of the linter that produced the comments.
+    :ivar config_hash: The hash of the config of the linter, see
+        :meth:`LinterResultCache.hash_config`.
+    :ivar file_hash: The hash of the linted file.
+    :ivar comments: The produced comments, as a list of the (zero based) line,
+        the code and the message of every comment.
+    """
+    __tablename__ = 'LinterResultCache'
+
+    linter_name = db.Column('linter_name', db.Unicode, primary_key=True)
+    config_hash = db.Column('config_hash', db.Unicode, primary_key=True)
+    file_hash = db.Column('file_hash', db.Unicode, primary_key=True)
+    comments = db.Column(
+        'comments',
+        t.cast(DbType[t.List[t.Tuple[int, str, str]]], JSONB),
+        nullable=False,
+    )
+
+    @staticmethod
+    def hash_config(config: str) -> str:
+        """Get the hash of the given linter config.
+
+        :param config: The config to hash.
+        :returns: The hex digest of the config.
+        """
+        return hashlib.sha256(config.encode('utf8')).hexdigest()
+
+    @classmethod
+    def get_results(
+        cls,
+        linter_name: str,
+        config_hash: str,
+        file_hashes: t.Collection[str],
+    ) -> t.Dict[str, t.List[t.Tuple[int, str, str]]]:
+        """Get the cached comments for the given files.
+
+        :param linter_name: The name of the linter.
+        :param config_hash: The hash of the config of the linter.
+        :param file_hashes: The hashes of the files to get the comments for.
+        :returns: A mapping from file hash to the cached comments of that file,
+            files without cached results are not in this mapping.
+        """
+        res = {}
+        for chunk in helpers.chunkify(list(set(file_hashes)), 1000):
+            for file_hash, comments in db.session.query(
+                cls.file_hash, cls.comments
+            ).filter(
+                cls.linter_name == linter_name,
+                cls.config_hash == config_hash,
+                t.cast(DbColumn[str], cls.file_hash).in_(chunk),
+            ):
+                res[file_hash] = [
+                    (line, code, msg) for line, code, msg in comments
+                ]
+        return res
+
+    @classmethod
+    def add_results(
+        cls,
+        linter_name: str,
+        config_hash: str,
+        results: t.Mapping[str, t.Sequence[t.Tuple[int, str, str]]],
+    ) -> None:
+        """Store the comments for the given files.
+
+        Results that are already in the cache, for example because another
+        linter run stored them concurrently, are left untouched.
+
+        :param linter_name: The name of the linter.
+        :param config_hash: The hash of the config of the linter.
+        :param results: A mapping from file hash to the comments produced for
+            that file.
+        :returns: Nothing.
+        """
+        for chunk in helpers.chunkify(list(results.items()), 1000):
+            db.session.execute(
+                postgresql.insert(cls).values(
+                    [
+                        {
+                            'linter_name': linter_name,
+                            'config_hash': config_hash,
+                            'file_hash': file_hash,
+                            'comments': comments,
+                        } for file_hash, comments in chunk
+                    ]
+                ).on_conflict_do_nothing()
+            )
+
+    @classmethod
+    def clear_unused(cls, linter_name: str, config: str) -> None:
+        """Remove the cached results for the given linter and config if no
+        :class:`.AssignmentLinter` uses this config anymore.
+
+        :param linter_name: The name of the linter.
+        :param config: The config of the linter.
+        :returns: Nothing.
+        """
+        still_used = db.session.query(
+            AssignmentLinter.query.filter_by(name=linter_name,
+                                             config=config).exists()
+        ).scalar()
+        if not still_used:
+            cls.query.filter_by(
+                linter_name=linter_name,
+                config_hash=cls.hash_config(config),
+            ).delete()
+
+
+class AssignmentLatestSubmission(Base):
+    """The latest non deleted submission of every author in an assignment.
+
+    This table is kept up to date by ``after_insert`` and ``after_update``
+    hooks on :class:`.work_models.Work`, so that
+    :meth:`.Assignment.get_from_latest_submissions` doesn't have to search
+    through all submissions of an assignment. The latest submission of an
+    author is determined in the same way as
+    :meth:`.Assignment.get_latest_submission_for_user`, so by ``created_at``
+    and then by ``id``. Preferring group submissions over the submissions of
+    its members is done when reading from this table.
+
+    :ivar ~.AssignmentLatestSubmission.assignment_id: The id of the
+        assignment.
+    :ivar ~.AssignmentLatestSubmission.user_id: The id of the author.
+    :ivar work_id: The id of the latest submission of the author.
+    :ivar work_created_at: The moment the latest submission was created. This
+        is stored so that concurrently created submissions can be compared
+        without reading the :class:`.work_models.Work` table.
+    """
+    __tablename__ = 'AssignmentLatestSubmission'
+    assignment_id = db.Column(
+        'assignment_id',
+        db.Integer,
+        db.ForeignKey('Assignment.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    user_id = db.Column(
+        'user_id',
+        db.Integer,
+        db.ForeignKey('User.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    work_id = db.Column(
+        'work_id',
+        db.Integer,
+        db.ForeignKey('Work.id', ondelete='CASCADE'),
+        nullable=False,
+        unique=True,
+    )
+    work_created_at = db.Column(
+        'work_created_at',
+        db.TIMESTAMP(timezone=True),
+        nullable=False,
+    )
+
+    __table_args__ = (db.PrimaryKeyConstraint(assignment_id, user_id), )
+
+    @classmethod
+    def add_work(
+        cls,
+        connection: sqlalchemy.engine.Connection,
+        work: 'work_models.Work',
+    ) -> None:
+        """Make the given work the latest submission of its author, if it is
+        newer than the current latest submission.
+
+        This is called for every inserted :class:`.work_models.Work`.
+
+        :param connection: The connection used to insert the work.
+        :param work: The newly inserted work.
+        :returns: Nothing.
+        """
+        insert = postgresql.insert(cls).values(
+            assignment_id=work.assignment_id,
+            user_id=work.user_id,
+            work_id=work.id,
+            work_created_at=work.created_at,
+        )
+        connection.execute(
+            insert.on_conflict_do_update(
+                index_elements=[cls.assignment_id, cls.user_id],
+                set_={
+                    'work_id': insert.excluded.work_id,
+                    'work_created_at': insert.excluded.work_created_at,
+                },
+                # This check is done on the latest version of the row, so two
+                # submissions created at the same time are still ordered
+                # correctly.
+                where=sqlalchemy.tuple_(
+                    cls.work_created_at, cls.work_id
+                ) < sqlalchemy.tuple_(
+                    insert.excluded.work_created_at,
+                    insert.excluded.work_id,
+                ),
+            )
+        )
+
+    @classmethod
+    def recalculate(
+        cls,
+        connection: sqlalchemy.engine.Connection,
+        assignment_id: int,
+        user_id: int,
+    ) -> None:
+        """Recalculate the latest submission of the given author.
+
+        :param connection: The connection to use for the queries.
+        :param assignment_id: The id of the assignment.
+        :param user_id: The id of the author.
+        :returns: Nothing.
+        """
+        Work = work_models.Work  # pylint: disable=invalid-name
+        connection.execute(
+            cls.__table__.delete().where(
+                sqlalchemy.and_(
+                    cls.assignment_id == assignment_id,
+                    cls.user_id == user_id,
+                )
+            )
+        )
+
+        latest = sqlalchemy.select(
+            [Work.assignment_id, Work.user_id, Work.id, Work.created_at]
+        ).where(
+            sqlalchemy.and_(
+                Work.assignment_id == assignment_id,
+                Work.user_id == user_id,
+                ~Work._deleted,  # pylint: disable=protected-access
+            )
+        ).order_by(
+            Work.created_at.desc(),
+            Work.id.desc(),
+        ).limit(1)
+        connection.execute(
+            postgresql.insert(cls).from_select(
+                [
+                    cls.assignment_id, cls.user_id, cls.work_id,
+                    cls.work_created_at
+                ],
+                latest,
+            )
+        )
+
+    @classmethod
+    def update_work(
+        cls,
+        connection: sqlalchemy.engine.Connection,
+        work: 'work_models.Work',
+    ) -> None:
+        """Recalculate the latest submission of the author of the given work
+        if it was deleted, moved or its creation date changed.
+
+        This is called for every updated :class:`.work_models.Work`.
+
+        :param connection: The connection used to update the work.
+        :param work: The updated work.
+        :returns: Nothing.
+        """
+        attrs = sqlalchemy.inspect(work).attrs
+        if not any(
+            getattr(attrs, attr).history.has_changes() for attr in
+            ['assignment_id', 'user_id', '_deleted', 'created_at']
+        ):
+            return
+
+        def get_old(attr: str, new_value: int) -> int:
+            deleted = getattr(attrs, attr).history.deleted
+            return deleted[0] if deleted else new_value
+
+        old_key = (
+            get_old('assignment_id', work.assignment_id),
+            get_old('user_id', work.user_id),
+        )
+        new_key = (work.assignment_id, work.user_id)
+        cls.recalculate(connection, *old_key)
+        if old_key != new_key:
+            cls.recalculate(connection, *new_key)
+
+
 class AssignmentPeerFeedbackConnection(Base, TimestampMixin):
     """This table represents a link between a two users and assignment.
 
@@ -1924,7 +2218,8 @@ class Assignment(helpers.NotEqualMixin, Base):  # pylint: disable=too-many-publi
 
             Be very careful when changing this function, it is important that
             it always returns the same submission for a user as
-            `get_from_latest_submission`.
+            `get_from_latest_submission` and the
+            :class:`.AssignmentLatestSubmission` table.
 
         :param user: The user to get the latest non deleted submission for.
         :param group_of_user: The group that the user belongs to for this
@@ -2013,6 +2308,10 @@ class Assignment(helpers.NotEqualMixin, Base):  # pylint: disable=too-many-publi
             it always returns the same submission for a user as
             `get_latest_submission_for_user`.
 
+        The latest non deleted submissions are read from the
+        :class:`.AssignmentLatestSubmission` table, only when deleted
+        submissions should be included they are searched in all submissions.
+
         :param to_query: The field to get from the last submitted submissions.
         :returns: A query object with the given fields selected from the last
             submissions.
@@ -2021,45 +2320,50 @@ class Assignment(helpers.NotEqualMixin, Base):  # pylint: disable=too-many-publi
         if not self.is_visible:
             return base_query.filter(sqlalchemy.sql.false())
 
-        # TODO: Investigate this subquery here. We need to do that right now as
-        # other functions might use this method and might want to order in a
-        # different way or do other distincts. But I have no idea how slow this
-        # subquery makes the query, as postgres could optimize it out.
-        sql = db.session.query(
-            work_models.Work.id,
-        ).filter(
-            work_models.Work.assignment_id == self.id,
-        ).order_by(
-            work_models.Work.user_id,
-            work_models.Work.created_at.desc(),
-            # Sort by id too so that when the date is exactly the same we can
-            # still have well defined behavior (i.e. always get the same
-            # submissions for a user.)
-            work_models.Work.id.desc()
-        )
-        if not include_deleted:
-            sql = sql.filter_by(_deleted=False)
-
-        sub = sql.distinct(work_models.Work.user_id).subquery('ids')
+        if include_deleted:
+            # TODO: Investigate this subquery here. We need to do that right
+            # now as other functions might use this method and might want to
+            # order in a different way or do other distincts. But I have no
+            # idea how slow this subquery makes the query, as postgres could
+            # optimize it out.
+            sub = db.session.query(
+                work_models.Work.id,
+            ).filter(
+                work_models.Work.assignment_id == self.id,
+            ).order_by(
+                work_models.Work.user_id,
+                work_models.Work.created_at.desc(),
+                # Sort by id too so that when the date is exactly the same we
+                # can still have well defined behavior (i.e. always get the
+                # same submissions for a user.)
+                work_models.Work.id.desc()
+            ).distinct(work_models.Work.user_id).subquery('ids')
+        else:
+            sub = db.session.query(AssignmentLatestSubmission.work_id).filter(
+                AssignmentLatestSubmission.assignment_id == self.id,
+            ).subquery('ids')
 
         res = base_query.filter(work_models.Work.id.in_(sub), )
         if self.group_set_id is not None and not include_old_user_submissions:
-            sub_query = db.session.query(work_models.Work).filter(
-                work_models.Work.assignment_id == self.id,
-                work_models.Work.user_id == psef.models.Group.virtual_user_id,
-            )
-            if not include_deleted:
-                # We don't need the intelligent `deleted` attribute here from
-                # the Work models, which also checks if the assignment is
-                # deleted, as we already check this at the start of the
-                # function.
-                # pylint: disable=protected-access
-                sub_query = sub_query.filter(~work_models.Work._deleted)
+            if include_deleted:
+                group_has_submission = db.session.query(
+                    work_models.Work
+                ).filter(
+                    work_models.Work.assignment_id == self.id,
+                    work_models.Work.user_id ==
+                    psef.models.Group.virtual_user_id,
+                ).exists()
+            else:
+                group_has_submission = AssignmentLatestSubmission.query.filter(
+                    AssignmentLatestSubmission.assignment_id == self.id,
+                    AssignmentLatestSubmission.user_id ==
+                    psef.models.Group.virtual_user_id,
+                ).exists()
             groups_with_submission = db.session.query(
                 psef.models.Group.id
             ).filter(
                 psef.models.Group.group_set_id == self.group_set_id,
-                sub_query.exists(),
+                group_has_submission,
             )
             res = res.filter(
                 ~work_models.Work.user_id.in_(
@@ -18,7 +18,8 @@ from sqlalchemy.sql.expression import or_, and_, case, nullsfirst
 import psef
 from cg_dt_utils import DatetimeWithTimezone
 from cg_flask_helpers import callback_after_this_request
-from cg_sqlalchemy_helpers import UUIDType, deferred, hybrid_property
+from cg_sqlalchemy_helpers import JSONB, UUIDType, deferred, hybrid_property
+from cg_sqlalchemy_helpers.types import DbType
 from cg_sqlalchemy_helpers.mixins import IdMixin, UUIDMixin, TimestampMixin
 
 from . import Base, MyQuery, DbColumn, db
@@ -293,6 +294,17 @@ class AutoTestResult(Base, TimestampMixin, IdMixin, NotEqualMixin):
         )
     )
 
+    # The time the runner spent in the different phases of running this
+    # result, in the format of :meth:`.auto_test._StudentTimings.to_json`.
+    timings = deferred(
+        db.Column(
+            'timings',
+            t.cast(DbType[t.Dict[str, t.Any]], JSONB),
+            nullable=True,
+            default=None,
+        )
+    )
+
     step_results = db.relationship(
         lambda: auto_test_step_models.AutoTestStepResult,
         back_populates='result',
@@ -971,6 +983,49 @@ class AutoTestRun(Base, TimestampMixin, IdMixin):
             _state=auto_test_step_models.AutoTestStepResultState.not_started,
         )
 
+    def get_previous_runtimes(
+        self, user_ids: t.Collection[int]
+    ) -> t.Mapping[int, float]:
+        """Get how long it took to run the previous result of the given users.
+
+        The previous result of a user is their latest finished result in a run
+        of the same AutoTest, for example of an older submission. Its runtime
+        is the time between it being started and its last update.
+
+        :param user_ids: The users to get the runtime for.
+        :returns: A mapping from user id to the runtime in seconds. Users
+            without a finished result are not included.
+        """
+        if not user_ids:
+            return {}
+
+        Work = work_models.Work  # pylint: disable=invalid-name
+        finished = (
+            auto_test_step_models.AutoTestStepResultState.get_finished_states()
+        )
+        runtimes = db.session.query(
+            Work.user_id,
+            AutoTestResult.updated_at - AutoTestResult.started_at,
+        ).join(
+            AutoTestResult.work,
+        ).join(
+            AutoTestResult.run,
+        ).filter(
+            AutoTestRun.auto_test_id == self.auto_test_id,
+            AutoTestResult.started_at.isnot(None),
+            # pylint: disable=protected-access
+            AutoTestResult._state.in_(finished),
+            Work.user_id.in_(user_ids),
+        ).distinct(Work.user_id).order_by(
+            Work.user_id,
+            AutoTestResult.updated_at.desc(),
+        )
+
+        return {
+            user_id: runtime.total_seconds()
+            for user_id, runtime in runtimes
+        }
+
     def add_active_runner(
         self,
         runner_ipaddr: str,
@@ -1019,6 +1074,7 @@ class AutoTestRun(Base, TimestampMixin, IdMixin):
             'result_ids': [r.id for r in results],
             'student_ids': [r.work.user_id for r in results],
             'student_infos': [self._get_student_info(r) for r in results],
+            'expected_runtimes': self._get_expected_runtimes(results),
             'assignment_info': self._get_assignment_info(),
             'sets': [s.get_instructions(self) for s in self.auto_test.sets],
             'fixtures': [(f.name, f.id) for f in self.auto_test.fixtures],
@@ -1041,6 +1097,16 @@ class AutoTestRun(Base, TimestampMixin, IdMixin):
         else:
             return {'deadline': deadline.isoformat()}
 
+    def _get_expected_runtimes(self, results: t.Sequence[AutoTestResult]
+                               ) -> t.Dict[str, float]:
+        runtimes = self.get_previous_runtimes(
+            [r.work.user_id for r in results]
+        )
+        return {
+            str(r.id): runtimes[r.work.user_id]
+            for r in results if r.work.user_id in runtimes
+        }
+
     @staticmethod
     def _get_student_info(
         result: AutoTestResult
@@ -12,6 +12,7 @@ import uuid
 import typing as t
 import numbers
 import tempfile
+import dataclasses
 
 import regex as re
 import structlog
@@ -309,6 +310,90 @@ class AutoTestStepBase(Base, TimestampMixin, IdMixin):
         )
 
 
+@dataclasses.dataclass(frozen=True)
+class _OutputMatcher:
+    """This class matches the output of a program against the expected output
+    of an input of an IoTest.
+
+    The expected output is normalized once, when the matcher is created.
+
+    :ivar expected_output: The normalized expected output.
+    :ivar options: The options of the input, see :meth:`_IoTest.match_output`.
+    """
+    expected_output: str
+    options: t.FrozenSet[str]
+
+    @classmethod
+    def create(
+        cls, expected_output: str, options: t.Iterable[str]
+    ) -> '_OutputMatcher':
+        """Create a matcher for the given expected output.
+
+        :param expected_output: The expected output as provided by the
+            teacher, this might be a regex.
+        :param options: The options of the input.
+        :returns: The created matcher.
+        """
+        options = frozenset(options)
+        return cls(cls._normalize(expected_output, options), options)
+
+    @staticmethod
+    def _normalize(text: str, options: t.AbstractSet[str]) -> str:
+        r"""Normalize the given text.
+
+        >>> opts = {'trailing_whitespace', 'case'}
+        >>> _OutputMatcher._normalize('A  \nB\t\n', opts)
+        'a\nb'
+        >>> _OutputMatcher._normalize(' a b\nc ', {'all_whitespace'})
+        'abc'
+        """
+        if 'all_whitespace' in options:
+            text = ''.join(text.split())
+        elif 'trailing_whitespace' in options:
+            text = '\n'.join(line.rstrip() for line in text.splitlines())
+
+        if 'case' in options and 'regex' not in options:
+            text = text.lower()
+
+        return text
+
+    def match(self, stdout: str) -> t.Tuple[bool, t.Optional[int]]:
+        """Match the given output.
+
+        :param stdout: The stdout of the program, so the thing we got.
+        :returns: A tuple with if the output matched, and the exit code that
+            should be used instead of the exit code of the program, if any.
+        """
+        to_test = self._normalize(stdout.rstrip('\n'), self.options)
+
+        logger.info(
+            'Comparing output and expected output',
+            to_test_length=len(to_test),
+            expected_output_length=len(self.expected_output),
+            step_options=self.options,
+        )
+        if 'regex' in self.options:
+            flags = re.IGNORECASE if 'case' in self.options else 0
+            try:
+                # The ``regex`` module caches compiled patterns itself.
+                match = re.search(
+                    self.expected_output, to_test, flags=flags, timeout=2
+                )
+            except TimeoutError:
+                logger.warning(
+                    'Regex match timed out',
+                    regex=self.expected_output,
+                    exc_info=True,
+                )
+                return False, -2
+            logger.info('Done with regex search', match=match)
+            return bool(match), None
+        elif 'substring' in self.options:
+            return self.expected_output in to_test, None
+        else:
+            return self.expected_output == to_test, None
+
+
 @_register
 class _IoTest(AutoTestStepBase):
     __mapper_args__ = {
@@ -329,10 +414,6 @@ class _IoTest(AutoTestStepBase):
         'all_whitespace': 'regex',
     }
 
-    @staticmethod
-    def _remove_whitespace(string: str) -> str:
-        return "".join(string.split())
-
     @classmethod
     def _validate_single_input(cls, inp: JSONType) -> t.List[str]:
         errs = []
@@ -424,9 +505,9 @@ class _IoTest(AutoTestStepBase):
             s['weight'] if sr['state'] == passed else 0 for s, sr in iterator
         )
 
-    @classmethod
+    @staticmethod
     def match_output(
-        cls, stdout: str, expected_output: str, step_options: t.Iterable[str]
+        stdout: str, expected_output: str, step_options: t.Iterable[str]
     ) -> t.Tuple[bool, t.Optional[int]]:
         """Do the output matching of an IoTest.
 
@@ -436,53 +517,23 @@ class _IoTest(AutoTestStepBase):
         :param step_options: A list of options as given by the students. Valid
             options are 'regex', 'trailing_whitespace', 'case' and 'substring'.
         """
-        regex_flags = 0
-        to_test = stdout.rstrip('\n')
-        step_options = set(step_options)
-
-        if 'all_whitespace' in step_options:
-            to_test = cls._remove_whitespace(to_test)
-            expected_output = cls._remove_whitespace(expected_output)
-        elif 'trailing_whitespace' in step_options:
-            to_test = '\n'.join(line.rstrip() for line in to_test.splitlines())
-            expected_output = '\n'.join(
-                line.rstrip() for line in expected_output.splitlines()
-            )
+        matcher = _OutputMatcher.create(expected_output, step_options)
+        return matcher.match(stdout)
 
-        if 'case' in step_options:
-            regex_flags |= re.IGNORECASE
-            if 'regex' not in step_options:
-                to_test = to_test.lower()
-                expected_output = expected_output.lower()
+    def get_instructions(self) -> 'auto_test_module.StepInstructions':
+        """Get the instructions to run this step.
 
-        logger.info(
-            'Comparing output and expected output',
-            to_test=to_test,
-            expected_output=expected_output,
-            step_options=step_options,
-        )
-        if 'regex' in step_options:
-            with cg_logger.bound_to_logger(
-                output=expected_output,
-                to_test=to_test,
-                flags=regex_flags,
-            ):
-                try:
-                    match = re.search(
-                        expected_output,
-                        to_test,
-                        flags=regex_flags,
-                        timeout=2,
-                    )
-                except TimeoutError:
-                    logger.warning('Regex match timed out', exc_info=True)
-                    return False, -2
-                logger.info('Done with regex search', match=match)
-            return bool(match), None
-        elif 'substring' in step_options:
-            return expected_output in to_test, None
-        else:
-            return expected_output == to_test, None
+        The normalized expected output of every input is included, so runners
+        don't need to normalize it again for every student.
+        """
+        res = super().get_instructions()
+        data = copy.deepcopy(self.data)
+        for inp in t.cast(t.List[t.Dict[str, t.Any]], data['inputs']):
+            inp['normalized_output'] = _OutputMatcher.create(
+                inp['output'].rstrip('\n'), inp['options']
+            ).expected_output
+        res['data'] = data
+        return res
 
     @classmethod
     def _execute(
@@ -511,7 +562,19 @@ class _IoTest(AutoTestStepBase):
         total_state = AutoTestStepResultState.failed
         total_weight = 0
 
-        for idx, step in enumerate(inputs):
+        matchers = []
+        for step in inputs:
+            if 'normalized_output' in step:
+                matcher = _OutputMatcher(
+                    step['normalized_output'], frozenset(step['options'])
+                )
+            else:
+                matcher = _OutputMatcher.create(
+                    step['output'].rstrip('\n'), step['options']
+                )
+            matchers.append(matcher)
+
+        for idx, (step, matcher) in enumerate(zip(inputs, matchers)):
             test_result['steps'][idx].update(
                 {
                     'state': AutoTestStepResultState.running.name,
@@ -543,13 +606,8 @@ class _IoTest(AutoTestStepBase):
                 state = None
 
             if code == 0:
-                step_options = t.cast(t.List[str], step['options'])
-                expected_output = step['output'].rstrip('\n')
-
                 with cg_logger.bound_to_logger(step=step):
-                    success, new_code = cls.match_output(
-                        stdout, expected_output, step_options
-                    )
+                    success, new_code = matcher.match(stdout)
                 code = code if new_code is None else new_code
             else:
                 success = False
@@ -5,7 +5,6 @@ SPDX-License-Identifier: AGPL-3.0-only
 import os
 import enum
 import uuid
-import shutil
 import typing as t
 from abc import abstractmethod
 from collections import defaultdict
@@ -121,8 +120,8 @@ class FileMixin(t.Generic[T]):
         :returns: Nothing.
         """
         try:
-            os.remove(self.get_diskname())
-        except (AssertionError, FileNotFoundError):
+            psef.files.remove_stored_file(self.get_diskname())
+        except AssertionError:
             pass
 
     def get_diskname(self) -> str:
@@ -512,7 +511,7 @@ class AutoTestFixture(Base, FileMixin[int], TimestampMixin):
         path, filename = psef.files.random_file_path()
         old_path = self.get_diskname()
         helpers.callback_after_this_request(
-            lambda: shutil.copy(old_path, path)
+            lambda: psef.files.copy_stored_file(old_path, path)
         )
 
         return AutoTestFixture(
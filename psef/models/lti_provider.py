@@ -387,6 +387,7 @@ class LTI1p1Provider(LTIProviderBase):
             difference=set(s.id for s in subs) ^ set(submission_ids),
         )
 
+        work_models.Work.preload_grades(subs)
         # pylint: disable=protected-access
         for sub in subs:
             self._passback_grade(sub, initial=False)
@@ -1091,6 +1092,7 @@ class LTI1p3Provider(LTIProviderBase):
         subs = assig.get_all_latest_submissions().all()
         logger.info('Passback grades', gotten_submission=subs)
         found_user_ids = set(a.id for s in subs for a in s.get_all_authors())
+        work_models.Work.preload_grades(subs)
 
         # pylint: disable=protected-access
         for sub in subs:
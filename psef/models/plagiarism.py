@@ -191,6 +191,30 @@ class PlagiarismCase(Base):
         uselist=True,
     )
 
+    def copy(self) -> 'PlagiarismCase':
+        """Copy this case and all its matches.
+
+        The copy is not connected to any run.
+
+        :returns: The copied case.
+        """
+        return PlagiarismCase(
+            work1_id=self.work1_id,
+            work2_id=self.work2_id,
+            match_avg=self.match_avg,
+            match_max=self.match_max,
+            matches=[
+                PlagiarismMatch(
+                    file1_id=match.file1_id,
+                    file2_id=match.file2_id,
+                    file1_start=match.file1_start,
+                    file1_end=match.file1_end,
+                    file2_start=match.file2_start,
+                    file2_end=match.file2_end,
+                ) for match in self.matches
+            ],
+        )
+
     @property
     def any_work_deleted(self) -> bool:
         """Is any of the works connected to this case deleted.
@@ -279,6 +303,38 @@ class PlagiarismCase(Base):
         }
 
 
+class PlagiarismFingerprint(Base):
+    """The fingerprint of a submission as it was checked during a run.
+
+    These fingerprints are used by incremental runs to detect which
+    submissions did not change since the previous run, so that the cases
+    between those submissions can be reused instead of computed again.
+
+    :ivar ~.PlagiarismFingerprint.plagiarism_run_id: The id of the run in which
+        the submission was checked.
+    :ivar ~.PlagiarismFingerprint.work_id: The id of the checked submission.
+    :ivar ~.PlagiarismFingerprint.fingerprint: The fingerprint of the files of
+        the submission, see :meth:`.files.RestorePlan.get_fingerprint`.
+    """
+    __tablename__ = 'PlagiarismFingerprint'
+
+    plagiarism_run_id = db.Column(
+        'plagiarism_run_id',
+        db.Integer,
+        db.ForeignKey('PlagiarismRun.id', ondelete='CASCADE'),
+        nullable=False,
+        primary_key=True,
+    )
+    work_id = db.Column(
+        'work_id',
+        db.Integer,
+        db.ForeignKey('Work.id', ondelete='CASCADE'),
+        nullable=False,
+        primary_key=True,
+    )
+    fingerprint = db.Column('fingerprint', db.Unicode, nullable=False)
+
+
 @enum.unique
 class PlagiarismState(enum.IntEnum):
     """Describes in what state a :class:`.PlagiarismRun` is.
@@ -353,6 +409,13 @@ class PlagiarismRun(Base):
         uselist=True,
     )
 
+    fingerprints = db.relationship(
+        lambda: PlagiarismFingerprint,
+        cascade='all,delete',
+        lazy='dynamic',
+        uselist=True,
+    )
+
     @property
     def provider_name(self) -> str:
         """
@@ -364,6 +427,19 @@ class PlagiarismRun(Base):
         # This can never happen
         raise KeyError  # pragma: no cover
 
+    @property
+    def incremental_config(self) -> t.List[t.List[object]]:
+        """The config of this run without the ``incremental`` option.
+
+        Runs with the same incremental config compare submissions in the same
+        way, so an incremental run can reuse the cases of a finished run with
+        the same incremental config.
+        """
+        return [
+            item for item in json.loads(self.json_config)
+            if item[0] != 'incremental'
+        ]
+
     @property
     def plagiarism_cls(self) -> t.Type['psef.plagiarism.PlagiarismProvider']:
         """Get the class of the plagiarism provider of this run.
@@ -375,6 +451,19 @@ class PlagiarismRun(Base):
             self.provider_name,
         )
 
+    def get_provider(self) -> 'psef.plagiarism.PlagiarismProvider':
+        """Get the plagiarism provider of this run, with the options of this
+        run.
+
+        :returns: The configured plagiarism provider.
+        """
+        # The class of a run is never abstract, so it can be instantiated.
+        provider: 'psef.plagiarism.PlagiarismProvider' = t.cast(
+            t.Any, self.plagiarism_cls
+        )()
+        provider.set_options(dict(json.loads(self.json_config)))
+        return provider
+
     def __to_json__(self) -> t.Mapping[str, object]:
         """Creates a JSON serializable representation of this object.
 
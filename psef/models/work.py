@@ -2,16 +2,13 @@
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
-import os
 import enum
 import typing as t
-import zipfile
-import tempfile
 from collections import defaultdict
 
 import structlog
 import sqlalchemy
-from sqlalchemy import orm, select
+from sqlalchemy import orm, event, select
 from sqlalchemy.orm import undefer, selectinload
 from sqlalchemy.types import JSON
 from typing_extensions import Literal
@@ -34,7 +31,7 @@ from . import assignment as assignment_models
 from .. import auth, helpers, signals, features
 from .linter import LinterState, LinterComment, LinterInstance
 from .rubric import RubricItem, WorkRubricItem
-from .comment import CommentBase
+from .comment import CommentBase, CommentReply
 from ..helpers import JSONType
 from ..exceptions import PermissionException
 from ..permissions import CoursePermission
@@ -208,6 +205,10 @@ class Work(Base):
 
     grade_histories: t.List['GradeHistory']
 
+    # The grade loaded by ``preload_grades``, this is not a column.
+    _preloaded_grade: t.Union[float, None, helpers.MissingType
+                              ] = helpers.MISSING
+
     _deleted = db.Column(
         'deleted',
         db.Boolean,
@@ -367,8 +368,10 @@ class Work(Base):
                 max_grade,
                 greatest(
                     min_grade, (
-                        (sqlalchemy.func.sum(WorkRubricItem.points) * 10) /
-                        max_rubric_points
+                        # This is done in the same order as in the ``grade``
+                        # property, so that the floats are exactly the same.
+                        (sqlalchemy.func.sum(WorkRubricItem.points) /
+                         max_rubric_points) * 10
                     )
                 )
             )
@@ -383,6 +386,58 @@ class Work(Base):
             cls._grade.is_(None),
         ).group_by(cls.id)
 
+    @classmethod
+    def get_grade_per_work(
+        cls,
+        assignment: 'assignment_models.Assignment',
+        work_ids: t.Collection[int],
+    ) -> _MyQuery[t.Tuple[int, float]]:
+        """Get the grades of the given submissions in a single query.
+
+        :param assignment: The assignment of the submissions.
+        :param work_ids: The ids of the submissions to get the grades for,
+            they should all be in the given assignment.
+        :returns: A query that returns tuples (work_id, grade) for each of the
+            given submissions that has a grade, this is the same grade as the
+            :attr:`.Work.grade` property.
+        """
+        return cls.get_non_rubric_grade_per_work(assignment).filter(
+            cls.id.in_(work_ids)
+        ).union_all(
+            cls.get_rubric_grade_per_work(assignment).filter(
+                cls.id.in_(work_ids)
+            )
+        )
+
+    @classmethod
+    def preload_grades(cls, works: t.Iterable['Work']) -> None:
+        """Load the grades of the given submissions in bulk.
+
+        After calling this method the :attr:`.Work.grade` property of the given
+        submissions can be used without loading the rubric of every
+        submission separately. The loaded grade is forgotten when the grade or
+        the selected rubric items of a submission change.
+
+        :param works: The submissions to load the grades for.
+        :returns: Nothing.
+        """
+        works_per_assignment: t.Dict[int, t.List['Work']] = defaultdict(list)
+        for work in works:
+            works_per_assignment[work.assignment_id].append(work)
+
+        for assig_works in works_per_assignment.values():
+            grades = dict(
+                cls.get_grade_per_work(
+                    assig_works[0].assignment,
+                    [work.id for work in assig_works],
+                )
+            )
+            for work in assig_works:
+                work._preloaded_grade = grades.get(work.id)
+
+    def _clear_preloaded_grade(self, *_: object) -> None:
+        self._preloaded_grade = helpers.MISSING
+
     @property
     def grade(self) -> t.Optional[float]:
         """Get the actual current grade for this work.
@@ -392,6 +447,9 @@ class Work(Base):
 
         :returns: The current grade for this work.
         """
+        if not isinstance(self._preloaded_grade, helpers.MissingType):
+            return self._preloaded_grade
+
         if self._grade is None:
             if not self.selected_items:
                 return None
@@ -445,6 +503,7 @@ class Work(Base):
         """
         assert grade_origin != GradeOrigin.human or user is not None
 
+        self._clear_preloaded_grade()
         if new_grade is not helpers.MISSING:
             assert isinstance(new_grade, (float, int, type(None)))
             self._grade = new_grade
@@ -699,42 +758,109 @@ class Work(Base):
             )
         )
 
-    def get_user_feedback(self) -> t.Iterable[str]:
-        """Get all user given feedback for this work.
+    @staticmethod
+    def _load_files_of_works(work_ids: t.Collection[int]) -> None:
+        """Load all files of the given submissions, so that the paths of
+        these files can be computed without doing any queries.
+        """
+        file_models.File.query.filter(
+            file_models.File.work_id.in_(work_ids)
+        ).all()
 
-        :returns: An iterator producing human readable representations of the
-            feedback given by a person.
+    @classmethod
+    def get_user_feedback_per_work(
+        cls,
+        works: t.Sequence['Work'],
+        may_see_reply: t.Callable[[CommentReply], bool],
+    ) -> t.Mapping[int, t.List[str]]:
+        """Get all user given feedback for the given submissions.
+
+        :param works: The submissions to get the feedback for.
+        :param may_see_reply: Function that should return ``True`` if the
+            current user may see the given reply.
+        :returns: A mapping from the id of every given submission to a list
+            of human readable representations of the feedback given by a
+            person.
         """
-        comments = CommentBase.query.filter(
-            CommentBase.file.has(work=self),
+        res: t.Dict[int, t.List[str]] = {work.id: [] for work in works}
+        if not res:
+            return res
+
+        cls._load_files_of_works(res.keys())
+        comments = CommentBase.query.join(
+            CommentBase.file,
+        ).filter(
+            file_models.File.work_id.in_(res.keys()),
         ).order_by(
             CommentBase.file_id.asc(),
             CommentBase.line.asc(),
+        ).options(
+            selectinload(CommentBase.replies).selectinload(
+                CommentReply.author
+            ),
         )
         for com in comments:
             path = com.file.get_path()
             line = com.line + 1
-            for idx, reply in enumerate(com.user_visible_replies):
-                yield f'{path}:{line}:{idx + 1}: {reply.comment}'
+            visible_replies = (r for r in com.replies if may_see_reply(r))
+            for idx, reply in enumerate(visible_replies):
+                res[com.file.work_id].append(
+                    f'{path}:{line}:{idx + 1}: {reply.comment}'
+                )
+        return res
 
-    def get_linter_feedback(self) -> t.Iterable[str]:
-        """Get all linter feedback for this work.
+    @classmethod
+    def get_linter_feedback_per_work(cls, works: t.Sequence['Work']
+                                     ) -> t.Mapping[int, t.List[str]]:
+        """Get all linter feedback for the given submissions.
 
-        :returns: An iterator that produces the all feedback given on this work
-            by linters.
+        :param works: The submissions to get the feedback for.
+        :returns: A mapping from the id of every given submission to a list
+            of all feedback given on this submission by linters.
         """
-        linter_comments = LinterComment.query.filter(
-            LinterComment.file.has(work=self)
+        res: t.Dict[int, t.List[str]] = {work.id: [] for work in works}
+        if not res:
+            return res
+
+        cls._load_files_of_works(res.keys())
+        linter_comments = LinterComment.query.join(
+            LinterComment.file,
+        ).filter(
+            file_models.File.work_id.in_(res.keys()),
         ).order_by(
             LinterComment.file_id.asc(),
             LinterComment.line.asc(),
+        ).options(
+            selectinload(LinterComment.linter).selectinload(
+                LinterInstance.tester
+            ),
         )
         for line_comm in linter_comments:
-            yield (
+            res[line_comm.file.work_id].append(
                 f'{line_comm.file.get_path()}:{line_comm.line + 1}:1: '
                 f'({line_comm.linter.tester.name}'
                 f' {line_comm.linter_code}) {line_comm.comment}'
             )
+        return res
+
+    def get_user_feedback(self) -> t.Iterable[str]:
+        """Get all user given feedback for this work.
+
+        :returns: An iterator producing human readable representations of the
+            feedback given by a person.
+        """
+        return self.get_user_feedback_per_work(
+            [self],
+            lambda reply: reply.perm_checker.ensure_may_see.as_bool(),
+        )[self.id]
+
+    def get_linter_feedback(self) -> t.Iterable[str]:
+        """Get all linter feedback for this work.
+
+        :returns: An iterator that produces the all feedback given on this work
+            by linters.
+        """
+        return self.get_linter_feedback_per_work([self])[self.id]
 
     def remove_selected_rubric_item(self, row_id: int) -> None:
         """Deselect selected :class:`.RubricItem` on row.
@@ -958,6 +1084,40 @@ class Work(Base):
         """
         return self.user.contains_user(user)
 
+    def get_zip_entries(
+        self,
+        exclude_owner: 'file_models.FileOwner',
+        create_leading_directory: bool = True,
+        prefix: str = '',
+    ) -> t.Iterator[t.Tuple[str, t.Optional[str]]]:
+        """Get the entries of a zip archive of this submission.
+
+        The files are read directly from the upload directory, so nothing is
+        restored to disk.
+
+        :param exclude_owner: Which files to exclude.
+        :param create_leading_directory: Should the top directory of the
+            submission be included in the archive.
+        :param prefix: A directory (ending with a ``/``) in which all files
+            should be placed in the archive.
+        :returns: Entries that can be passed to :func:`psef.files.stream_zip`.
+        """
+        code = psef.helpers.filter_single_or_404(
+            file_models.File,
+            file_models.File.work_id == self.id,
+            file_models.File.parent_id.is_(None),
+            file_models.File.fileowner != exclude_owner,
+            ~file_models.File.self_deleted,
+        )
+        cache = self.get_file_children_mapping(exclude_owner)
+        leading_len = 0 if create_leading_directory else len(code.name) + 1
+
+        for path, f in psef.files.walk_file_tree(code, cache):
+            if not f.is_directory:
+                yield f'{prefix}{path[leading_len:]}', f.get_diskname()
+            elif f is code and create_leading_directory:
+                yield f'{prefix}{path}', None
+
     def create_zip(
         self,
         exclude_owner: 'file_models.FileOwner',
@@ -970,31 +1130,11 @@ class Work(Base):
         """
         path, name = psef.files.random_file_path(True)
 
-        with open(
-            path,
-            'w+b',
-        ) as f, tempfile.TemporaryDirectory(
-            suffix='dir',
-        ) as tmpdir, zipfile.ZipFile(
-            f,
-            'w',
-            compression=zipfile.ZIP_DEFLATED,
-        ) as zipf:
-            # Restore the files to tmpdir
-            tree_root = psef.files.restore_directory_structure(
-                self, tmpdir, exclude_owner
-            )
-
-            if create_leading_directory:
-                zipf.write(tmpdir, tree_root.name)
-                leading_len = len(tmpdir)
-            else:
-                leading_len = len(tmpdir) + len('/') + len(tree_root.name)
-
-            for root, _dirs, files in os.walk(tmpdir):
-                for file in files:
-                    path = psef.files.safe_join(root, file)
-                    zipf.write(path, path[leading_len:])
+        with open(path, 'wb') as f:
+            for chunk in psef.files.stream_zip(
+                self.get_zip_entries(exclude_owner, create_leading_directory)
+            ):
+                f.write(chunk)
 
         return name
 
@@ -1074,3 +1214,26 @@ class Work(Base):
             undefer(cls.comment),
             selectinload(cls.comment_author),
         )
+
+
+# Make sure that grades loaded by ``Work.preload_grades`` are never outdated.
+# pylint: disable=protected-access
+for _event in ['expire', 'refresh']:
+    event.listen(Work, _event, Work._clear_preloaded_grade)
+for _event in ['append', 'remove', 'bulk_replace']:
+    event.listen(Work.selected_items, _event, Work._clear_preloaded_grade)
+event.listen(Work._grade, 'set', Work._clear_preloaded_grade)
+
+
+@event.listens_for(Work, 'after_insert')
+def _add_to_latest_submissions(
+    _mapper: object, connection: sqlalchemy.engine.Connection, work: Work
+) -> None:
+    assignment_models.AssignmentLatestSubmission.add_work(connection, work)
+
+
+@event.listens_for(Work, 'after_update')
+def _update_latest_submissions(
+    _mapper: object, connection: sqlalchemy.engine.Connection, work: Work
+) -> None:
+    assignment_models.AssignmentLatestSubmission.update_work(connection, work)
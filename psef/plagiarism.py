@@ -19,6 +19,10 @@ from . import files, errors, models, helpers, plagiarism_providers
 
 logger = structlog.get_logger()
 
+# The amount of plagiarism matches that are inserted into the database at
+# once.
+_MATCH_BATCH_SIZE = 1000
+
 
 def init_app(app: t.Any) -> None:
     """Initialize providers for the given flask app.
@@ -84,12 +88,13 @@ class Option:
 
 
 def process_output_csv(
+    plagiarism_run: models.PlagiarismRun,
     lookup_map: t.Dict[str, int],
     old_submissions: t.Container[int],
     file_tree_lookup: t.Dict[int, files.FileTree[int]],
     csvfile: str,
     delimiter: str = ';',
-) -> t.List[models.PlagiarismCase]:
+) -> None:
     """Process the outputted csv file into plagiarism cases with matches.
 
     Each line of the csvfile should have the following items separated by
@@ -108,6 +113,11 @@ def process_output_csv(
 
     Fields 5-10 can occur any number of times, but have to occur at least once.
 
+    The file is processed as a stream, and the matches are inserted into the
+    database in batches, so the file can be arbitrarily large. The cases and
+    matches are added to the current session, but not committed.
+
+    :param plagiarism_run: The run to which the found cases belong.
     :param lookup_map: A dictionary that should map the name of each toplevel
         directory to a submission id.
     :param old_submissions: Some sort of set that contains the ids of all
@@ -117,9 +127,31 @@ def process_output_csv(
         trees.
     :param csvfile: The location of the csv file that follow the above format.
     :param delimiter: The delimiter used for this csv file.
+    :returns: Nothing.
     """
-    res = []
     seen: t.Dict[t.Tuple[int, int], models.PlagiarismCase] = {}
+    path_indices: t.Dict[int, t.Dict[str, int]] = {}
+    # Matches are inserted in bulk, so they are not connected to their case
+    # by the ORM. Their case id is only available after the case is flushed.
+    pending_matches: t.List[
+        t.Tuple[models.PlagiarismCase, models.PlagiarismMatch]
+    ] = []
+
+    def get_file_id(sub_id: int, path: str) -> int:
+        if sub_id not in path_indices:
+            path_indices[sub_id] = files.build_filetree_index(
+                file_tree_lookup[sub_id]
+            )
+        return files.search_filetree_index(path_indices[sub_id], path)
+
+    def insert_pending_matches() -> None:
+        models.db.session.flush()
+        for case, match in pending_matches:
+            match.plagiarism_case_id = case.id
+        models.db.session.bulk_save_objects(
+            [match for _, match in pending_matches]
+        )
+        pending_matches.clear()
 
     with open(csvfile, newline='') as f:
         for dir1, dir2, match1, match2, *matches in csv.reader(
@@ -151,36 +183,33 @@ def process_output_csv(
                 match_max = max(float(match1), float(match2))
                 match_avg = (float(match1) + float(match2)) / 2
                 new_case = models.PlagiarismCase(
+                    plagiarism_run_id=plagiarism_run.id,
                     work1_id=sub1_id,
                     work2_id=sub2_id,
                     match_avg=match_avg,
                     match_max=match_max,
                 )
+                models.db.session.add(new_case)
                 seen[tup] = new_case
 
             for match in zip(*[iter(matches)] * 6):
                 fname1, fstart1, fend1, fname2, fstart2, fend2 = match
-                f_id1 = files.search_path_in_filetree(
-                    file_tree_lookup[sub1_id],
-                    fname1,
-                )
-                f_id2 = files.search_path_in_filetree(
-                    file_tree_lookup[sub2_id],
-                    fname2,
-                )
-                new_case.matches.append(
+                pending_matches.append((
+                    new_case,
                     models.PlagiarismMatch(
-                        file1_id=f_id1,
-                        file2_id=f_id2,
-                        file1_start=fstart1,
-                        file1_end=fend1,
-                        file2_start=fstart2,
-                        file2_end=fend2,
-                    )
-                )
-            res.append(new_case)
+                        file1_id=get_file_id(sub1_id, fname1),
+                        file2_id=get_file_id(sub2_id, fname2),
+                        file1_start=int(fstart1),
+                        file1_end=int(fend1),
+                        file2_start=int(fstart2),
+                        file2_end=int(fend2),
+                    ),
+                ))
+
+            if len(pending_matches) >= _MATCH_BATCH_SIZE:
+                insert_pending_matches()
 
-    return res
+    insert_pending_matches()
 
 
 class PlagiarismProvider(metaclass=abc.ABCMeta):
@@ -204,6 +233,18 @@ class PlagiarismProvider(metaclass=abc.ABCMeta):
         """
         return True
 
+    def supports_incremental(self) -> bool:
+        """Does this provider support incremental runs.
+
+        An incremental run only compares the new and changed submissions
+        against all submissions, this is only possible if the provider
+        supports archived submissions (i.e. ``'{ archive_dir }'``).
+
+        :returns: A boolean indicating if the provider supports incremental
+            runs.
+        """
+        return '{ archive_dir }' in self.get_program_call()
+
     @staticmethod
     def transform_csv(csvfile: str) -> str:
         """Transform the csv file outputed by the plagiarism checker to
@@ -324,7 +365,7 @@ class PlagiarismProvider(metaclass=abc.ABCMeta):
         """Set the options for this plagiarism provider.
 
         :param values: The options for this run, this can still include the
-            ``provider`` and ``old_assignments`` key.
+            ``provider``, ``old_assignments`` and ``incremental`` key.
         :returns: Nothing.
 
         :raises APIException: If the values are not the correct format, if
@@ -337,6 +378,7 @@ class PlagiarismProvider(metaclass=abc.ABCMeta):
         values.pop('old_assignments', None)
         values.pop('has_base_code', None)
         values.pop('has_old_submissions', None)
+        values.pop('incremental', None)
         seen = set()
 
         errs = []
@@ -419,3 +461,79 @@ class PlagiarismProvider(metaclass=abc.ABCMeta):
             :func:`subprocess.check_output`.
         """
         raise NotImplementedError
+
+
+FingerprintLocation = t.NamedTuple(  # pylint: disable=invalid-name
+    'FingerprintLocation', [('file_id', int), ('start', int), ('end', int)]
+)
+
+#: The fingerprints of a submission, mapping each hash to the first location
+#: in the submission where it was found.
+Fingerprints = t.Mapping[int, FingerprintLocation]
+
+
+class NativePlagiarismProvider(PlagiarismProvider):
+    """The (abstract) base class of providers that check for plagiarism within
+    the celery task itself.
+
+    Instead of calling an external program the task calls
+    :meth:`NativePlagiarismProvider.get_fingerprints` for every submission,
+    directly on the stored files, and passes the result to
+    :meth:`NativePlagiarismProvider.get_cases`. The found cases are saved
+    without ever writing a csv file.
+    """
+
+    @property
+    def matches_output(self) -> str:
+        """Native providers don't produce a csv file.
+        """
+        return ''
+
+    @staticmethod
+    def supports_progress() -> bool:
+        return True
+
+    @staticmethod
+    def get_progress_from_line(prefix: str,
+                               line: str) -> t.Optional[t.Tuple[int, int]]:
+        return None
+
+    def get_program_call(self) -> t.List[str]:
+        """Native providers don't call a program.
+        """
+        return []
+
+    @abc.abstractmethod
+    def get_fingerprints(
+        self, files: t.Iterable[t.Tuple[int, str, str]]
+    ) -> Fingerprints:
+        """Get the fingerprints of a single submission.
+
+        This method should not use the database or the app, as it is called
+        in separate processes. Both the provider and the result should be
+        picklable.
+
+        :param files: The files of the submission as tuples of the id of the
+            file, its path within the submission and its path on disk.
+        :returns: The fingerprints of the submission.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_cases(
+        self,
+        fingerprints: t.Mapping[int, Fingerprints],
+        old_submissions: t.Container[int],
+        base_code: Fingerprints,
+    ) -> t.List[models.PlagiarismCase]:
+        """Find the cases of possible plagiarism between the submissions.
+
+        :param fingerprints: A mapping from submission id to the fingerprints
+            of that submission.
+        :param old_submissions: The ids of the submissions that are old, no
+            cases should be produced between two of these submissions.
+        :param base_code: The fingerprints of the base code, these should be
+            ignored.
+        :returns: The found cases, including their matches.
+        """
+        raise NotImplementedError
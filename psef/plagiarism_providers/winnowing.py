@@ -0,0 +1,423 @@
+"""This module implements a plagiarism provider that uses winnowing.
+
+Winnowing is the algorithm used by MOSS, see "Winnowing: Local Algorithms for
+Document Fingerprinting" by Schleimer, Wilkerson and Aiken. Files are split
+into tokens, which are hashed in groups of ``k`` consecutive tokens, and of
+every window of ``w`` consecutive hashes the smallest hash is selected as a
+fingerprint. Two submissions that share a sequence of at least ``w + k - 1``
+tokens are guaranteed to share a fingerprint.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import re
+import math
+import zlib
+import typing as t
+import itertools
+import collections
+
+import psef.helpers
+
+from .. import models
+from .. import plagiarism as plag
+
+# Names that are kept while tokenizing, all other names are replaced by the
+# same token so that renaming variables doesn't hide plagiarism.
+_KEYWORDS = frozenset(
+    (
+        'and break case catch class const continue def default del do elif '
+        'else enum except extends finally for foreach from function if '
+        'implements import in interface lambda let match new not or pass '
+        'private protected public raise return static struct switch this '
+        'throw throws try var void where while with yield'
+    ).split()
+)
+
+_HASH_COMMENT = r'\#[^\n]*'
+_C_COMMENT = r'//[^\n]*|/\*.*?\*/'
+# Never matches, for files of which we don't know the comment syntax.
+_NO_COMMENT = r'(?!)'
+
+
+def _make_token_re(comment: str) -> t.Pattern[str]:
+    return re.compile(
+        r'''
+        (?P<comment>{comment})
+        |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+        |(?P<number>\d[\w.]*)
+        |(?P<name>[^\W\d]\w*)
+        |(?P<other>[^\s\w])
+        '''.format(comment=comment),
+        re.VERBOSE | re.DOTALL,
+    )
+
+
+_HASH_TOKEN_RE = _make_token_re(_HASH_COMMENT)
+_C_TOKEN_RE = _make_token_re(_C_COMMENT)
+_DEFAULT_TOKEN_RE = _make_token_re(_NO_COMMENT)
+
+# The regex used to tokenize a file by its extension. The comment syntax
+# differs per language, for example ``#include`` is code in C and ``//`` is
+# floor division in Python, so comments are only skipped for known languages.
+_TOKEN_RES: t.Mapping[str, t.Pattern[str]] = {
+    **{
+        ext: _HASH_TOKEN_RE
+        for ext in (
+            'py pyw pyx sh bash zsh rb pl pm r jl yml yaml toml coffee nim '
+            'ex exs tcl'
+        ).split()
+    },
+    **{
+        ext: _C_TOKEN_RE
+        for ext in (
+            'c h cc cpp cxx hh hpp hxx java js jsx mjs ts tsx cs go kt kts '
+            'scala swift rs dart groovy m mm'
+        ).split()
+    },
+    'php': _make_token_re(f'{_HASH_COMMENT}|{_C_COMMENT}'),
+}
+
+# Hashes that occur in more than this fraction of the submissions are
+# ignored, as these are almost always boilerplate. Hashes that occur in at
+# most ``_MIN_COMMON_SUBMISSIONS`` submissions (the same default as the ``-m``
+# option of MOSS) are never ignored, so small assignments still find
+# plagiarism between groups of students.
+_MAX_COMMON_FRACTION = 0.1
+_MIN_COMMON_SUBMISSIONS = 10
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+
+def _get_max_common_submissions(amount_of_submissions: int) -> int:
+    """Get the maximum amount of submissions a hash can occur in before it is
+    ignored.
+
+    >>> _get_max_common_submissions(5)
+    10
+    >>> _get_max_common_submissions(1000)
+    100
+    >>> _get_max_common_submissions(1001)
+    101
+
+    :param amount_of_submissions: The amount of submissions that are compared.
+    :returns: The maximum amount of submissions.
+    """
+    return max(
+        _MIN_COMMON_SUBMISSIONS,
+        math.ceil(amount_of_submissions * _MAX_COMMON_FRACTION),
+    )
+
+
+def _tokenize(code: str, path: str) -> t.Iterator[t.Tuple[int, int]]:
+    """Split the given code into tokens.
+
+    >>> def count(code, path):
+    ...     return len(list(_tokenize(code, path)))
+    >>> count('a // b', 'test.py'), count('a // b', 'test.c')
+    (4, 1)
+    >>> count('#include <a>', 'test.c'), count('#include <a>', 'test.py')
+    (5, 0)
+    >>> count('a # b', 'test.txt')
+    3
+
+    :param code: The code to tokenize.
+    :param path: The path of the file of the code, its extension determines
+        which comment syntax is used.
+    :returns: An iterator of tuples of the hash of a token and the (zero
+        based) line on which it starts.
+    """
+    ext = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    token_re = _TOKEN_RES.get(ext, _DEFAULT_TOKEN_RE)
+
+    line = 0
+    last_pos = 0
+    for match in token_re.finditer(code):
+        line += code.count('\n', last_pos, match.start())
+        last_pos = match.start()
+
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        elif kind == 'string':
+            token = '"'
+        elif kind == 'number':
+            token = '0'
+        elif kind == 'name' and match.group() not in _KEYWORDS:
+            token = 'N'
+        else:
+            token = match.group()
+
+        yield zlib.crc32(token.encode('utf8')), line
+
+
+def _winnow(
+    tokens: t.Sequence[t.Tuple[int, int]],
+    kgram_size: int,
+    window_size: int,
+) -> t.Iterator[t.Tuple[int, int, int]]:
+    """Select the fingerprints of a sequence of tokens.
+
+    :param tokens: The tokens as produced by :func:`_tokenize`.
+    :param kgram_size: The amount of tokens in a single hash.
+    :param window_size: The amount of hashes in a single window.
+    :returns: An iterator of the selected fingerprints as tuples of the hash,
+        the line on which the hashed tokens start and the line on which they
+        end.
+    """
+    kgrams: t.List[t.Tuple[int, int, int]] = []
+    power = pow(_HASH_BASE, kgram_size - 1, _HASH_MOD)
+    cur = 0
+    for idx, (token, line) in enumerate(tokens):
+        if idx >= kgram_size:
+            cur -= tokens[idx - kgram_size][0] * power
+        cur = (cur * _HASH_BASE + token) % _HASH_MOD
+        if idx >= kgram_size - 1:
+            kgrams.append((cur, tokens[idx - kgram_size + 1][1], line))
+
+    # The indices of the hashes in the current window that can still become
+    # the minimum, their hashes are increasing.
+    window: t.Deque[int] = collections.deque()
+    last_selected = -1
+    for idx, kgram in enumerate(kgrams):
+        while window and kgrams[window[-1]][0] >= kgram[0]:
+            window.pop()
+        window.append(idx)
+        if window[0] <= idx - window_size:
+            window.popleft()
+
+        if (
+            idx >= window_size - 1 or idx == len(kgrams) - 1
+        ) and window[0] != last_selected:
+            last_selected = window[0]
+            yield kgrams[last_selected]
+
+
+def _merge_locations(
+    locations: t.List[t.Tuple[plag.FingerprintLocation, plag.
+                              FingerprintLocation]]
+) -> t.Iterator[models.PlagiarismMatch]:
+    """Merge the locations of shared fingerprints into matches.
+
+    Locations that overlap, or are adjacent, in both files are merged into a
+    single match.
+
+    :param locations: The locations of the shared fingerprints in the first
+        and second submission.
+    :returns: The merged matches.
+    """
+    locations.sort(
+        key=lambda loc: (loc[0].file_id, loc[1].file_id, loc[0].start)
+    )
+    cur: t.Optional[t.List[int]] = None
+
+    for loc1, loc2 in locations:
+        if (
+            cur is not None and loc1.file_id == cur[0] and
+            loc2.file_id == cur[3] and loc1.start <= cur[2] + 1 and
+            cur[4] <= loc2.start <= cur[5] + 1
+        ):
+            cur[2] = max(cur[2], loc1.end)
+            cur[5] = max(cur[5], loc2.end)
+            continue
+
+        if cur is not None:
+            yield models.PlagiarismMatch(
+                file1_id=cur[0],
+                file1_start=cur[1],
+                file1_end=cur[2],
+                file2_id=cur[3],
+                file2_start=cur[4],
+                file2_end=cur[5],
+            )
+        cur = [*loc1, *loc2]
+
+    if cur is not None:
+        yield models.PlagiarismMatch(
+            file1_id=cur[0],
+            file1_start=cur[1],
+            file1_end=cur[2],
+            file2_id=cur[3],
+            file2_start=cur[4],
+            file2_end=cur[5],
+        )
+
+
+class Winnowing(plag.NativePlagiarismProvider):
+    """This class implements a plagiarism provider using winnowing.
+
+    It works for any (textual) language, as it only uses a simple generic
+    tokenizer. Comments are only skipped in files of which the language is
+    known by their extension.
+    """
+
+    def __init__(self) -> None:
+        self.suffixes: t.Optional[t.List[str]] = None
+        self.simil: float = 50
+        self.kgram_size: int = 10
+        self.window_size: int = 5
+
+    @staticmethod
+    def get_options() -> t.Sequence[plag.Option]:
+        """Get all possible options for winnowing.
+
+        :returns: The possible options.
+        """
+        return [
+            plag.Option(
+                "suffixes",
+                "Suffixes to include",
+                (
+                    "The suffixes of the files that should be checked, "
+                    "separated by commas. By default all files are checked."
+                ),
+                plag.OptionTypes.strvalue,
+                False,
+                None,
+                placeholder='.xxx, .yyy',
+            ),
+            plag.Option(
+                "simil",
+                "Minimal similarity",
+                (
+                    "The minimal average similarity needed before a pair is "
+                    "considered plagiarism. The similarity of a submission is"
+                    " the percentage of its fingerprints that are also found"
+                    " in the other submission. The default is 50."
+                ),
+                plag.OptionTypes.numbervalue,
+                False,
+                None,
+                placeholder='default: 50',
+            ),
+            plag.Option(
+                "kgram_size",
+                "Token sequence length",
+                (
+                    "The amount of consecutive tokens that are hashed "
+                    "together. Lower values find smaller matches, but also "
+                    "more false positives. The default is 10."
+                ),
+                plag.OptionTypes.numbervalue,
+                False,
+                None,
+                placeholder='default: 10',
+            ),
+            plag.Option(
+                "window_size",
+                "Window size",
+                (
+                    "The amount of hashes of which the smallest is used as a"
+                    " fingerprint. Matches of at least the window size plus"
+                    " the token sequence length minus one tokens are always"
+                    " found. The default is 5."
+                ),
+                plag.OptionTypes.numbervalue,
+                False,
+                None,
+                placeholder='default: 5',
+            ),
+        ]
+
+    def _set_provider_values(
+        self, values: t.Dict[str, psef.helpers.JSONType]
+    ) -> None:
+        """Set the options for winnowing.
+
+        :param values: The values to be set.
+        :returns: Nothing.
+        """
+        if 'suffixes' in values:
+            self.suffixes = [
+                suffix.strip()
+                for suffix in str(values['suffixes']).split(',')
+                if suffix.strip()
+            ] or None
+        if 'simil' in values:
+            assert isinstance(values['simil'], (int, float))
+            self.simil = values['simil']
+        if 'kgram_size' in values:
+            assert isinstance(values['kgram_size'], (int, float))
+            self.kgram_size = max(1, int(values['kgram_size']))
+        if 'window_size' in values:
+            assert isinstance(values['window_size'], (int, float))
+            self.window_size = max(1, int(values['window_size']))
+
+    def get_fingerprints(
+        self, files: t.Iterable[t.Tuple[int, str, str]]
+    ) -> plag.Fingerprints:
+        res: t.Dict[int, plag.FingerprintLocation] = {}
+
+        for file_id, path, disk_path in files:
+            if self.suffixes is not None and not path.endswith(
+                tuple(self.suffixes)
+            ):
+                continue
+
+            with open(disk_path, 'rb') as f:
+                content = f.read()
+            # Binary files cannot be tokenized in a meaningful way.
+            if b'\0' in content:
+                continue
+
+            tokens = list(_tokenize(content.decode('utf8', 'replace'), path))
+            for digest, start, end in _winnow(
+                tokens, self.kgram_size, self.window_size
+            ):
+                res.setdefault(
+                    digest, plag.FingerprintLocation(file_id, start, end)
+                )
+
+        return res
+
+    def get_cases(
+        self,
+        fingerprints: t.Mapping[int, plag.Fingerprints],
+        old_submissions: t.Container[int],
+        base_code: plag.Fingerprints,
+    ) -> t.List[models.PlagiarismCase]:
+        # Inverted index from hash to the submissions containing it.
+        index: t.DefaultDict[int, t.List[int]] = collections.defaultdict(list)
+        for work_id, prints in sorted(fingerprints.items()):
+            for digest in prints:
+                if digest not in base_code:
+                    index[digest].append(work_id)
+
+        max_common = _get_max_common_submissions(len(fingerprints))
+        # The amount of hashes of every submission that are not ignored,
+        # which is used to calculate the similarity.
+        amount_hashes: t.Counter[int] = collections.Counter()
+        shared: t.DefaultDict[t.Tuple[int, int], t.List[int]
+                              ] = collections.defaultdict(list)
+        for digest, work_ids in index.items():
+            if len(work_ids) > max_common:
+                continue
+            amount_hashes.update(work_ids)
+            for work1_id, work2_id in itertools.combinations(work_ids, 2):
+                if work1_id in old_submissions and work2_id in old_submissions:
+                    continue
+                shared[(work1_id, work2_id)].append(digest)
+
+        res = []
+        for (work1_id, work2_id), digests in shared.items():
+            match1 = 100 * len(digests) / amount_hashes[work1_id]
+            match2 = 100 * len(digests) / amount_hashes[work2_id]
+            if (match1 + match2) / 2 < self.simil:
+                continue
+
+            prints1 = fingerprints[work1_id]
+            prints2 = fingerprints[work2_id]
+            res.append(
+                models.PlagiarismCase(
+                    work1_id=work1_id,
+                    work2_id=work2_id,
+                    match_avg=(match1 + match2) / 2,
+                    match_max=max(match1, match2),
+                    matches=list(
+                        _merge_locations([(prints1[digest], prints2[digest])
+                                          for digest in digests])
+                    ),
+                )
+            )
+
+        return res
@@ -16,13 +16,15 @@ import typing as t
 import datetime
 import tempfile
 import itertools
+import multiprocessing
 from operator import itemgetter
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
 import structlog
 from flask import Flask
 from celery import signals, current_task
 from requests import RequestException
-from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
 from mypy_extensions import NamedArg, DefaultNamedArg
 from celery.schedules import crontab
 from typing_extensions import Literal
@@ -37,6 +39,10 @@ logger = structlog.get_logger()
 
 celery = cg_celery.CGCelery('psef', signals)  # pylint: disable=invalid-name
 
+# The amount of submissions that are loaded from the database at once when
+# preparing a plagiarism run.
+_PLAGIARISM_BATCH_SIZE = 100
+
 
 def init_app(app: Flask) -> None:
     """Setup the tasks for psef.
@@ -62,6 +68,10 @@ def init_app(app: Flask) -> None:
             crontab(minute='0', hour='18', day_of_month='5'),
             _send_weekly_notifications.si(),
         )
+        celery.add_periodic_task(
+            crontab(minute='0', hour='3'),
+            _collect_orphaned_blobs_1.si(),
+        )
 
 
 @celery.task
@@ -137,6 +147,91 @@ def _send_grader_status_mail_1(
         p.mail.send_grader_status_changed_mail(assig, user)
 
 
+def _run_native_plagiarism_control(
+    plagiarism_run: p.models.PlagiarismRun,
+    provider: p.plagiarism.NativePlagiarismProvider,
+    sub_ids: t.List[int],
+    main_sub_ids: t.Set[int],
+    base_code_dir: t.Optional[str],
+) -> None:
+    def set_state(state: p.models.PlagiarismState) -> None:
+        plagiarism_run.state = state
+        p.models.db.session.commit()
+
+    set_state(p.models.PlagiarismState.parsing)
+
+    # The files are read directly from the upload directory, so nothing needs
+    # to be restored. The fingerprints of a batch are computed by a pool of
+    # processes while the next batch is loaded from the database, as
+    # computing fingerprints is CPU bound. The celery workers are daemonic
+    # processes of ``billiard``, but the ``multiprocessing`` module doesn't
+    # know this, so it allows us to start (non daemonic) children. We fork so
+    # that the provider doesn't have to be importable from a fresh
+    # interpreter, the children never use the inherited database connection.
+    fingerprints: t.Dict[int, p.plagiarism.Fingerprints] = {}
+    pending: t.List[t.Tuple[int, Future]] = []
+
+    def wait_for_pending() -> None:
+        for sub_id, future in pending:
+            fingerprints[sub_id] = future.result()
+            if sub_id in main_sub_ids:
+                done = plagiarism_run.submissions_done or 0
+                plagiarism_run.submissions_done = done + 1
+        p.models.db.session.commit()
+
+    try:
+        with ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context('fork')
+        ) as pool:
+            for chunk in p.helpers.chunkify(sub_ids, _PLAGIARISM_BATCH_SIZE):
+                new_pending = []
+                for sub in p.models.Work.query.filter(
+                    t.cast(p.models.DbColumn[int], p.models.Work.id).in_(chunk)
+                ):
+                    entries = p.files.RestorePlan.from_work(
+                        sub
+                    ).get_entries_with_ids()
+                    files = [
+                        (file_id, path, disk_path)
+                        for file_id, path, disk_path in entries
+                        if disk_path is not None
+                    ]
+                    new_pending.append(
+                        (sub.id, pool.submit(provider.get_fingerprints, files))
+                    )
+                wait_for_pending()
+                pending = new_pending
+            wait_for_pending()
+
+        base_code: p.plagiarism.Fingerprints = {}
+        if base_code_dir is not None:
+            base_code_files = []
+            for root, _, names in os.walk(base_code_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    base_code_files.append(
+                        (-1, os.path.relpath(path, base_code_dir), path)
+                    )
+            base_code = provider.get_fingerprints(base_code_files)
+
+        set_state(p.models.PlagiarismState.comparing)
+        cases = provider.get_cases(
+            fingerprints,
+            {sub_id for sub_id in sub_ids if sub_id not in main_sub_ids},
+            base_code,
+        )
+    except Exception:
+        set_state(p.models.PlagiarismState.crashed)
+        raise
+
+    set_state(p.models.PlagiarismState.finalizing)
+    plagiarism_run.log = (
+        f'Compared {len(fingerprints)} submissions, found {len(cases)} cases.'
+    )
+    plagiarism_run.cases.extend(cases)
+    set_state(p.models.PlagiarismState.done)
+
+
 @celery.task
 def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-statements
     plagiarism_run_id: int,
@@ -145,6 +240,7 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
     call_args: t.List[str],
     base_code_dir: t.Optional[str],
     csv_location: str,
+    previous_run_id: t.Optional[int] = None,
 ) -> None:
     def at_end() -> None:
         if base_code_dir:
@@ -153,8 +249,8 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
     with p.helpers.defer(
         at_end,
     ), tempfile.TemporaryDirectory(
-    ) as result_dir, tempfile.TemporaryDirectory(
-    ) as tempdir, tempfile.TemporaryDirectory() as archive_dir:
+    ) as result_dir, p.files.restore_temp_dir(
+    ) as tempdir, p.files.restore_temp_dir() as archive_dir:
         plagiarism_run = p.models.PlagiarismRun.query.get(plagiarism_run_id)
 
         if plagiarism_run is None:  # pragma: no cover
@@ -171,6 +267,39 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
 
         set_state(p.models.PlagiarismState.started)
 
+        assig_ids = [main_assignment_id, *old_assignment_ids]
+        assigs = p.helpers.get_in_or_error(
+            p.models.Assignment,
+            t.cast(p.models.DbColumn[int], p.models.Assignment.id),
+            assig_ids,
+        )
+
+        sub_ids: t.List[int] = []
+        main_sub_ids: t.Set[int] = set()
+        for assig in assigs:
+            ids = [
+                sub_id for sub_id, in
+                assig.get_from_latest_submissions(p.models.Work.id)
+            ]
+            sub_ids.extend(ids)
+            if assig.id == main_assignment_id:
+                main_sub_ids.update(ids)
+                plagiarism_run.submissions_total = len(ids)
+                plagiarism_run.submissions_done = 0
+                p.models.db.session.commit()
+        sub_ids.sort()
+
+        provider = plagiarism_run.get_provider()
+        if isinstance(provider, p.plagiarism.NativePlagiarismProvider):
+            _run_native_plagiarism_control(
+                plagiarism_run,
+                provider,
+                sub_ids,
+                main_sub_ids,
+                base_code_dir,
+            )
+            return
+
         supports_progress = plagiarism_run.plagiarism_cls.supports_progress()
         progress_prefix = str(uuid.uuid4())
 
@@ -190,42 +319,98 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
         submission_lookup: t.Dict[str, int] = {}
         old_subs: t.Set[int] = set()
 
-        assig_ids = [main_assignment_id, *old_assignment_ids]
-        assigs = p.helpers.get_in_or_error(
-            p.models.Assignment,
-            t.cast(p.models.DbColumn[int], p.models.Assignment.id),
-            assig_ids,
-        )
-
-        chained: t.List[t.List[p.models.Work]] = []
-        for assig in assigs:
-            chained.append(assig.get_all_latest_submissions().all())
-            if assig.id == main_assignment_id:
-                plagiarism_run.submissions_total = len(chained[-1])
-                p.models.db.session.commit()
+        # For an incremental run the submissions that did not change since the
+        # previous run are archived, so they are only compared to the new and
+        # changed submissions. The cases between unchanged submissions are
+        # copied from the previous run.
+        previous_fingerprints: t.Dict[int, str] = {}
+        if previous_run_id is not None and archival_arg_present:
+            previous_fingerprints = dict(
+                p.models.db.session.query(
+                    p.models.PlagiarismFingerprint.work_id,
+                    p.models.PlagiarismFingerprint.fingerprint,
+                ).filter(
+                    p.models.PlagiarismFingerprint.plagiarism_run_id ==
+                    previous_run_id
+                )
+            )
+        unchanged_subs: t.Set[int] = set()
+
+        def restore(
+            sub_id: int,
+            plan: p.files.RestorePlan[int],
+            dir_name: str,
+        ) -> t.Tuple[str, bool]:
+            fingerprint = plan.get_fingerprint()
+            unchanged = previous_fingerprints.get(sub_id) == fingerprint
+            if unchanged or (
+                previous_run_id is None and archival_arg_present and
+                sub_id not in main_sub_ids
+            ):
+                parent = os.path.join(archive_dir, dir_name)
+            else:
+                parent = p.files.safe_join(tempdir, dir_name)
 
-        for sub in itertools.chain.from_iterable(chained):
-            main_assig = sub.assignment_id == main_assignment_id
+            os.mkdir(parent)
+            plan.execute(parent, p.files.RestoreMode.link)
+            return fingerprint, unchanged
 
-            dir_name = (
-                f'{sub.user.name} || {sub.assignment_id}'
-                f'-{sub.id}-{sub.user_id}'
-            )
-            submission_lookup[dir_name] = sub.id
-            parent = p.files.safe_join(tempdir, dir_name)
+        # The submissions are restored in batches by a pool of threads. As a
+        # restore plan doesn't need the database we can load the next batch
+        # while the previous one is being restored.
+        pending: t.List[t.Tuple[int, Future]] = []
 
-            if not main_assig:
-                old_subs.add(sub.id)
-                if archival_arg_present:
-                    parent = os.path.join(archive_dir, dir_name)
+        def wait_for_pending() -> None:
+            assert plagiarism_run is not None
+            for sub_id, future in pending:
+                fingerprint, unchanged = future.result()
+                p.models.db.session.add(
+                    p.models.PlagiarismFingerprint(
+                        plagiarism_run_id=plagiarism_run.id,
+                        work_id=sub_id,
+                        fingerprint=fingerprint,
+                    )
+                )
+                if unchanged:
+                    unchanged_subs.add(sub_id)
+                if sub_id in main_sub_ids:
+                    done = plagiarism_run.submissions_done or 0
+                    plagiarism_run.submissions_done = done + 1
+            p.models.db.session.commit()
 
-            os.mkdir(parent)
-            part_tree = p.files.restore_directory_structure(sub, parent)
-            file_lookup_tree[sub.id] = p.files.FileTree(
-                name=dir_name,
-                id=-1,
-                entries=[part_tree],
-            )
+        with ThreadPoolExecutor() as pool:
+            for chunk in p.helpers.chunkify(sub_ids, _PLAGIARISM_BATCH_SIZE):
+                new_pending = []
+                subs = p.models.Work.query.filter(
+                    t.cast(p.models.DbColumn[int], p.models.Work.id).in_(chunk)
+                ).options(
+                    joinedload(p.models.Work.user, innerjoin=True),
+                ).order_by(p.models.Work.id)
+
+                for sub in subs:
+                    dir_name = (
+                        f'{sub.user.name} || {sub.assignment_id}'
+                        f'-{sub.id}-{sub.user_id}'
+                    )
+                    submission_lookup[dir_name] = sub.id
+
+                    if sub.id not in main_sub_ids:
+                        old_subs.add(sub.id)
+
+                    plan = p.files.RestorePlan.from_work(sub)
+                    new_pending.append((
+                        sub.id,
+                        pool.submit(restore, sub.id, plan, dir_name),
+                    ))
+                    file_lookup_tree[sub.id] = p.files.FileTree(
+                        name=dir_name,
+                        id=-1,
+                        entries=[plan.tree],
+                    )
+
+                wait_for_pending()
+                pending = new_pending
+            wait_for_pending()
 
         if supports_progress:
             set_state(p.models.PlagiarismState.parsing)
@@ -256,14 +441,20 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
                 return True
             return False
 
-        try:
-            ok, stdout = p.helpers.call_external(
-                call_args, got_output, nice_level=10
-            )
-        # pylint: disable=broad-except
-        except Exception:  # pragma: no cover
-            set_state(p.models.PlagiarismState.crashed)
-            raise
+        # An incremental run doesn't need to call the provider if nothing
+        # changed since the previous run.
+        compare_any = previous_run_id is None or bool(os.listdir(tempdir))
+        if not compare_any:
+            ok, stdout = True, 'No submissions changed since the previous run.'
+        else:
+            try:
+                ok, stdout = p.helpers.call_external(
+                    call_args, got_output, nice_level=10
+                )
+            # pylint: disable=broad-except
+            except Exception:  # pragma: no cover
+                set_state(p.models.PlagiarismState.crashed)
+                raise
         logger.info(
             'Plagiarism call finished',
             finished_successfully=ok,
@@ -275,12 +466,31 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
         plagiarism_run.log = stdout
         if ok:
             csv_file = os.path.join(result_dir, csv_location)
-            csv_file = plagiarism_run.plagiarism_cls.transform_csv(csv_file)
+            if compare_any:
+                csv_file = plagiarism_run.plagiarism_cls.transform_csv(
+                    csv_file
+                )
+                p.plagiarism.process_output_csv(
+                    plagiarism_run,
+                    submission_lookup,
+                    old_subs | unchanged_subs,
+                    file_lookup_tree,
+                    csv_file,
+                )
 
-            for case in p.plagiarism.process_output_csv(
-                submission_lookup, old_subs, file_lookup_tree, csv_file
-            ):
-                plagiarism_run.cases.append(case)
+            if unchanged_subs:
+                case_cls = p.models.PlagiarismCase
+                reused_cases = case_cls.query.filter(
+                    case_cls.plagiarism_run_id == previous_run_id,
+                    t.cast(DbColumn[int], case_cls.work1_id).in_(
+                        list(unchanged_subs)
+                    ),
+                    t.cast(DbColumn[int], case_cls.work2_id).in_(
+                        list(unchanged_subs)
+                    ),
+                ).options(selectinload(case_cls.matches))
+                for case in reused_cases:
+                    plagiarism_run.cases.append(case.copy())
             set_state(p.models.PlagiarismState.done)
         else:
             set_state(p.models.PlagiarismState.crashed)
@@ -615,6 +825,16 @@ def _delete_file_at_time_1(
             pass
 
 
+@celery.task
+def _collect_orphaned_blobs_1() -> None:
+    # Stale restore directories keep blobs alive, so they are removed first.
+    removed_dirs = p.files.remove_stale_restore_dirs()
+    logger.info('Removed stale restore dirs', amount_removed=removed_dirs)
+
+    removed = p.files.collect_orphaned_blobs()
+    logger.info('Removed orphaned blobs', amount_removed=removed)
+
+
 @celery.task
 def _add_1(first: int, second: int) -> int:  # pragma: no cover
     """This function is used for testing if celery works. What it actually does
@@ -7,15 +7,19 @@ SPDX-License-Identifier: AGPL-3.0-only
 """
 import os
 import json
+import base64
 import shutil
 import typing as t
+import inspect
 import datetime
 from collections import defaultdict
 
 import werkzeug
 import structlog
+import sqlalchemy
 from flask import request
-from sqlalchemy.orm import joinedload, selectinload
+from typing_extensions import TypedDict
+from sqlalchemy.orm import undefer, joinedload, selectinload
 
 import psef
 import psef.files
@@ -34,12 +38,16 @@ from cg_sqlalchemy_helpers import expression as sql_expression
 from . import api
 from .. import (
     auth, tasks, ignore, models, archive, helpers, linters, parsers, db_locks,
-    features, registry, plagiarism
+    features, registry, gradebook, plagiarism
 )
 from ..permissions import CoursePermission as CPerm
 
 logger = structlog.get_logger()
 
+# The amount of linter instances that are linted by a single task, all
+# instances of a task are linted in parallel.
+_LINTER_TASK_SIZE = 50
+
 
 @api.route('/assignments/', methods=['GET'])
 @auth.login_required
@@ -184,22 +192,32 @@ def get_assignments_feedback(assignment_id: int) -> JSONResponse[
             models.Work.user_submissions_filter(current_user),
         )
 
-    res = {}
-    for sub in latest_subs:
-        perms = auth.WorkPermissions(sub)
-        item: t.MutableMapping[str, t.Union[str, t.Sequence[str]]] = {
-            'general': '',
-            'linter': [],
-            'user': list(sub.get_user_feedback()),
-        }
+    subs = latest_subs.options(undefer(models.Work.comment)).all()
+    if not subs:
+        return jsonify({})
 
-        if perms.ensure_may_see_general_feedback.as_bool():
-            item['general'] = sub.comment or ''
+    # All submissions are in the same assignment and are either all by the
+    # current user or the user can see the work of others, so the permissions
+    # only have to be checked once.
+    first_perms = auth.WorkPermissions(subs[0])
+    may_see_general = first_perms.ensure_may_see_general_feedback.as_bool()
+    may_see_linter = first_perms.ensure_may_see_linter_feedback.as_bool()
 
-        if perms.ensure_may_see_linter_feedback.as_bool():
-            item['linter'] = list(sub.get_linter_feedback())
+    user_feedback = models.Work.get_user_feedback_per_work(
+        subs, auth.get_feedback_reply_visibility_checker(assignment)
+    )
+    linter_feedback = (
+        models.Work.get_linter_feedback_per_work(subs)
+        if may_see_linter else {}
+    )
 
-        res[str(sub.id)] = item
+    res = {}
+    for sub in subs:
+        res[str(sub.id)] = {
+            'general': (sub.comment or '') if may_see_general else '',
+            'linter': linter_feedback.get(sub.id, []),
+            'user': user_feedback[sub.id],
+        }
 
     return jsonify(res)
 
@@ -1238,15 +1256,61 @@ def get_all_works_by_user_for_assignment(
     user = helpers.get_or_404(models.User, user_id)
     auth.WorksByUserPermissions(assignment, user).ensure_may_see()
 
-    return extended_jsonify(
-        models.Work.update_query_for_extended_jsonify(
-            models.Work.query.filter_by(
-                assignment_id=assignment_id, user_id=user.id, deleted=False
-            )
-        ).order_by(models.Work.created_at.desc()).all(),
-        use_extended=models.Work,
+    works = models.Work.update_query_for_extended_jsonify(
+        models.Work.query.filter_by(
+            assignment_id=assignment_id, user_id=user.id, deleted=False
+        )
+    ).order_by(models.Work.created_at.desc()).all()
+    models.Work.preload_grades(works)
+
+    return extended_jsonify(works, use_extended=models.Work)
+
+
+def _get_visible_works_query(
+    assignment_id: int
+) -> models.MyQuery[models.Work]:
+    """Get a query of all submissions in the given assignment that the
+    current user may see.
+
+    :param assignment_id: The id of the assignment.
+    :returns: The query for the submissions, which is not ordered yet.
+    """
+    assignment = helpers.get_or_404(
+        models.Assignment,
+        assignment_id,
+        also_error=lambda a: not a.is_visible
     )
 
+    auth.ensure_permission(CPerm.can_see_assignments, assignment.course_id)
+
+    if assignment.is_hidden:
+        auth.ensure_permission(
+            CPerm.can_see_hidden_assignments, assignment.course_id
+        )
+
+    if helpers.request_arg_true('latest_only'):
+        obj = assignment.get_all_latest_submissions(
+            include_old_user_submissions=True
+        )
+    else:
+        obj = models.Work.query.filter_by(
+            assignment_id=assignment_id, deleted=False
+        )
+
+    if not current_user.has_permission(
+        CPerm.can_see_others_work, course_id=assignment.course_id
+    ):
+        obj = obj.filter(
+            sql_expression.or_(
+                models.Work.user_submissions_filter(current_user),
+                models.Work.peer_feedback_submissions_filter(
+                    current_user, assignment
+                )
+            )
+        )
+
+    return obj
+
 
 @api.route('/assignments/<int:assignment_id>/submissions/', methods=['GET'])
 def get_all_works_for_assignment(
@@ -1272,6 +1336,145 @@ def get_all_works_for_assignment(
     :raises PermissionException: If the assignment is hidden and the user is
                                  not allowed to view it. (INCORRECT_PERMISSION)
     """
+    obj = _get_visible_works_query(assignment_id)
+
+    works = models.Work.update_query_for_extended_jsonify(obj).order_by(
+        t.cast(t.Any, models.Work.created_at).desc()
+    ).all()
+    models.Work.preload_grades(works)
+
+    if helpers.extended_requested():
+        return extended_jsonify(works, use_extended=models.Work)
+    else:
+        return jsonify(works)
+
+
+class WorkPage(TypedDict):
+    """A single page of submissions.
+    """
+    #: The cursor to pass to get the next page, ``None`` if this is the last
+    #: page.
+    next_cursor: t.Optional[str]
+    #: The submissions of this page.
+    submissions: WorkList
+
+
+def _make_work_cursor(created_at: DatetimeWithTimezone, work_id: int) -> str:
+    # The cursor is encoded so that clients can pass it back in a query
+    # parameter without having to escape it.
+    data = json.dumps([created_at.isoformat(), work_id]).encode('utf8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _parse_work_cursor(cursor: str) -> t.Tuple[DatetimeWithTimezone, int]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, work_id = json.loads(data)
+        return DatetimeWithTimezone.parse_isoformat(created_at), int(work_id)
+    except (ValueError, TypeError) as exc:
+        raise APIException(
+            'The given cursor is not valid',
+            f'The cursor "{cursor}" could not be parsed',
+            APICodes.INVALID_PARAM, 400
+        ) from exc
+
+
+@api.route(
+    '/assignments/<int:assignment_id>/submissions/page', methods=['GET']
+)
+def get_works_page_for_assignment(
+    assignment_id: int
+) -> t.Union[JSONResponse[WorkPage], ExtendedJSONResponse[WorkPage]]:
+    """Return a single page of the :class:`.models.Work` objects for the given
+    :class:`.models.Assignment`.
+
+    .. :quickref: Assignment; Get a page of works for an assignment.
+
+    The submissions are ordered from newest to oldest, and are serialized
+    while the response is being sent. This route accepts the same query
+    parameters as :func:`.get_all_works_for_assignment`.
+
+    :qparam str after: The ``next_cursor`` of the previous page, if not given
+        the first page is returned.
+    :qparam int page_size: The maximum amount of submissions in the page,
+        defaults to 50 and cannot be more than 250.
+
+    :param int assignment_id: The id of the assignment
+    :returns: A response containing the JSON serialized page, with the
+        submissions under the key ``submissions`` and the cursor of the next
+        page under the key ``next_cursor``.
+
+    :raises APIException: If the given cursor is not valid. (INVALID_PARAM)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the assignment is hidden and the user is
+                                 not allowed to view it. (INCORRECT_PERMISSION)
+    """
+    obj = _get_visible_works_query(assignment_id)
+    page_size = min(max(request.args.get('page_size', 50, type=int), 1), 250)
+
+    keys = obj.with_entities(models.Work.created_at, models.Work.id)
+    after = request.args.get('after')
+    if after is not None:
+        keys = keys.filter(
+            sqlalchemy.tuple_(models.Work.created_at, models.Work.id) <
+            sqlalchemy.tuple_(*_parse_work_cursor(after))
+        )
+    # We fetch one key extra so that we know whether there is a next page.
+    page = keys.order_by(
+        models.Work.created_at.desc(),
+        models.Work.id.desc(),
+    ).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last_created_at, last_id = page[-1]
+        next_cursor = _make_work_cursor(last_created_at, last_id)
+
+    def __get_works() -> t.Iterator[models.Work]:
+        for chunk in helpers.chunkify((work_id for _, work_id in page), 50):
+            works = models.Work.update_query_for_extended_jsonify(
+                models.Work.query.filter(models.Work.id.in_(chunk))
+            ).all()
+            models.Work.preload_grades(works)
+            lookup = {work.id: work for work in works}
+            for work_id in chunk:
+                yield lookup[work_id]
+
+    response_cls = (
+        ExtendedJSONResponse if helpers.extended_requested() else JSONResponse
+    )
+    return response_cls.make_stream(
+        {'next_cursor': next_cursor},
+        'submissions',
+        __get_works(),
+        use_extended=models.Work,
+    )
+
+
+@api.route('/assignments/<int:assignment_id>/submissions/zip', methods=['GET'])
+@auth.login_required
+def stream_all_works_zip(assignment_id: int) -> werkzeug.wrappers.Response:
+    """Download the latest submissions of all users for the given
+    :class:`.models.Assignment` as a single zip file.
+
+    .. :quickref: Assignment; Download all latest submissions as zip file.
+
+    The zip file is created while it is being sent, and the submissions are
+    loaded in batches, so the memory and disk usage of this route does not
+    depend on the size of the assignment. Every submission is placed in a
+    directory named after the author and the id of the submission.
+
+    :param int assignment_id: The id of the assignment
+    :returns: A response streaming the zip file.
+
+    :query str owner: The type of files to include, see
+        :meth:`.models.File.get_exclude_owner`.
+
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the user cannot see the work of others in
+        this course. (INCORRECT_PERMISSION)
+    """
     assignment = helpers.get_or_404(
         models.Assignment,
         assignment_id,
@@ -1279,44 +1482,83 @@ def get_all_works_for_assignment(
     )
 
     auth.ensure_permission(CPerm.can_see_assignments, assignment.course_id)
-
     if assignment.is_hidden:
         auth.ensure_permission(
             CPerm.can_see_hidden_assignments, assignment.course_id
         )
+    auth.ensure_permission(CPerm.can_see_others_work, assignment.course_id)
 
-    if helpers.request_arg_true('latest_only'):
-        obj = assignment.get_all_latest_submissions(
-            include_old_user_submissions=True
-        )
-    else:
-        obj = models.Work.query.filter_by(
-            assignment_id=assignment_id, deleted=False
+    exclude_owner = models.File.get_exclude_owner(
+        request.args.get('owner'), assignment.course_id
+    )
+    if exclude_owner == models.FileOwner.student:
+        auth.ensure_permission(
+            CPerm.can_edit_others_work, assignment.course_id
         )
 
-    obj = models.Work.update_query_for_extended_jsonify(obj).order_by(
-        t.cast(t.Any, models.Work.created_at).desc()
-    )
+    work_ids = [
+        work_id for work_id, in assignment.
+        get_from_latest_submissions(models.Work.id).order_by(models.Work.id)
+    ]
 
-    if not current_user.has_permission(
-        CPerm.can_see_others_work, course_id=assignment.course_id
-    ):
-        obj = obj.filter(
-            sql_expression.or_(
-                models.Work.user_submissions_filter(current_user),
-                models.Work.peer_feedback_submissions_filter(
-                    current_user, assignment
+    def __get_entries() -> t.Iterator[t.Tuple[str, t.Optional[str]]]:
+        for chunk in helpers.chunkify(work_ids, 50):
+            works = models.Work.query.filter(
+                t.cast(models.DbColumn[int], models.Work.id).in_(chunk)
+            ).options(joinedload(models.Work.user)).order_by(models.Work.id)
+            for work in works:
+                prefix = f'{work.user.name} - {work.id}'.replace('/', '_')
+                yield from work.get_zip_entries(
+                    exclude_owner, prefix=f'{prefix}/'
                 )
-            )
-        )
 
-    if helpers.extended_requested():
-        return extended_jsonify(
-            obj.all(),
-            use_extended=models.Work,
-        )
-    else:
-        return jsonify(obj.all())
+    return helpers.make_stream_response(
+        psef.files.stream_zip(__get_entries()),
+        f'{assignment.name}-submissions.zip',
+        mimetype='application/zip',
+    )
+
+
+@api.route('/assignments/<int:assignment_id>/gradebook', methods=['GET'])
+@auth.login_required
+def export_assignment_gradebook(
+    assignment_id: int
+) -> werkzeug.wrappers.Response:
+    """Export the grades and feedback of the latest submissions of all users
+    in the given :class:`.models.Assignment`.
+
+    .. :quickref: Assignment; Export the gradebook of an assignment.
+
+    The export is created while it is being sent, see
+    :func:`.gradebook.get_rows` for the exported data.
+
+    :qparam str format: The format of the export, either ``csv`` (the
+        default) or ``ndjson``.
+
+    :param int assignment_id: The id of the assignment
+    :returns: A response streaming the export.
+
+    :raises APIException: If the requested format is not supported.
+        (INVALID_PARAM)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the user cannot see the grades of others
+        in this course. (INCORRECT_PERMISSION)
+    """
+    assignment = helpers.get_or_404(
+        models.Assignment,
+        assignment_id,
+        also_error=lambda a: not a.is_visible
+    )
+
+    auth.ensure_can_see_assignment(assignment)
+    auth.ensure_permission(CPerm.can_see_others_work, assignment.course_id)
+    auth.ensure_permission(
+        CPerm.can_see_grade_before_open, assignment.course_id
+    )
+
+    return gradebook.make_response(
+        [assignment], f'{assignment.name}-gradebook'
+    )
 
 
 @api.route("/assignments/<int:assignment_id>/submissions/", methods=['POST'])
@@ -1595,12 +1837,8 @@ def start_linting(assignment_id: int) -> JSONResponse[models.AssignmentLinter]:
     if linter_cls.RUN_LINTER:
 
         def start_running_linter() -> None:
-            for i in range(0, len(res.tests), 10):
-                tasks.lint_instances(
-                    name,
-                    cfg,
-                    [t.id for t in res.tests[i:i + 10]],
-                )
+            for chunk in helpers.chunkify(res.tests, _LINTER_TASK_SIZE):
+                tasks.lint_instances(name, cfg, [t.id for t in chunk])
 
         helpers.callback_after_this_request(start_running_linter)
     else:
@@ -1673,6 +1911,9 @@ def start_plagiarism_check(
         used by the plagiarism checker.
     :<json has_old_submissions: Does this request contain old submissions that
         should be used by the plagiarism checker.
+    :<json incremental: Should this run reuse the cases of the previous
+        finished run with the same config, and only compare new and changed
+        submissions? This is optional and defaults to ``False``.
     :<json ``**rest``: The other options used by the provider, as indicated by
         ``/api/v1/plagiarism/``. Each key should be a possible option and its
         value is the value that should be used.
@@ -1702,9 +1943,12 @@ def start_plagiarism_check(
     old_assig_ids = t.cast(t.List[object], content['old_assignments'])
     has_old_submissions = t.cast(bool, content['has_old_submissions'])
     has_base_code = t.cast(bool, content['has_base_code'])
+    incremental = helpers.get_key_from_dict(content, 'incremental', False)
 
     json_config = json.dumps(sorted(content.items()))
-    if db.session.query(
+    # Incremental runs are meant to be repeated with the same config, for
+    # example after a student handed in late.
+    if not incremental and db.session.query(
         models.PlagiarismRun.query.filter_by(
             assignment_id=assignment_id, json_config=json_config
         ).exists()
@@ -1719,6 +1963,8 @@ def start_plagiarism_check(
         provider_cls = helpers.get_class_by_name(
             plagiarism.PlagiarismProvider, provider_name
         )
+        if inspect.isabstract(provider_cls):
+            raise ValueError
     except ValueError:
         raise APIException(
             'The given provider does not exist',
@@ -1778,6 +2024,14 @@ def start_plagiarism_check(
     provider: plagiarism.PlagiarismProvider = t.cast(t.Any, provider_cls)()
     provider.set_options(content)
 
+    if incremental and (has_base_code or not provider.supports_incremental()):
+        raise APIException(
+            'Incremental runs are not possible with this config', (
+                'Incremental runs are not possible with base code or with the'
+                f' provider "{provider_name}"'
+            ), APICodes.INVALID_PARAM, 400
+        )
+
     # If base code was provided check this now. We do this after all checking
     # as the task is responsible for cleaning the created directory, so any
     # exception after this point would mean that the directory won't be cleaned
@@ -1805,6 +2059,20 @@ def start_plagiarism_check(
 
     try:
         run = models.PlagiarismRun(json_config=json_config, assignment=assig)
+
+        previous_run_id = None
+        if incremental:
+            previous_run_id = next(
+                (
+                    other.id for other in models.PlagiarismRun.query.filter_by(
+                        assignment=assig,
+                        state=models.PlagiarismState.done,
+                    ).order_by(models.PlagiarismRun.created_at.desc())
+                    if other.incremental_config == run.incremental_config
+                ),
+                None,
+            )
+
         db.session.add(run)
         db.session.commit()
 
@@ -1818,6 +2086,7 @@ def start_plagiarism_check(
                 call_args=provider.get_program_call(),
                 base_code_dir=base_code_dir,
                 csv_location=provider.matches_output,
+                previous_run_id=previous_run_id,
             )
         )
     except:  # pylint: disable=broad-except; #pragma: no cover
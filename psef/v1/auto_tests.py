@@ -104,6 +104,7 @@ def _update_auto_test(
             new_file_name, filename = files.random_file_path()
             assert new_fixture.filename is not None
             new_fixture.save(new_file_name)
+            _, filename = files.store_file(new_file_name)
             auto_test.fixtures.append(
                 models.AutoTestFixture(
                     name=files.escape_logical_filename(new_fixture.filename),
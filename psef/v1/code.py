@@ -412,7 +412,7 @@ def split_code(
     if not code.is_directory:
         assert old_diskname is not None
         _, code.filename = files.random_file_path()
-        shutil.copyfile(old_diskname, code.get_diskname())
+        files.copy_stored_file(old_diskname, code.get_diskname())
     else:
         redistribute_directory(
             code, t.cast(models.File, models.File.query.get(old_id))
@@ -519,8 +519,9 @@ def update_code(file_id: int) -> JSONResponse[models.File]:
             db.session.flush()
             code.parent = new_parent
         else:
-            with open(code.get_diskname(), 'wb') as f:
-                f.write(request.get_data())
+            files.replace_stored_file(
+                code.get_diskname(), request.get_data()
+            )
 
     if code.work.assignment.is_open and current_user.id == code.work.user_id:
         current, other = models.FileOwner.both, models.FileOwner.teacher
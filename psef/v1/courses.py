@@ -7,6 +7,7 @@ SPDX-License-Identifier: AGPL-3.0-only
 import uuid
 import typing as t
 
+import werkzeug
 import flask_jwt_extended as flask_jwt
 from flask import request
 from sqlalchemy.orm import selectinload
@@ -26,7 +27,7 @@ from psef.helpers import (
 )
 
 from . import api
-from .. import limiter, parsers, features
+from .. import limiter, parsers, features, gradebook
 from ..lti.v1_1 import LTICourseRole
 from ..exceptions import (
     APICodes, APIWarnings, APIException, PermissionException
@@ -445,6 +446,45 @@ def get_all_course_assignments(
     return jsonify(course.get_all_visible_assignments())
 
 
+@api.route('/courses/<int:course_id>/gradebook', methods=['GET'])
+@auth.login_required
+def export_course_gradebook(course_id: int) -> werkzeug.wrappers.Response:
+    """Export the grades and feedback of the latest submissions in all
+    assignments of the given :class:`.models.Course`.
+
+    .. :quickref: Course; Export the gradebook of a course.
+
+    This works the same as exporting the gradebook of a single assignment,
+    only the rows of all visible assignments are included.
+
+    :qparam str format: The format of the export, either ``csv`` (the
+        default) or ``ndjson``.
+
+    :param int course_id: The id of the course
+    :returns: A response streaming the export.
+
+    :raises APIException: If the requested format is not supported.
+        (INVALID_PARAM)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the user cannot see the grades of others
+        in this course. (INCORRECT_PERMISSION)
+    """
+    auth.ensure_permission(CPerm.can_see_assignments, course_id)
+    auth.ensure_permission(CPerm.can_see_others_work, course_id)
+    auth.ensure_permission(CPerm.can_see_grade_before_open, course_id)
+
+    course = helpers.get_or_404(
+        models.Course,
+        course_id,
+        also_error=lambda c: c.virtual,
+    )
+
+    return gradebook.make_response(
+        sorted(course.get_all_visible_assignments(), key=lambda a: a.id),
+        f'{course.name}-gradebook',
+    )
+
+
 @api.route('/courses/<int:course_id>/assignments/', methods=['POST'])
 def create_new_assignment(course_id: int) -> JSONResponse[models.Assignment]:
     """Create a new course for the given assignment.
@@ -1329,11 +1369,13 @@ def get_user_submissions(
     latest_only = helpers.request_arg_true('latest_only')
 
     def get_subs(query: models.MyQuery[models.Work]) -> t.List[models.Work]:
-        return models.Work.update_query_for_extended_jsonify(
+        res = models.Work.update_query_for_extended_jsonify(
             query.filter(
                 models.Work.user_submissions_filter(user),
             )
         ).all()
+        models.Work.preload_grades(res)
+        return res
 
     if latest_only:
         subs = {}
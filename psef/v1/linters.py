@@ -46,6 +46,8 @@ def delete_linter_output(linter_id: str) -> EmptyResponse:
     auth.ensure_permission(CPerm.can_use_linter, linter.assignment.course_id)
 
     db.session.delete(linter)
+    db.session.flush()
+    models.LinterResultCache.clear_unused(linter.name, linter.config)
     db.session.commit()
 
     return make_empty_response()
@@ -6,6 +6,7 @@ the APIs in this module are mostly used to manipulate
 SPDX-License-Identifier: AGPL-3.0-only
 """
 import typing as t
+import inspect
 
 from sqlalchemy.orm import defaultload
 
@@ -195,6 +196,6 @@ def get_plag_opts() -> JSONResponse[t.List[t.Dict[str, object]]]:
             } for cls in sorted(
                 helpers.get_all_subclasses(plagiarism.PlagiarismProvider),
                 key=lambda o: o.__name__
-            )
+            ) if not inspect.isabstract(cls)
         ]
     )
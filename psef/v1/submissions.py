@@ -10,6 +10,7 @@ import numbers
 import itertools
 from collections import Counter, defaultdict
 
+import werkzeug
 import structlog
 import sqlalchemy.sql as sql
 from flask import request
@@ -185,6 +186,47 @@ def get_feedback(work: models.Work) -> t.Mapping[str, str]:
     return {'name': name, 'output_name': filename}
 
 
+@api.route("/submissions/<int:submission_id>/zip", methods=['GET'])
+@auth.login_required
+def stream_submission_zip(submission_id: int) -> werkzeug.wrappers.Response:
+    """Download the given submission (:class:`.models.Work`) as zip file.
+
+    .. :quickref: Submission; Download a submission as zip file.
+
+    Contrary to :py:func:`.get_zip` the zip file is created while it is being
+    sent, so there is no need to wait until the entire zip file has been
+    created.
+
+    :param int submission_id: The id of the submission
+    :returns: A response streaming the zip file.
+
+    :query str owner: The type of files to include, see
+        :meth:`.models.File.get_exclude_owner`.
+
+    :raises APIException: If the submission with given id does not exist.
+                          (OBJECT_ID_NOT_FOUND)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If submission does not belong to the current
+                                 user and the user can not view files in the
+                                 attached course. (INCORRECT_PERMISSION)
+    """
+    work = helpers.filter_single_or_404(
+        models.Work, models.Work.id == submission_id, ~models.Work.deleted
+    )
+    auth.WorkPermissions(work).ensure_may_see()
+    exclude_owner = models.File.get_exclude_owner(
+        request.args.get('owner'),
+        work.assignment.course_id,
+    )
+    auth.ensure_can_view_files(work, exclude_owner == FileOwner.student)
+
+    return helpers.make_stream_response(
+        psef.files.stream_zip(work.get_zip_entries(exclude_owner)),
+        f'{work.assignment.name}-{work.user.name}-archive.zip',
+        mimetype='application/zip',
+    )
+
+
 def get_zip(work: models.Work,
             exclude_owner: FileOwner) -> t.Mapping[str, str]:
     """Return a :class:`.models.Work` as a zip file.
@@ -964,6 +1006,7 @@ def create_new_file(submission_id: int) -> JSONResponse[t.Mapping[str, t.Any]]:
             d_filename, filename = psef.files.random_file_path()
             with open(d_filename, 'wb') as f:
                 f.write(request.get_data(as_text=False))
+            _, filename = psef.files.store_file(d_filename)
         else:
             is_dir, filename = True, None
         code = models.File(
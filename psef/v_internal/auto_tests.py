@@ -5,13 +5,19 @@ which are registered as active runners.
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
+import os
 import json
+import zlib
+import shutil
 import typing as t
+import tarfile
+import tempfile
 
 import requests
 import werkzeug
 import structlog
 from flask import request, make_response, send_from_directory
+from sqlalchemy.orm import selectinload
 
 from . import api
 from .. import app, files, tasks, models, helpers, auto_test
@@ -26,6 +32,7 @@ from ..features import Feature, feature_required
 from ..exceptions import APICodes, APIException, PermissionException
 
 logger = structlog.get_logger()
+_MAX_PREFETCH_RESULTS = 50
 LocalRunner = t.NewType('LocalRunner', t.Tuple[str, bool])
 
 
@@ -224,6 +231,74 @@ def get_result_data(auto_test_id: int, result_id: int
     return res
 
 
+@api.route(
+    '/auto_tests/<int:auto_test_id>/runs/<int:run_id>/results/submissions/',
+    methods=['POST']
+)
+@feature_required(Feature.AUTO_TEST)
+def get_results_submission_files(
+    auto_test_id: int, run_id: int
+) -> werkzeug.wrappers.Response:
+    """Get the submission files of multiple results at once.
+
+    This returns a tar archive containing a zip, as returned by
+    :func:`.get_result_data`, for every requested result. The zip of the
+    result with id ``5`` is named ``5.zip``. Results that are not part of the
+    given run are not included.
+
+    :<json result_ids: The ids of the results to get the submission files of,
+        at most ``_MAX_PREFETCH_RESULTS`` results can be requested at once.
+    """
+    password = _verify_global_header_password()
+
+    run = filter_single_or_404(
+        models.AutoTestRun,
+        models.AutoTestRun.id == run_id,
+        also_error=lambda run: run.auto_test_id != auto_test_id,
+    )
+    _verify_and_get_runner(run, password)
+
+    with get_from_map_transaction(get_json_dict_from_request()) as [get, _]:
+        result_ids = get('result_ids', list)
+
+    if len(result_ids) > _MAX_PREFETCH_RESULTS:
+        raise APIException(
+            'Too many results requested',
+            (
+                f'At most {_MAX_PREFETCH_RESULTS} results can be requested,'
+                f' but {len(result_ids)} were requested'
+            ), APICodes.INVALID_PARAM, 400
+        )
+
+    if run.auto_test.prefer_teacher_revision:
+        excluded_user = models.FileOwner.student
+    else:
+        excluded_user = models.FileOwner.teacher
+
+    results = models.AutoTestResult.query.filter(
+        models.AutoTestResult.auto_test_run_id == run.id,
+        models.AutoTestResult.id.in_(
+            [i for i in result_ids if isinstance(i, int)]
+        ),
+    ).options(selectinload(models.AutoTestResult.work)).all()
+
+    directory = app.config['MIRROR_UPLOAD_DIR']
+    tar_path, tar_name = files.random_file_path(True)
+    with tarfile.open(tar_path, 'w') as tar:
+        for result in results:
+            zip_name = result.work.create_zip(
+                excluded_user,
+                create_leading_directory=False,
+            )
+            zip_path = files.safe_join(directory, zip_name)
+            try:
+                tar.add(zip_path, arcname=f'{result.id}.zip')
+            finally:
+                os.unlink(zip_path)
+
+    return send_from_directory(directory, tar_name)
+
+
 @api.route(
     '/auto_tests/<int:auto_test_id>/runs/<int:run_id>/heartbeats/',
     methods=['POST']
@@ -263,6 +338,10 @@ def get_fixture(
 ) -> werkzeug.wrappers.Response:
     """Get the contents of the given fixture.
 
+    The ETag of the response is the sha256 hex digest of the contents of the
+    fixture, if it matches the ``If-None-Match`` header of the request an
+    empty response with status code 304 is returned.
+
     :param auto_test_id: The id of the AutoTest where this fixture is in.
     :param fixture_id: The id of the fixture to get.
     """
@@ -286,47 +365,66 @@ def get_fixture(
     else:  # pragma: no cover
         raise exc
 
-    contents = files.get_file_contents(fixture)
-    res: werkzeug.wrappers.Response = make_response(contents)
-    res.headers['Content-Type'] = 'application/octet-stream'
+    # The digest of the contents is used as ETag, so runners that already
+    # have this fixture can reuse their cached copy.
+    digest = files.get_file_digest(fixture.get_diskname())
+    if request.if_none_match.contains(digest):
+        res: werkzeug.wrappers.Response = make_response('', 304)
+    else:
+        res = make_response(files.get_file_contents(fixture))
+        res.headers['Content-Type'] = 'application/octet-stream'
+    res.set_etag(digest)
     return res
 
 
-@api.route(
-    '/auto_tests/<int:auto_test_id>/results/<int:result_id>',
-    methods=['PATCH']
-)
-@feature_required(Feature.AUTO_TEST)
-def update_result(auto_test_id: int,
-                  result_id: int) -> JSONResponse[t.Dict[str, bool]]:
-    """Update the the state of a result.
+def _parse_timings(timings: t.Mapping[str, object]) -> t.Dict[str, object]:
+    """Check that the given timings of a result are valid.
 
-    This route does not update the results of steps!
+    >>> _parse_timings({'total': 5, 'phases': {'a': 1.5}, 'steps': {'3': 1}})
+    {'total': 5, 'phases': {'a': 1.5}, 'steps': {'3': 1}}
+    >>> _parse_timings({'total': 5, 'phases': {'a': 'b'}, 'steps': {}})
+    Traceback (most recent call last):
+    ...
+    psef.exceptions.APIException: The given timings are not valid
 
-    :param auto_test_id: The AutoTest configuration in which to update the
-        result.
-    :param result_id: The id of the result which you want to update.
-    :>json state: The new state of the result (OPTIONAL).
-    :>json setup_stdout: The output of the setup script (OPTIONAL).
-    :>json setup_stderr: The output to stderr of the setup script (OPTIONAL).
+    :param timings: The timings as send by the runner, see
+        :meth:`.auto_test._StudentTimings.to_json`.
+    :returns: The timings that should be stored.
     """
-    password = _verify_global_header_password()
+    with get_from_map_transaction(timings) as [get, _]:
+        total = get('total', (int, float))
+        phases = get('phases', dict)
+        steps = get('steps', dict)
+
+    for name, value in [*phases.items(), *steps.items()]:
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise APIException(
+                'The given timings are not valid',
+                f'The time of "{name}" is not a number',
+                APICodes.INVALID_PARAM, 400
+            )
+
+    return {'total': total, 'phases': phases, 'steps': steps}
+
+
+def _update_result(
+    result: models.AutoTestResult,
+    runner: models.AutoTestRunner,
+    content: t.Mapping[str, object],
+) -> bool:
+    """Update the given result.
 
-    with get_from_map_transaction(get_json_dict_from_request()) as [
-        _, opt_get
-    ]:
+    :param result: The result to update.
+    :param runner: The runner that is updating the result.
+    :param content: The new data of the result, see :func:`update_result`.
+    :returns: ``True`` if the result is already being run by another runner,
+        in which case it is not updated.
+    """
+    with get_from_map_transaction(content) as [_, opt_get]:
         state = opt_get('state', str, None)
         setup_stdout = opt_get('setup_stdout', str, None)
         setup_stderr = opt_get('setup_stderr', str, None)
-
-    result = filter_single_or_404(
-        models.AutoTestResult,
-        models.AutoTestResult.id == result_id,
-        also_error=lambda result: result.run.auto_test_id != auto_test_id,
-        with_for_update=True,
-    )
-    _ensure_from_latest_work(result)
-    runner = _verify_and_get_runner(result.run, password)
+        timings = opt_get('timings', dict, None)
 
     logger.info(
         'Updating result',
@@ -337,7 +435,7 @@ def update_result(auto_test_id: int,
     )
 
     if result.runner is not None and result.runner != runner:
-        return jsonify({'taken': True})
+        return True
     else:
         result.runner = runner
 
@@ -345,6 +443,8 @@ def update_result(auto_test_id: int,
         result.setup_stdout = setup_stdout
     if setup_stderr is not None:
         result.setup_stderr = setup_stderr
+    if timings is not None:
+        result.timings = _parse_timings(timings)
     if state is not None:
         new_state = parse_enum(state, models.AutoTestStepResultState)
         assert new_state is not None
@@ -364,8 +464,119 @@ def update_result(auto_test_id: int,
         else:
             result.state = new_state
 
+    return False
+
+
+@api.route(
+    '/auto_tests/<int:auto_test_id>/results/<int:result_id>',
+    methods=['PATCH']
+)
+@feature_required(Feature.AUTO_TEST)
+def update_result(auto_test_id: int,
+                  result_id: int) -> JSONResponse[t.Dict[str, bool]]:
+    """Update the the state of a result.
+
+    This route does not update the results of steps!
+
+    :param auto_test_id: The AutoTest configuration in which to update the
+        result.
+    :param result_id: The id of the result which you want to update.
+    :>json state: The new state of the result (OPTIONAL).
+    :>json setup_stdout: The output of the setup script (OPTIONAL).
+    :>json setup_stderr: The output to stderr of the setup script (OPTIONAL).
+    :>json timings: The time spent in the different phases of running this
+        result (OPTIONAL).
+    """
+    password = _verify_global_header_password()
+    content = get_json_dict_from_request()
+
+    result = filter_single_or_404(
+        models.AutoTestResult,
+        models.AutoTestResult.id == result_id,
+        also_error=lambda result: result.run.auto_test_id != auto_test_id,
+        with_for_update=True,
+    )
+    _ensure_from_latest_work(result)
+    runner = _verify_and_get_runner(result.run, password)
+
+    taken = _update_result(result, runner, content)
+
     db.session.commit()
-    return jsonify({'taken': False})
+    return jsonify({'taken': taken})
+
+
+def _update_step_result(
+    result: models.AutoTestResult,
+    content: t.Mapping[str, object],
+    *,
+    find_by_step: bool = False,
+) -> models.AutoTestStepResult:
+    """Update, or create, a step result of the given result.
+
+    :param result: The result of which a step result should be updated.
+    :param content: The new data of the step result, see
+        :func:`update_step_result`.
+    :param find_by_step: If no id of a step result is given, update the
+        existing result of the given step instead of always creating a new
+        step result.
+    :returns: The updated step result.
+    """
+    with get_from_map_transaction(content) as [get, opt_get]:
+        state = get('state', str)
+        log = opt_get('log', dict, None)
+        log_patch = opt_get('log_patch', dict, None)
+        auto_test_step_id = get('auto_test_step_id', int)
+        res_id = opt_get('id', int, None)
+
+    step_result: t.Optional[models.AutoTestStepResult] = None
+    if res_id is not None:
+        step_result = get_or_404(models.AutoTestStepResult, res_id)
+        assert step_result.auto_test_result_id == result.id
+        assert step_result.auto_test_step_id == auto_test_step_id
+    elif find_by_step:
+        # Step results created by earlier updates in the same request should
+        # also be found.
+        db.session.flush()
+        step_result = models.AutoTestStepResult.query.filter_by(
+            auto_test_result_id=result.id,
+            auto_test_step_id=auto_test_step_id,
+        ).order_by(models.AutoTestStepResult.id).first()
+
+    if step_result is None:
+        step_result = models.AutoTestStepResult(
+            step=get_or_404(
+                models.AutoTestStepBase,  # type: ignore
+                auto_test_step_id
+            ),
+            result=result
+        )
+        db.session.add(result)
+
+    new_state = parse_enum(state, models.AutoTestStepResultState)
+    assert new_state is not None
+    step_result.state = new_state
+
+    if log_patch is not None:
+        old_log: t.Mapping[str, object] = {}
+        if isinstance(step_result.log, dict):
+            old_log = step_result.log
+        try:
+            step_result.log = auto_test.apply_log_patch(old_log, log_patch)
+        except ValueError as e:
+            raise APIException(
+                'The given log patch is not valid', str(e),
+                APICodes.INVALID_PARAM, 400
+            )
+    elif log is not None:
+        step_result.log = log
+    else:
+        raise APIException(
+            'No log was given',
+            'Either "log" or "log_patch" should be given',
+            APICodes.MISSING_REQUIRED_PARAM, 400
+        )
+
+    return step_result
 
 
 @api.route(
@@ -381,7 +592,10 @@ def update_step_result(auto_test_id: int, result_id: int
         result.
     :param result_id: The id of the result in which to update the step.
     :>json state: The state in which the step is in right now.
-    :>json log: The current log of the step.
+    :>json log: The current log of the step (OPTIONAL).
+    :>json log_patch: A patch to apply to the stored log of the step, see
+        :func:`.auto_test.get_log_patch` (OPTIONAL). Either this or ``log``
+        should be passed.
     :>json auto_test_step_id: The step of which this is a result.
     :>json res_id: The step result you want to update (OPTIONAL). If you do not
         pass this option a step result is created.
@@ -393,11 +607,7 @@ def update_step_result(auto_test_id: int, result_id: int
         request.get_json()
     )
 
-    with get_from_map_transaction(content) as [get, opt_get]:
-        state = get('state', str)
-        log = get('log', dict)
-        auto_test_step_id = get('auto_test_step_id', int)
-        res_id = opt_get('id', int, None)
+    with get_from_map_transaction(content) as [_, opt_get]:
         has_attachment = opt_get('has_attachment', bool, False)
 
     result = filter_single_or_404(
@@ -410,25 +620,7 @@ def update_step_result(auto_test_id: int, result_id: int
     _ensure_from_latest_work(result)
     _verify_and_get_runner(result.run, password)
 
-    if res_id is None:
-        step_result = models.AutoTestStepResult(
-            step=get_or_404(
-                models.AutoTestStepBase,  # type: ignore
-                auto_test_step_id
-            ),
-            result=result
-        )
-        db.session.add(result)
-    else:
-        step_result = get_or_404(models.AutoTestStepResult, res_id)
-        assert step_result.auto_test_result_id == result.id
-        assert step_result.auto_test_step_id == auto_test_step_id
-
-    new_state = parse_enum(state, models.AutoTestStepResultState)
-    assert new_state is not None
-    step_result.state = new_state
-
-    step_result.log = log
+    step_result = _update_step_result(result, content)
 
     if has_attachment:
         step_result.update_attachment(request.files['attachment'])
@@ -438,17 +630,184 @@ def update_step_result(auto_test_id: int, result_id: int
     return jsonify(step_result)
 
 
+@api.route(
+    '/auto_tests/<int:auto_test_id>/runs/<int:run_id>/updates/',
+    methods=['PUT']
+)
+@feature_required(Feature.AUTO_TEST)
+def update_results(auto_test_id: int,
+                   run_id: int) -> JSONResponse[t.List[object]]:
+    """Update multiple results and step results of a run at once.
+
+    The updates are applied in the given order, and either all or none of
+    them are applied. Doing this request also counts as a heartbeat of the
+    runner.
+
+    :param auto_test_id: The AutoTest configuration of the run.
+    :param run_id: The run in which to update the results.
+    :>json updates: The list of updates to do. Every update is a mapping with
+        a ``type``, which is ``result`` or ``step_result``, and the id of the
+        result to update as ``result_id``. The other keys are the same as for
+        :func:`update_result` and :func:`update_step_result`, however if no id
+        of a step result is given the existing result of the step is updated.
+    :returns: A list with for every update the result of the update, this is
+        a mapping with a ``taken`` key for results and the updated step result
+        for step results.
+    """
+    password = _verify_global_header_password()
+
+    with get_from_map_transaction(get_json_dict_from_request()) as [get, _]:
+        updates = get('updates', list)
+
+    run = filter_single_or_404(
+        models.AutoTestRun,
+        models.AutoTestRun.id == run_id,
+        also_error=lambda run: run.auto_test_id != auto_test_id,
+    )
+    runner = _verify_and_get_runner(run, password)
+    runner.last_heartbeat = helpers.get_request_start_time()
+
+    results: t.Dict[int, models.AutoTestResult] = {}
+    res: t.List[object] = []
+    for update in updates:
+        # The complete request is already logged.
+        update = ensure_json_dict(update, log_object=False)
+        with get_from_map_transaction(update) as [get, _]:
+            typ = get('type', str)
+            result_id = get('result_id', int)
+
+        if result_id not in results:
+            results[result_id] = filter_single_or_404(
+                models.AutoTestResult,
+                models.AutoTestResult.id == result_id,
+                also_error=lambda res: res.auto_test_run_id != run.id,
+                with_for_update=True,
+                with_for_update_of=models.AutoTestResult,
+            )
+            _ensure_from_latest_work(results[result_id])
+        result = results[result_id]
+
+        if typ == 'result':
+            res.append({'taken': _update_result(result, runner, update)})
+        elif typ == 'step_result':
+            res.append(_update_step_result(result, update, find_by_step=True))
+        else:
+            raise APIException(
+                'The given update type is not known',
+                f'The update type "{typ}" is not known',
+                APICodes.INVALID_PARAM, 400
+            )
+
+    db.session.commit()
+    return jsonify(res)
+
+
+def _aggregate_timings(
+    all_timings: t.Iterable[t.Optional[t.Mapping[str, t.Any]]]
+) -> t.Dict[str, t.Any]:
+    """Aggregate the timings of multiple results.
+
+    Results without timings are ignored.
+
+    >>> res = _aggregate_timings([
+    ...     {'total': 4, 'phases': {'setup': 1, 'steps': 3},
+    ...      'steps': {'1': 3}},
+    ...     {'total': 2, 'phases': {'steps': 2}, 'steps': {'1': 1, '2': 1}},
+    ...     None,
+    ... ])
+    >>> res['amount']
+    2
+    >>> res['total']
+    {'count': 2, 'total': 6, 'mean': 3.0, 'max': 4}
+    >>> res['phases']['setup']
+    {'count': 1, 'total': 1, 'mean': 1.0, 'max': 1}
+    >>> res['steps']['1']
+    {'count': 2, 'total': 4, 'mean': 2.0, 'max': 3}
+    >>> _aggregate_timings([])['total']
+    {'count': 0, 'total': 0, 'mean': 0, 'max': 0}
+
+    :param all_timings: The timings of the results, as stored in
+        :attr:`.models.AutoTestResult.timings`.
+    :returns: A mapping with the ``amount`` of results, and the ``count``,
+        ``total``, ``mean`` and ``max`` time of the ``total`` time and per
+        phase and step.
+    """
+    totals: t.List[float] = []
+    phases: t.Dict[str, t.List[float]] = {}
+    steps: t.Dict[str, t.List[float]] = {}
+
+    for timings in all_timings:
+        if timings is None:
+            continue
+        totals.append(timings['total'])
+        for name, value in timings['phases'].items():
+            phases.setdefault(name, []).append(value)
+        for step_id, value in timings['steps'].items():
+            steps.setdefault(step_id, []).append(value)
+
+    def aggregate(values: t.List[float]) -> t.Dict[str, float]:
+        return {
+            'count': len(values),
+            'total': sum(values),
+            'mean': sum(values) / len(values) if values else 0,
+            'max': max(values, default=0),
+        }
+
+    return {
+        'amount': len(totals),
+        'total': aggregate(totals),
+        'phases': {name: aggregate(vals)
+                   for name, vals in phases.items()},
+        'steps': {step_id: aggregate(vals)
+                  for step_id, vals in steps.items()},
+    }
+
+
+@api.route(
+    '/auto_tests/<int:auto_test_id>/runs/<int:run_id>/timings/',
+    methods=['GET'],
+)
+@feature_required(Feature.AUTO_TEST)
+def get_run_timings(auto_test_id: int,
+                    run_id: int) -> JSONResponse[t.Mapping[str, t.Any]]:
+    """Get the time spent by the runners in the different phases of running
+    the results of a run.
+
+    Only results for which the runner has reported its timings are taken into
+    account.
+
+    :param auto_test_id: The AutoTest configuration of the run.
+    :param run_id: The run to get the timings of.
+    :returns: The aggregated timings, see :func:`_aggregate_timings`.
+    """
+    _verify_global_header_password()
+
+    run = filter_single_or_404(
+        models.AutoTestRun,
+        models.AutoTestRun.id == run_id,
+        also_error=lambda run: run.auto_test_id != auto_test_id,
+    )
+    all_timings = db.session.query(models.AutoTestResult.timings).filter(
+        models.AutoTestResult.auto_test_run_id == run.id,
+    )
+
+    return jsonify(_aggregate_timings(timings for timings, in all_timings))
+
+
 @api.route(
     '/auto_tests/<int:auto_test_id>/runs/<int:run_id>/results/',
     methods=['GET'],
 )
 def get_extra_results_to_process(
     auto_test_id: int, run_id: int
-) -> JSONResponse[t.List[t.Mapping[str, int]]]:
+) -> JSONResponse[t.List[t.Mapping[str, t.Optional[float]]]]:
     """Get extra results to run the tests for.
 
     :qparam last_call: If there are no extra results mark the requesting runner
         as done.
+    :returns: The results to run, with the id of the student and the runtime
+        of the previous result of the student (see
+        :meth:`.models.AutoTestRun.get_previous_runtimes`).
     """
     is_last_call = request_arg_true('last_call')
     password = _verify_global_header_password()
@@ -470,32 +829,22 @@ def get_extra_results_to_process(
         run.stop_runners([runner])
         db.session.commit()
 
+    runtimes = run.get_previous_runtimes([res.work.user_id for res in results])
+
     return jsonify(
         [
             {
                 'result_id': res.id,
                 'student_id': res.work.user_id,
+                'expected_runtime': runtimes.get(res.work.user_id),
             } for res in results
         ]
     )
 
 
-@api.route(
-    (
-        '/auto_tests/<int:auto_test_id>/results/<int:result_id>'
-        '/suites/<int:suite_id>/files/'
-    ),
-    methods=['POST']
-)
-@feature_required(Feature.AUTO_TEST)
-def upload_output_files(
+def _get_output_files_result_and_suite(
     auto_test_id: int, result_id: int, suite_id: int
-) -> EmptyResponse:
-    """Upload output files for the given AutoTest in the given suite.
-
-    The uploaded file may be any file that can normally be used as a
-    submission, but a compressed archive is preferred.
-    """
+) -> t.Tuple[models.AutoTestResult, models.AutoTestSuite]:
     password = _verify_global_header_password()
     result = filter_single_or_404(
         models.AutoTestResult,
@@ -513,6 +862,28 @@ def upload_output_files(
             lambda suite: suite.auto_test_set.auto_test_id != auto_test_id
         ),
     )
+    return result, suite
+
+
+@api.route(
+    (
+        '/auto_tests/<int:auto_test_id>/results/<int:result_id>'
+        '/suites/<int:suite_id>/files/'
+    ),
+    methods=['POST']
+)
+@feature_required(Feature.AUTO_TEST)
+def upload_output_files(
+    auto_test_id: int, result_id: int, suite_id: int
+) -> EmptyResponse:
+    """Upload output files for the given AutoTest in the given suite.
+
+    The uploaded file may be any file that can normally be used as a
+    submission, but a compressed archive is preferred.
+    """
+    result, suite = _get_output_files_result_and_suite(
+        auto_test_id, result_id, suite_id
+    )
 
     file_objects = helpers.get_files_from_request(
         max_size=app.max_file_size, keys=['file']
@@ -530,3 +901,208 @@ def upload_output_files(
     db.session.commit()
 
     return make_empty_response()
+
+
+@api.route(
+    (
+        '/auto_tests/<int:auto_test_id>/results/<int:result_id>'
+        '/suites/<int:suite_id>/files/missing_blobs/'
+    ),
+    methods=['POST']
+)
+@feature_required(Feature.AUTO_TEST)
+def get_missing_output_blobs(
+    auto_test_id: int, result_id: int, suite_id: int
+) -> JSONResponse[t.Dict[str, t.List[str]]]:
+    """Get the contents of output files that are not yet stored on the
+    server.
+
+    The contents are identified by their sha256 hex digest, contents that are
+    not returned can be used in :func:`.upload_output_files_tree` without
+    uploading them.
+
+    :<json digests: The list of digests to check.
+    :returns: A mapping with a single key ``missing`` with the digests of the
+        contents that should be uploaded.
+    """
+    _get_output_files_result_and_suite(auto_test_id, result_id, suite_id)
+
+    with get_from_map_transaction(get_json_dict_from_request()) as [get, _]:
+        digests = get('digests', list)
+
+    return jsonify(
+        {
+            'missing': [
+                digest for digest in set(map(str, digests))
+                if not files.has_blob(digest)
+            ],
+        }
+    )
+
+
+def _read_output_archive(
+    archive_stream: t.IO[bytes], tmpdir: str
+) -> t.Tuple[helpers.JSONType, t.Dict[str, str]]:
+    """Read the manifest and the file contents from an output archive.
+
+    :param archive_stream: The gzipped tar archive to read.
+    :param tmpdir: The directory to which the contents should be written.
+    :returns: The manifest and a mapping from digest to the path of the file
+        with these contents.
+    """
+    manifest: helpers.JSONType = None
+    contents: t.Dict[str, str] = {}
+    total_size = 0
+
+    try:
+        with tarfile.open(fileobj=archive_stream, mode='r|gz') as tar:
+            for member in tar:
+                fileobj = tar.extractfile(member)
+                if fileobj is None:
+                    continue
+
+                if member.size > app.max_single_file_size:
+                    helpers.raise_file_too_big_exception(
+                        app.max_single_file_size, single_file=True
+                    )
+                total_size += member.size
+                if total_size > app.max_file_size:
+                    helpers.raise_file_too_big_exception(app.max_file_size)
+
+                if member.name == auto_test.OUTPUT_MANIFEST_NAME:
+                    manifest = json.load(fileobj)
+                    continue
+
+                path = os.path.join(tmpdir, str(len(contents)))
+                with open(path, 'wb') as f:
+                    files.limited_copy(
+                        fileobj, f, app.max_single_file_size
+                    )
+                if files.get_file_digest(path) != member.name:
+                    raise APIException(
+                        'The uploaded archive is not valid',
+                        f'The contents of {member.name} do not match its name',
+                        APICodes.INVALID_ARCHIVE, 400
+                    )
+                contents[member.name] = path
+    except (tarfile.TarError, EOFError, zlib.error, ValueError) as exc:
+        raise APIException(
+            'The uploaded archive is not valid',
+            f'The archive could not be read: {exc}', APICodes.INVALID_ARCHIVE,
+            400
+        )
+
+    return manifest, contents
+
+
+def _create_output_tree(
+    manifest: helpers.JSONType, contents: t.Mapping[str, str], tmpdir: str
+) -> files.ExtractFileTree:
+    tree = files.ExtractFileTree(name='top', values=[], parent=None)
+    directories: t.Dict[t.Tuple[str, ...], files.ExtractFileTreeDirectory] = {
+        (): tree
+    }
+    if not isinstance(manifest, list):
+        raise APIException(
+            'The uploaded archive is not valid',
+            'The archive does not contain a valid manifest',
+            APICodes.INVALID_ARCHIVE, 400
+        )
+
+    try:
+        for entry in manifest:
+            with get_from_map_transaction(ensure_json_dict(entry)) as [get, _]:
+                path = get('path', str)
+                digest = get('digest', str)
+
+            parts = tuple(p for p in path.split('/') if p not in ('', '.'))
+            if not parts or '..' in parts:
+                raise APIException(
+                    'The uploaded archive is not valid',
+                    f'The path {path} is not valid', APICodes.INVALID_ARCHIVE,
+                    400
+                )
+
+            for idx in range(1, len(parts)):
+                if parts[:idx] not in directories:
+                    directory = files.ExtractFileTreeDirectory(
+                        name=parts[idx - 1], values=[], parent=None
+                    )
+                    directories[parts[:idx - 1]].add_child(directory)
+                    directories[parts[:idx]] = directory
+
+            stored = files.link_blob(digest)
+            if stored is None:
+                if digest not in contents:
+                    raise APIException(
+                        'The uploaded archive is not complete',
+                        f'The contents of {path} were not uploaded',
+                        APICodes.INVALID_ARCHIVE, 400
+                    )
+                # Every stored file needs its own copy, as ``store_file``
+                # moves the given file.
+                copy_path = os.path.join(tmpdir, 'copy')
+                shutil.copyfile(contents[digest], copy_path)
+                stored = files.store_file(copy_path)
+
+            disk_path, disk_name = stored
+            directories[parts[:-1]].add_child(
+                files.ExtractFileTreeFile(
+                    name=parts[-1],
+                    disk_name=disk_name,
+                    size=files.get_file_size(disk_path),
+                    parent=None,
+                )
+            )
+
+        if tree.get_size() > app.max_file_size:
+            helpers.raise_file_too_big_exception(app.max_file_size)
+    except:
+        tree.delete(app.config['UPLOAD_DIR'])
+        raise
+
+    return tree
+
+
+@api.route(
+    (
+        '/auto_tests/<int:auto_test_id>/results/<int:result_id>'
+        '/suites/<int:suite_id>/files/tree/'
+    ),
+    methods=['PUT']
+)
+@feature_required(Feature.AUTO_TEST)
+def upload_output_files_tree(
+    auto_test_id: int, result_id: int, suite_id: int
+) -> EmptyResponse:
+    """Upload output files for the given AutoTest in the given suite as a
+    content addressed archive.
+
+    The body of the request should be a gzipped tar archive. Its first member
+    should be a JSON manifest named ``manifest.json``, which is a list of
+    mappings with a ``path`` and the sha256 hex ``digest`` of the contents of
+    each output file. The other members of the archive are the contents that
+    are not yet stored on the server, see :func:`.get_missing_output_blobs`,
+    named after their digest.
+    """
+    result, suite = _get_output_files_result_and_suite(
+        auto_test_id, result_id, suite_id
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manifest, contents = _read_output_archive(
+            t.cast(t.IO[bytes], request.stream), tmpdir
+        )
+        tree = _create_output_tree(manifest, contents, tmpdir)
+
+    models.AutoTestOutputFile.create_from_extract_directory(
+        tree,
+        None,
+        {
+            'result': result,
+            'suite': suite,
+        },
+    )
+    db.session.commit()
+
+    return make_empty_response()
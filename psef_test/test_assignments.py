@@ -1,9 +1,12 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 import io
 import os
+import re
+import csv
 import copy
 import json
 import uuid
+import base64
 import random
 import tarfile
 import datetime
@@ -1865,6 +1868,150 @@ def test_get_all_submissions(
         )
 
 
+@pytest.mark.parametrize('with_works', [True], indirect=True)
+@pytest.mark.parametrize('named_user', ['Devin Hillenius'], indirect=True)
+@pytest.mark.parametrize('extended', [True, False])
+def test_get_submissions_page(
+    with_works, named_user, logged_in, test_client, assignment, describe,
+    extended, error_template
+):
+    with describe('setup'), logged_in(named_user):
+        url = f'/api/v1/assignments/{assignment.id}/submissions/page'
+        query = {'page_size': 3}
+        if extended:
+            query['extended'] = ''
+        expected = [
+            work.id for work in sorted(
+                m.Work.query.filter_by(assignment_id=assignment.id),
+                key=lambda w: (w.created_at, w.id),
+                reverse=True,
+            )
+        ]
+        assert len(expected) > 3
+
+    with describe('all pages together should give all submissions'
+                  ), logged_in(named_user):
+        found = []
+        page_query = query
+        while True:
+            page = test_client.req(
+                'get',
+                url,
+                200,
+                query=page_query,
+                result={
+                    # The cursor should be usable in a url without escaping.
+                    'next_cursor': lambda c: c is None or
+                    re.fullmatch(r'[A-Za-z0-9_-]+', c) is not None,
+                    'submissions': list,
+                },
+            )
+            assert len(page['submissions']) <= 3
+            found.extend(sub['id'] for sub in page['submissions'])
+            if page['next_cursor'] is None:
+                break
+            page_query = {**query, 'after': page['next_cursor']}
+
+        assert found == expected
+
+    with describe('the result should be the same as the non paged route'
+                  ), logged_in(named_user):
+        page = test_client.req(
+            'get', url, 200, query={**query, 'page_size': len(expected)}
+        )
+        assert page['next_cursor'] is None
+        assert sorted(
+            page['submissions'], key=lambda s: s['id']
+        ) == sorted(
+            test_client.req(
+                'get',
+                f'/api/v1/assignments/{assignment.id}/submissions/',
+                200,
+                query={'extended': ''} if extended else {},
+            ),
+            key=lambda s: s['id'],
+        )
+
+    with describe('invalid cursors should give an error'
+                  ), logged_in(named_user):
+        test_client.req(
+            'get',
+            url,
+            400,
+            query={'after': 'not a cursor'},
+            result=error_template,
+        )
+        test_client.req(
+            'get',
+            url,
+            400,
+            query={
+                'after': base64.urlsafe_b64encode(b'["not a date", 5]').decode()
+            },
+            result=error_template,
+        )
+
+
+@pytest.mark.parametrize('with_works', [True], indirect=True)
+def test_export_gradebook(
+    with_works, logged_in, test_client, assignment, describe, error_template,
+    teacher_user, student_user
+):
+    with describe('setup'):
+        url = f'/api/v1/assignments/{assignment.id}/gradebook'
+        latest = assignment.get_all_latest_submissions().all()
+        assert latest
+        with logged_in(teacher_user):
+            test_client.req(
+                'patch',
+                f'/api/v1/submissions/{latest[0].id}',
+                200,
+                data={'grade': 6.5},
+            )
+
+    with describe('can export as csv'), logged_in(teacher_user):
+        res = test_client.get(url)
+        assert res.status_code == 200
+        assert res.mimetype == 'text/csv'
+        rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+        assert sorted(int(row['submission_id']) for row in rows
+                      ) == sorted(sub.id for sub in latest)
+        grades = {row['submission_id']: row['grade'] for row in rows}
+        assert grades.pop(str(latest[0].id)) == '6.5'
+        assert all(grade == '' for grade in grades.values())
+
+    with describe('can export as ndjson'), logged_in(teacher_user):
+        res = test_client.get(url, query_string={'format': 'ndjson'})
+        assert res.status_code == 200
+        rows = [
+            json.loads(line)
+            for line in res.get_data(as_text=True).splitlines()
+        ]
+        assert sorted(row['submission_id'] for row in rows
+                      ) == sorted(sub.id for sub in latest)
+        assert all(row['rubric_items'] == [] for row in rows)
+
+    with describe('the course export contains the assignment'
+                  ), logged_in(teacher_user):
+        res = test_client.get(
+            f'/api/v1/courses/{assignment.course_id}/gradebook',
+            query_string={'format': 'ndjson'},
+        )
+        assert res.status_code == 200
+        assert {
+            json.loads(line)['submission_id']
+            for line in res.get_data(as_text=True).splitlines()
+        } >= {sub.id for sub in latest}
+
+    with describe('unknown formats are rejected'), logged_in(teacher_user):
+        test_client.req(
+            'get', url, 400, query={'format': 'xml'}, result=error_template
+        )
+
+    with describe('students cannot export'), logged_in(student_user):
+        test_client.req('get', url, 403, result=error_template)
+
+
 # yapf: disable
 @pytest.mark.parametrize(
     'named_user', ['Robin',
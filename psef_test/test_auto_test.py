@@ -10,6 +10,8 @@ import uuid
 import shutil
 import socket
 import getpass
+import tarfile
+import zipfile
 import tempfile
 import threading
 import multiprocessing
@@ -1587,6 +1589,63 @@ def test_run_command_too_much_output(
                          ).decode() == ('b' * 32 + 'c' * 32)
 
 
+def test_oversubscribing_idle_cores(describe, stub_function_class):
+    class IdleContainer:
+        get_cpu_time = stub_function_class(lambda: 0.0)
+
+    def run_student(cores, *, timeout=False):
+        with cores.reserved_core() as core:
+            with core.measured_usage(IdleContainer()):
+                time.sleep(0.01)
+                if timeout:
+                    core.yield_core()
+
+    def get_available(cores):
+        available = []
+        while not cores._available_cores.empty():
+            available.append(cores._available_cores.get())
+        for core in available:
+            cores._available_cores.put(core)
+        return sorted(available)
+
+    def check_slots(cores):
+        # No cores are reserved, so every slot should be available.
+        slots = cores.get_slots()
+        assert all(1 <= amount <= 3 for amount in slots)
+        assert get_available(cores) == sorted(
+            core for core, amount in enumerate(slots) for _ in range(amount)
+        )
+        return slots
+
+    with psef.auto_test._Manager() as manager:
+        cores = psef.auto_test.CpuCores(
+            manager, number_of_cores=2, max_per_core=3
+        )
+
+        with describe('cores are not shared before all are measured'):
+            run_student(cores)
+            assert check_slots(cores) == [1, 1]
+
+        with describe('idle cores are shared'):
+            run_student(cores)
+            assert check_slots(cores) == [3, 3]
+            assert cores.get_utilisation() == 0
+
+        with describe('slots are removed again when cores are busy'):
+            for _ in range(5):
+                run_student(cores, timeout=True)
+            slots = check_slots(cores)
+            assert sum(slots) < 6
+            # Slots should be spread over the cores.
+            assert max(slots) - min(slots) <= 1
+            assert cores.get_utilisation() > 0
+
+        with describe('slots are added to the cores with the fewest'):
+            for _ in range(50):
+                run_student(cores)
+            assert check_slots(cores) == [3, 3]
+
+
 @pytest.mark.parametrize(
     'filename', ['../test_submissions/single_dir_archive.zip'], indirect=True
 )
@@ -1628,6 +1687,57 @@ def test_ensure_from_latest_work(session, describe, assignment_real_works):
         assert err.value.api_code == APICodes.NOT_NEWEST_SUBMSSION
 
 
+@pytest.mark.parametrize(
+    'filename', ['../test_submissions/single_dir_archive.zip'], indirect=True
+)
+def test_get_previous_runtimes(session, describe, assignment_real_works):
+    with describe('setup'):
+        assignment, submission = assignment_real_works
+        user_id = submission['user']['id']
+        other_work = m.Work.query.filter_by(
+            assignment_id=assignment.id
+        ).filter(m.Work.id != submission['id']).first()
+        new_work = m.Work(user_id=user_id, assignment_id=assignment.id)
+        session.add(new_work)
+        session.commit()
+
+        test = m.AutoTest(
+            setup_script='', run_setup_script='', assignment=assignment
+        )
+        run = m.AutoTestRun(
+            _job_id=uuid.uuid4(),
+            auto_test=test,
+            batch_run_done=True,
+        )
+        now = DatetimeWithTimezone.utcnow()
+        run.results = [
+            m.AutoTestResult(
+                work_id=submission['id'],
+                final_result=True,
+                _state=m.AutoTestStepResultState.passed,
+                started_at=now - timedelta(seconds=30),
+                updated_at=now,
+            ),
+            m.AutoTestResult(work_id=new_work.id, final_result=True),
+            m.AutoTestResult(work_id=other_work.id, final_result=True),
+        ]
+        session.commit()
+
+    with describe('only users with a finished result have a runtime'):
+        assert run.get_previous_runtimes([user_id, other_work.user_id]) == {
+            user_id: 30
+        }
+        assert run.get_previous_runtimes([]) == {}
+
+    with describe('runtimes are sent with the instructions'):
+        runner = m.AutoTestRunner.create('127.0.0.1', run=run)
+        session.add(runner)
+        session.flush()
+        instructions = run.get_instructions(runner)
+        latest = run.get_results_to_run().filter_by(work_id=new_work.id).one()
+        assert instructions['expected_runtimes'] == {str(latest.id): 30}
+
+
 def test_clearing_already_started_result(
     describe, basic, logged_in, test_client, session, app, monkeypatch,
     stub_function_class, monkeypatch_celery
@@ -1718,6 +1828,521 @@ def test_clearing_already_started_result(
         assert result.setup_stdout is None
 
 
+def test_update_step_result_with_log_patch(
+    describe, basic, logged_in, test_client, session, app, monkeypatch,
+    stub_function_class, monkeypatch_celery
+):
+    with describe('setup'):
+        course, assig_id, teacher, student = basic
+        with logged_in(teacher):
+            test = m.AutoTest.query.get(
+                helpers.create_auto_test(
+                    test_client,
+                    assig_id,
+                    amount_sets=1,
+                    amount_suites=1,
+                )['id']
+            )
+
+            run = m.AutoTestRun(auto_test=test, batch_run_done=True)
+            run.runners_requested = 1
+            session.add(run)
+            session.commit()
+
+            monkeypatch.setattr(
+                psef.tasks, 'adjust_amount_runners', stub_function_class()
+            )
+
+            sub_id = helpers.create_submission(test_client, assig_id)['id']
+
+            result = m.AutoTestResult.query.filter_by(work_id=sub_id).one()
+            runner = m.AutoTestRunner(_ipaddr='localhost', run=run)
+            session.commit()
+
+        step_id = test.sets[0].suites[0].steps[0].id
+        url = (
+            f'/api/v-internal/auto_tests/{test.id}/results/{result.id}'
+            '/step_results/'
+        )
+        headers = {
+            'CG-Internal-Api-Password': app.config['AUTO_TEST_PASSWORD'],
+            'CG-Internal-Api-Runner-Password': str(runner.id)
+        }
+
+        def update(status, data):
+            return test_client.req(
+                'put',
+                url,
+                status,
+                data={
+                    'state': 'running',
+                    'auto_test_step_id': step_id,
+                    **data,
+                },
+                headers=headers,
+                environ_base={'REMOTE_ADDR': 'localhost'}
+            )
+
+    with describe('creating with a complete log'):
+        log = {'steps': [{'state': 'running'}, {'state': 'not_started'}]}
+        step_result_id = update(200, {'log': log})['id']
+        step_result = m.AutoTestStepResult.query.get(step_result_id)
+        assert step_result.log == log
+
+    with describe('patching the log should only change the given parts'):
+        patch = {
+            'set': {'extra': 5},
+            'steps': [[0, {'state': 'passed', 'stdout': 'out'}]],
+        }
+        for _ in range(2):
+            update(200, {'id': step_result_id, 'log_patch': patch})
+            step_result = m.AutoTestStepResult.query.get(step_result_id)
+            assert step_result.log == {
+                'extra': 5,
+                'steps': [
+                    {'state': 'passed', 'stdout': 'out'},
+                    {'state': 'not_started'},
+                ],
+            }
+
+    with describe('patch should be created by the runner'):
+        new_log = copy.deepcopy(step_result.log)
+        new_log['steps'][1]['state'] = 'failed'
+        patch = psef.auto_test.get_log_patch(step_result.log, new_log)
+        assert patch == {'set': {}, 'steps': [[1, {'state': 'failed'}]]}
+        update(200, {'id': step_result_id, 'log_patch': patch})
+        step_result = m.AutoTestStepResult.query.get(step_result_id)
+        assert step_result.log == new_log
+
+    with describe('invalid patches should be rejected'):
+        update(400, {'id': step_result_id, 'log_patch': {'steps': [[5, {}]]}})
+        update(400, {'id': step_result_id, 'log_patch': {'steps': 5}})
+        update(400, {'id': step_result_id})
+        step_result = m.AutoTestStepResult.query.get(step_result_id)
+        assert step_result.log == new_log
+
+
+def test_update_results_in_batch(
+    describe, basic, logged_in, test_client, session, app, monkeypatch,
+    stub_function_class, monkeypatch_celery, monkeypatch_broker
+):
+    with describe('setup'):
+        course, assig_id, teacher, student = basic
+        with logged_in(teacher):
+            test = m.AutoTest.query.get(
+                helpers.create_auto_test(
+                    test_client,
+                    assig_id,
+                    amount_sets=1,
+                    amount_suites=1,
+                )['id']
+            )
+
+            run = m.AutoTestRun(auto_test=test, batch_run_done=True)
+            run.runners_requested = 1
+            session.add(run)
+            session.commit()
+
+            monkeypatch.setattr(
+                psef.tasks, 'adjust_amount_runners', stub_function_class()
+            )
+
+            sub_id = helpers.create_submission(test_client, assig_id)['id']
+
+            result = m.AutoTestResult.query.filter_by(work_id=sub_id).one()
+            runner = m.AutoTestRunner(_ipaddr='localhost', run=run)
+            runner.last_heartbeat = DatetimeWithTimezone.utcfromtimestamp(0)
+            session.commit()
+
+        step_id = test.sets[0].suites[0].steps[0].id
+        url = f'/api/v-internal/auto_tests/{test.id}/runs/{run.id}/updates/'
+        headers = {
+            'CG-Internal-Api-Password': app.config['AUTO_TEST_PASSWORD'],
+            'CG-Internal-Api-Runner-Password': str(runner.id)
+        }
+
+        def update(status, updates):
+            return test_client.req(
+                'put',
+                url,
+                status,
+                data={'updates': updates},
+                headers=headers,
+                environ_base={'REMOTE_ADDR': 'localhost'}
+            )
+
+        def step_update(state, **data):
+            return {
+                'type': 'step_result',
+                'result_id': result.id,
+                'auto_test_step_id': step_id,
+                'state': state,
+                **data,
+            }
+
+    with describe('updates should be applied in order'):
+        log = {'steps': [{'state': 'running'}]}
+        res = update(
+            200, [
+                {
+                    'type': 'result',
+                    'result_id': result.id,
+                    'state': 'running',
+                },
+                step_update('running', log=log),
+                step_update(
+                    'passed',
+                    log_patch={
+                        'set': {},
+                        'steps': [[0, {'state': 'passed'}]]
+                    }
+                ),
+            ]
+        )
+        assert res[0] == {'taken': False}
+        assert res[1]['id'] == res[2]['id']
+        assert res[2]['state'] == 'passed'
+
+        step_result = m.AutoTestStepResult.query.get(res[2]['id'])
+        assert step_result.log == {'steps': [{'state': 'passed'}]}
+        assert result.state.name == 'running'
+        assert result.runner == runner
+
+    with describe('updates should count as heartbeat'):
+        assert runner.last_heartbeat.year > 1970
+
+    with describe('existing step result should be found by step'):
+        res = update(200, [step_update('failed', log={'steps': []})])
+        assert res[0]['id'] == step_result.id
+        assert m.AutoTestStepResult.query.filter_by(
+            auto_test_result_id=result.id
+        ).count() == 1
+        assert m.AutoTestStepResult.query.get(step_result.id).log == {
+            'steps': []
+        }
+
+    with describe('invalid updates should be rejected completely'):
+        update(
+            400, [
+                step_update('passed', log=log),
+                {
+                    'type': 'unknown',
+                    'result_id': result.id
+                },
+            ]
+        )
+        update(400, [step_update('passed')])
+        assert m.AutoTestStepResult.query.get(step_result.id).log == {
+            'steps': []
+        }
+
+    with describe('timings of results should be stored and aggregated'):
+        timings = {
+            'total': 10,
+            'phases': {'setup': 4, 'steps': 6},
+            'steps': {str(step_id): 6},
+        }
+        result_update = {'type': 'result', 'result_id': result.id}
+        update(
+            400, [{
+                **result_update, 'timings': {
+                    **timings, 'phases': {'setup': 'slow'}
+                }
+            }]
+        )
+        update(200, [{**result_update, 'timings': timings}])
+        assert m.AutoTestResult.query.get(result.id).timings == timings
+
+        timings_url = (
+            f'/api/v-internal/auto_tests/{test.id}/runs/{run.id}/timings/'
+        )
+        test_client.req(
+            'get',
+            timings_url,
+            401,
+            headers={'CG-Internal-Api-Password': 'wrong'},
+        )
+        test_client.req(
+            'get',
+            timings_url,
+            200,
+            headers=headers,
+            result={
+                'amount': 1,
+                'total': {'count': 1, 'total': 10, 'mean': 10, 'max': 10},
+                'phases': {
+                    'setup': {'count': 1, 'total': 4, 'mean': 4, 'max': 4},
+                    'steps': {'count': 1, 'total': 6, 'mean': 6, 'max': 6},
+                },
+                'steps': {
+                    str(step_id): {
+                        'count': 1, 'total': 6, 'mean': 6, 'max': 6
+                    },
+                },
+            }
+        )
+
+    with describe('results of old submissions cannot be updated'):
+        with logged_in(teacher):
+            helpers.create_submission(test_client, assig_id)
+        res = update(400, [step_update('passed', log=log)])
+        assert res['code'] == 'NOT_NEWEST_SUBMSSION'
+
+
+def test_upload_output_files_tree(
+    describe, basic, logged_in, test_client, session, app, monkeypatch,
+    stub_function_class, monkeypatch_celery
+):
+    with describe('setup'):
+        course, assig_id, teacher, student = basic
+        with logged_in(teacher):
+            test = m.AutoTest.query.get(
+                helpers.create_auto_test(
+                    test_client,
+                    assig_id,
+                    amount_sets=1,
+                    amount_suites=1,
+                )['id']
+            )
+
+            run = m.AutoTestRun(auto_test=test, batch_run_done=True)
+            run.runners_requested = 1
+            session.add(run)
+            session.commit()
+
+            monkeypatch.setattr(
+                psef.tasks, 'adjust_amount_runners', stub_function_class()
+            )
+
+            sub_id = helpers.create_submission(test_client, assig_id)['id']
+
+            result = m.AutoTestResult.query.filter_by(work_id=sub_id).one()
+            runner = m.AutoTestRunner(_ipaddr='localhost', run=run)
+            result.runner = runner
+            session.commit()
+
+        suite_id = test.sets[0].suites[0].id
+        url = (
+            f'/api/v-internal/auto_tests/{test.id}/results/{result.id}'
+            f'/suites/{suite_id}/files/'
+        )
+        headers = {
+            'CG-Internal-Api-Password': app.config['AUTO_TEST_PASSWORD'],
+            'CG-Internal-Api-Runner-Password': str(runner.id)
+        }
+
+        # The contents should be unique, as they might be stored by other
+        # tests otherwise.
+        same = uuid.uuid4().hex.encode()
+        out_archive = io.BytesIO()
+        with tarfile.open(fileobj=out_archive, mode='w') as tar:
+            for name, content in [
+                ('./a', same), ('./dir/b', same), ('./c', uuid.uuid4().bytes)
+            ]:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        out_archive.seek(0)
+        out_tar = tarfile.open(fileobj=out_archive, mode='r')
+        output_files = psef.auto_test._get_output_files(out_tar)
+
+        def get_missing():
+            return test_client.req(
+                'post',
+                f'{url}missing_blobs/',
+                200,
+                data={'digests': [f.digest for f in output_files]},
+                headers=headers,
+                environ_base={'REMOTE_ADDR': 'localhost'}
+            )['missing']
+
+        def upload(status, missing):
+            upload = io.BytesIO()
+            psef.auto_test._write_output_archive(
+                upload, out_tar, output_files, missing
+            )
+            return test_client.req(
+                'put',
+                f'{url}tree/',
+                status,
+                real_data=upload.getvalue(),
+                headers=headers,
+                environ_base={'REMOTE_ADDR': 'localhost'}
+            )
+
+        def get_disk_files():
+            return {
+                f.name: f.get_diskname()
+                for f in result.files.filter_by(is_directory=False)
+            }
+
+    with describe('missing contents should be rejected'):
+        missing = get_missing()
+        assert len(missing) == 2
+        upload(400, missing[:1])
+        assert result.files.count() == 0
+
+    with describe('all files should be stored once'):
+        upload(204, missing)
+        disk_files = get_disk_files()
+        assert sorted(disk_files) == ['a', 'b', 'c']
+        with open(disk_files['b'], 'rb') as f:
+            assert f.read() == same
+        assert os.path.samefile(disk_files['a'], disk_files['b'])
+        assert not os.path.samefile(disk_files['a'], disk_files['c'])
+        assert [
+            f.name for f in result.files.filter_by(parent_id=None).one().
+            list_contents().entries
+        ] == ['a', 'c', 'dir']
+
+    with describe('stored contents should not be uploaded again'):
+        assert get_missing() == []
+        result.files.delete()
+        session.commit()
+        upload(204, [])
+        assert sorted(get_disk_files()) == ['a', 'b', 'c']
+
+
+def test_download_cache(
+    describe, basic, logged_in, test_client, session, app, monkeypatch,
+    stub_function_class, monkeypatch_celery, tmpdir
+):
+    with describe('setup'):
+        course, assig_id, teacher, student = basic
+        with logged_in(teacher):
+            test = m.AutoTest.query.get(
+                helpers.create_auto_test(
+                    test_client,
+                    assig_id,
+                    amount_fixtures=1,
+                )['id']
+            )
+
+            run = m.AutoTestRun(auto_test=test, batch_run_done=True)
+            run.runners_requested = 1
+            session.add(run)
+            session.commit()
+
+            monkeypatch.setattr(
+                psef.tasks, 'adjust_amount_runners', stub_function_class()
+            )
+
+            sub_ids = [
+                helpers.create_submission(
+                    test_client, assig_id, for_user=user
+                )['id'] for user in [student, teacher]
+            ]
+            results = [
+                m.AutoTestResult.query.filter_by(work_id=sub_id).one()
+                for sub_id in sub_ids
+            ]
+            runner = m.AutoTestRunner(_ipaddr='localhost', run=run)
+            session.commit()
+
+        fixture = test.fixtures[0]
+        base_url = f'/api/v-internal/auto_tests/{test.id}'
+        runner_headers = {
+            'CG-Internal-Api-Password': app.config['AUTO_TEST_PASSWORD'],
+            'CG-Internal-Api-Runner-Password': str(runner.id)
+        }
+
+        class Response:
+            def __init__(self, response):
+                self._response = response
+                self.status_code = response.status_code
+                self.headers = response.headers
+                self.raw = io.BytesIO(response.get_data())
+
+            def raise_for_status(self):
+                assert self.status_code < 400
+
+            def iter_content(self, size):
+                return iter(lambda: self.raw.read(size), b'')
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *_):
+                pass
+
+        class Session:
+            def __init__(self):
+                self.statuses = []
+
+            def _req(self, method, url, headers=None, json=None, **_):
+                res = Response(
+                    getattr(test_client, method)(
+                        url,
+                        headers={**runner_headers, **(headers or {})},
+                        json=json,
+                        environ_base={'REMOTE_ADDR': 'localhost'},
+                    )
+                )
+                self.statuses.append(res.status_code)
+                return res
+
+            def get(self, url, **kwargs):
+                return self._req('get', url, **kwargs)
+
+            def post(self, url, **kwargs):
+                return self._req('post', url, **kwargs)
+
+        req = Session()
+        cache = psef.auto_test._DownloadCache(str(tmpdir))
+
+    with describe('fixtures should only be downloaded once'):
+        fixture_url = f'{base_url}/fixtures/{fixture.id}'
+        path = cache.download(req, fixture_url)
+        with open(path, 'rb') as f:
+            content = f.read()
+        assert content == psef.files.get_file_contents(fixture)
+        assert cache.download(req, fixture_url) == path
+        assert req.statuses == [200, 304]
+
+    with describe('changed fixtures should be downloaded again'):
+        old_path = fixture.get_diskname()
+        with open(old_path, 'rb') as f:
+            old_content = f.read()
+        new_path, fixture.filename = psef.files.random_file_path()
+        with open(new_path, 'wb') as f:
+            f.write(b'new content')
+        session.commit()
+
+        new_cached_path = cache.download(req, fixture_url)
+        assert new_cached_path != path
+        with open(new_cached_path, 'rb') as f:
+            assert f.read() == b'new content'
+        assert req.statuses[-1] == 200
+        # The old contents are still cached.
+        with open(path, 'rb') as f:
+            assert f.read() == old_content
+
+    with describe('submissions can be prefetched in bulk'):
+        cache.prefetch_submissions(
+            req,
+            f'{base_url}/runs/{run.id}/results/submissions/',
+            run.id,
+            [results[0].id, results[1].id, 1000000],
+        )
+        for result in results:
+            zip_content = cache.pop_submission(run.id, result.id)
+            assert zip_content is not None
+            with zipfile.ZipFile(io.BytesIO(zip_content)) as zfile:
+                assert zfile.namelist()
+            assert cache.pop_submission(run.id, result.id) is None
+        assert cache.pop_submission(run.id, 1000000) is None
+
+    with describe('too many submissions cannot be requested'):
+        test_client.req(
+            'post',
+            f'{base_url}/runs/{run.id}/results/submissions/',
+            400,
+            data={'result_ids': list(range(1000))},
+            headers=runner_headers,
+            environ_base={'REMOTE_ADDR': 'localhost'},
+        )
+
+
 def test_update_result_dates_in_broker(
     describe, basic, logged_in, test_client, session, app, monkeypatch,
     stub_function_class, monkeypatch_celery, monkeypatch_broker, assert_similar
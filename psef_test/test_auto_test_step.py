@@ -477,6 +477,34 @@ def test_match_output_io_step(expected, output, options, success):
     assert i.match_output(output, expected, options) == success
 
 
+def test_io_step_instructions_contain_normalized_output(stub_suite):
+    i = IoTest(suite=stub_suite)
+    i.weight = 2
+    i.update_data_from_json({
+        'program': 'ls', 'inputs': [{
+            'name': 'no name',
+            'args': '1',
+            'weight': 1,
+            'stdin': '',
+            'output': 'Hello  \nWorld\n\n',
+            'options': ['case', 'trailing_whitespace'],
+        }, {
+            'name': 'a name',
+            'args': '2',
+            'weight': 1,
+            'stdin': '',
+            'output': 'H.*\n',
+            'options': ['case', 'substring', 'regex'],
+        }]
+    })
+
+    inputs = i.get_instructions()['data']['inputs']
+    assert inputs[0]['normalized_output'] == 'hello\nworld'
+    assert inputs[1]['normalized_output'] == 'H.*'
+    # The data of the step itself should not be changed.
+    assert all('normalized_output' not in inp for inp in i.data['inputs'])
+
+
 def test_execute_io_step(
     stub_suite, describe, monkeypatch, stub_function_class,
     stub_container_class
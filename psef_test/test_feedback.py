@@ -969,6 +969,114 @@ def test_get_assignment_all_feedback(
             match_res(res, only_own_subs=False)
 
 
+def test_get_assignment_feedback_of_many_submissions(
+    logged_in, test_client, session, admin_user, describe, tomorrow,
+    yesterday, make_add_reply
+):
+    with describe('setup'), logged_in(admin_user):
+        course = helpers.create_course(test_client)
+        assignment = helpers.create_assignment(
+            test_client, course, deadline=tomorrow, state='open'
+        )
+        assig_url = f'/api/v1/assignments/{get_id(assignment)}'
+        teacher = helpers.create_user_with_role(session, 'Teacher', course)
+        ta = helpers.create_user_with_role(session, 'TA', course)
+        ta_role = ta.courses[get_id(course)]
+        ta_role.set_permission(
+            CPerm.can_view_inline_feedback_before_approved, False
+        )
+        ta_role.set_permission(CPerm.can_see_user_feedback_before_done, True)
+        session.commit()
+
+        students = [
+            helpers.create_user_with_role(session, 'Student', course)
+            for _ in range(3)
+        ]
+        subs = {
+            get_id(student): get_id(
+                helpers.create_submission(
+                    test_client, assignment, for_user=student
+                )
+            )
+            for student in students
+        }
+        student1 = students[0]
+        own_sub = subs[get_id(student1)]
+
+    with describe('add feedback'):
+        with logged_in(teacher):
+            for sub_id in subs.values():
+                make_add_reply(sub_id)('teacher comment')
+        with logged_in(student1):
+            make_add_reply(own_sub)('own comment', line=1)
+
+        with logged_in(teacher):
+            test_client.req(
+                'patch',
+                assig_url,
+                200,
+                data={'deadline': yesterday.isoformat()},
+            )
+            helpers.enable_peer_feedback(test_client, assignment, amount=1)
+        pf_user = m.AssignmentPeerFeedbackConnection.query.filter_by(
+            peer_user_id=get_id(student1)
+        ).one().user_id
+        pf_sub = subs[pf_user]
+        with logged_in(student1):
+            reply = make_add_reply(pf_sub)(
+                'peer comment', expect_peer_feedback=True
+            )
+            assert not reply['approved']
+
+    def get_single_feedback(work_id):
+        name = test_client.req(
+            'get',
+            f'/api/v1/submissions/{work_id}',
+            200,
+            query={'type': 'feedback'},
+        )['name']
+        res = test_client.get(f'/api/v1/files/{name}')
+        assert res.status_code == 200
+        comments = res.data.decode('utf8').split('Comments:\n', 1)[1]
+        comments = comments.split('\nLinter comments:\n', 1)[0]
+        return [line for line in comments.split('\n') if line]
+
+    def get_all_feedback(expected_subs):
+        res = test_client.req(
+            'get', f'{assig_url}/feedbacks/', 200, result=dict
+        )
+        assert sorted(res) == sorted(str(sub_id) for sub_id in expected_subs)
+        # The feedback of all submissions is loaded at once, which should give
+        # the same feedback as loading it for every submission separately.
+        for sub_id, feedback in res.items():
+            assert feedback['user'] == get_single_feedback(sub_id)
+        return {
+            int(sub_id): [line.split(': ', 1)[1] for line in feedback['user']]
+            for sub_id, feedback in res.items()
+        }
+
+    with describe('teachers see all feedback'), logged_in(teacher):
+        res = get_all_feedback(subs.values())
+        assert res[own_sub] == ['teacher comment', 'own comment']
+        assert res[pf_sub] == ['teacher comment', 'peer comment']
+
+    with describe('tas do not see unapproved peer feedback'), logged_in(ta):
+        res = get_all_feedback(subs.values())
+        assert res[own_sub] == ['teacher comment', 'own comment']
+        assert res[pf_sub] == ['teacher comment']
+
+    with describe('students only see their own comments before the deadline'):
+        with logged_in(teacher):
+            test_client.req(
+                'patch',
+                assig_url,
+                200,
+                data={'deadline': tomorrow.isoformat()},
+            )
+        with logged_in(student1):
+            assert get_all_feedback([own_sub]) == {own_sub: ['own comment']}
+
+
 def test_reply(
     logged_in, test_client, session, admin_user, mail_functions, describe,
     tomorrow, make_add_reply
@@ -179,3 +179,124 @@ def test_save_stream(describe, monkeypatch, app):
                 psef.files.save_stream(FileStorage(f))
 
             assert os.listdir(upload_dir) == old_files
+
+
+def test_store_file_deduplicates(describe, monkeypatch, app):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        monkeypatch.setitem(app.config, 'UPLOAD_DIR', upload_dir)
+        monkeypatch.setitem(app.config, 'DEDUPLICATE_UPLOADS', True)
+
+        def make_file(content):
+            fd, path = tempfile.mkstemp(dir=upload_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            return path
+
+        with describe('identical files share their contents'):
+            path1, _ = psef.files.store_file(make_file('hello'))
+            path2, _ = psef.files.store_file(make_file('hello'))
+            path3, _ = psef.files.store_file(make_file('bye'))
+
+            assert os.path.samefile(path1, path2)
+            assert not os.path.samefile(path1, path3)
+            # Two files and the blob
+            assert os.stat(path1).st_nlink == 3
+            # Stored files share their contents, so they are read-only.
+            assert not os.stat(path1).st_mode & 0o222
+            assert not os.stat(path3).st_mode & 0o222
+
+        with describe('replacing a file does not change the others'):
+            psef.files.replace_stored_file(path2, b'changed')
+            assert open(path1).read() == 'hello'
+            assert open(path2).read() == 'changed'
+            assert not os.stat(path2).st_mode & 0o222
+
+        with describe('blob is removed with its last reference'):
+            psef.files.remove_stored_file(path3)
+            assert not os.path.exists(path3)
+            assert psef.files.collect_orphaned_blobs() == 0
+
+            psef.files.remove_stored_file(path1)
+            psef.files.remove_stored_file(path2)
+            assert psef.files.collect_orphaned_blobs() == 0
+            assert not any(files for _, _, files in os.walk(upload_dir))
+
+
+@pytest.mark.parametrize('mode', list(psef.files.RestoreMode))
+def test_restore_directory_structure_modes(describe, monkeypatch, app, mode):
+    class StoredFile:
+        def __init__(self, id, name, diskname=None):
+            self.id = id
+            self.name = name
+            self.diskname = diskname
+            self.is_directory = diskname is None
+
+        def get_id(self):
+            return self.id
+
+        def get_diskname(self):
+            return self.diskname
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        monkeypatch.setitem(app.config, 'UPLOAD_DIR', upload_dir)
+        stored = os.path.join(upload_dir, 'stored')
+        with open(stored, 'w') as f:
+            f.write('content')
+
+        top = StoredFile(1, 'top')
+        cache = {1: [StoredFile(2, 'file', stored)]}
+
+        with describe('restore'), psef.files.restore_temp_dir() as tmpdir:
+            tree = psef.files.RestorePlan.from_tree(top, cache).execute(
+                tmpdir, mode
+            )
+            restored = os.path.join(tmpdir, 'top', 'file')
+
+            assert tree.entries[0].id == 2
+            assert open(restored).read() == 'content'
+            if mode == psef.files.RestoreMode.link:
+                assert os.path.samefile(restored, stored)
+                assert not os.stat(restored).st_mode & 0o222
+            else:
+                assert not os.path.samefile(restored, stored)
+
+        if mode == psef.files.RestoreMode.link and os.geteuid() != 0:
+            with describe('linked files cannot be written'
+                          ), psef.files.restore_temp_dir() as tmpdir:
+                psef.files.RestorePlan.from_tree(top, cache).execute(
+                    tmpdir, mode
+                )
+                with pytest.raises(PermissionError):
+                    open(os.path.join(tmpdir, 'top', 'file'), 'w')
+
+        with describe('stored file is kept'):
+            assert open(stored).read() == 'content'
+
+
+def test_remove_stale_restore_dirs(describe, monkeypatch, app):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        monkeypatch.setitem(app.config, 'UPLOAD_DIR', upload_dir)
+
+        with describe('nothing restored yet'):
+            assert psef.files.remove_stale_restore_dirs() == 0
+
+        with describe('only directories that are not locked are removed'):
+            with psef.files.restore_temp_dir() as in_use:
+                # A directory of a killed process: its lock file is not locked
+                # by anyone anymore.
+                stale = os.path.join(os.path.dirname(in_use), 'stale')
+                os.mkdir(stale)
+                with open(os.path.join(stale, 'file'), 'w') as f:
+                    f.write('content')
+                open(f'{stale}.lock', 'w').close()
+
+                assert psef.files.remove_stale_restore_dirs() == 1
+                assert not os.path.exists(stale)
+                assert not os.path.exists(f'{stale}.lock')
+                assert os.path.isdir(in_use)
+                assert os.path.isfile(f'{in_use}.lock')
+
+        with describe('directory and lock are removed after use'):
+            assert not os.path.exists(in_use)
+            assert not os.path.exists(f'{in_use}.lock')
+            assert psef.files.remove_stale_restore_dirs() == 0
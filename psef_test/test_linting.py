@@ -715,6 +715,216 @@ def test_lint_later_submission_disabled_linters(
         assert not comments, "Make sure linter did not run"
 
 
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+@pytest.mark.parametrize('fail_batches', [True, False])
+def test_lint_in_batches(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery, monkeypatch, fail_batches
+):
+    assignment, _ = assignment_real_works
+    # Make sure the three works are divided in a batch of two works, and a
+    # batch of a single work.
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+
+    orig_run = psef.linters.Flake8.run
+    batch_sizes = []
+
+    def run(self, tempdir, emit, process_completed):
+        if os.path.basename(tempdir) == 'submissions':
+            batch_sizes.append(len(os.listdir(tempdir)))
+            if fail_batches:
+                raise psef.linters.LinterCrash
+        else:
+            batch_sizes.append(1)
+        return orig_run(self, tempdir, emit, process_completed)
+
+    monkeypatch.setattr(psef.linters.Flake8, 'run', run)
+
+    with logged_in(teacher_user):
+        linter_id = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={'name': 'Flake8', 'cfg': ''},
+        )['id']
+        test_client.req(
+            'get',
+            f'/api/v1/linters/{linter_id}',
+            200,
+            result={
+                'done': 3,
+                'working': 0,
+                'id': linter_id,
+                'crashed': 0,
+                'name': 'Flake8',
+            }
+        )
+
+        if fail_batches:
+            assert sorted(batch_sizes) == [1, 1, 1, 2]
+        else:
+            assert sorted(batch_sizes) == [1, 2]
+
+        code_ids = session.query(m.File.id).join(m.File.work).filter(
+            m.Work.assignment_id == assignment.id,
+            m.File.parent != None,  # NOQA
+            m.File.name != '__init__.py',
+        ).all()
+        assert len(code_ids) == 3
+
+        for code_id, in code_ids:
+            res = test_client.req(
+                'get',
+                f'/api/v1/code/{code_id}',
+                200,
+                query={'type': 'linter-feedback'},
+            )
+            assert [
+                linter_comm['code']
+                for _, feedbacks in sorted(res.items())
+                for _, linter_comm in feedbacks
+            ] == ['W191', 'E211', 'E201', 'E202']
+
+    # The output of a batch is stored for every submission in the batch.
+    stdouts = [
+        inst.stdout for inst in m.LinterInstance.query.filter_by(
+            tester_id=linter_id
+        )
+    ]
+    assert len(stdouts) == 3
+    assert all(stdouts)
+    if not fail_batches:
+        assert len(set(stdouts)) == 2
+
+
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+def test_lint_unrestorable_submission(
+    teacher_user, test_client, logged_in, assignment_real_works,
+    monkeypatch_celery, monkeypatch
+):
+    assignment, single_work = assignment_real_works
+    broken_work_id = single_work['id']
+
+    orig_from_work = psef.files.RestorePlan.from_work
+
+    def from_work(work, *args, **kwargs):
+        if work.id == broken_work_id:
+            raise FileNotFoundError
+        return orig_from_work(work, *args, **kwargs)
+
+    monkeypatch.setattr(psef.files.RestorePlan, 'from_work', from_work)
+
+    with logged_in(teacher_user):
+        linter_id = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={'name': 'Flake8', 'cfg': ''},
+        )['id']
+        test_client.req(
+            'get',
+            f'/api/v1/linters/{linter_id}',
+            200,
+            result={
+                'done': 2,
+                'working': 0,
+                'id': linter_id,
+                'crashed': 1,
+                'name': 'Flake8',
+            }
+        )
+
+    broken, = m.LinterInstance.query.filter_by(
+        tester_id=linter_id, state=m.LinterState.crashed
+    )
+    assert broken.work_id == broken_work_id
+    assert broken.error_summary == 'The submission could not be restored.'
+
+
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+def test_lint_with_cache(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery, monkeypatch, filename
+):
+    assignment, _ = assignment_real_works
+
+    orig_run = psef.linters.Flake8.run
+    amount_runs = 0
+
+    def run(self, tempdir, emit, process_completed):
+        nonlocal amount_runs
+        amount_runs += 1
+        return orig_run(self, tempdir, emit, process_completed)
+
+    monkeypatch.setattr(psef.linters.Flake8, 'run', run)
+
+    def add_linter(cfg):
+        return test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={'name': 'Flake8', 'cfg': cfg},
+        )['id']
+
+    def get_codes(work_id):
+        code_id = session.query(m.File.id).filter(
+            m.File.work_id == work_id,
+            m.File.parent != None,  # NOQA
+        ).one()[0]
+        res = test_client.req(
+            'get',
+            f'/api/v1/code/{code_id}',
+            200,
+            query={'type': 'linter-feedback'},
+        )
+        return [
+            linter_comm['code']
+            for _, feedbacks in sorted(res.items())
+            for _, linter_comm in feedbacks
+        ]
+
+    def get_amount_cached(cfg):
+        return m.LinterResultCache.query.filter_by(
+            linter_name='Flake8',
+            config_hash=m.LinterResultCache.hash_config(cfg),
+        ).count()
+
+    with logged_in(teacher_user):
+        linter_id = add_linter('')
+        assert amount_runs > 0
+        assert get_amount_cached('') == 1
+
+    # The resubmission contains the same file, so the linter should not run
+    # again.
+    amount_runs = 0
+    with logged_in(m.User.query.filter_by(name='Student1').one()):
+        work_id = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            201,
+            real_data={
+                'file': (
+                    f'{os.path.dirname(__file__)}/../'
+                    f'test_data/test_linter/{filename}',
+                    filename,
+                )
+            }
+        )['id']
+    assert amount_runs == 0
+
+    with logged_in(teacher_user):
+        assert get_codes(work_id) == ['W191', 'E211', 'E201', 'E202']
+
+        test_client.req('delete', f'/api/v1/linters/{linter_id}', 204)
+        assert get_amount_cached('') == 0
+
+        # A different config should not use the cached results.
+        add_linter('[flake8]\nselect=W\n')
+        assert amount_runs > 0
+        assert get_codes(work_id) == ['W191']
+        assert get_amount_cached('[flake8]\nselect=W\n') == 1
+
+
 @pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
 def test_detail_of_linter(
     teacher_user, student_user, test_client, logged_in, assignment_real_works,
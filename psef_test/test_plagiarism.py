@@ -1005,6 +1005,306 @@ def test_chrased_jplag(
             assert plag['log'].startswith('My log!')
 
 
+@pytest.mark.parametrize('bb_tar_gz', ['correct.tar.gz'])
+def test_jplag_incremental(
+    bb_tar_gz, logged_in, assignment, test_client, teacher_user,
+    error_template, monkeypatch, monkeypatch_celery, session, describe
+):
+    bb_tar_gz = (
+        f'{os.path.dirname(__file__)}/'
+        f'../test_data/test_blackboard/{bb_tar_gz}'
+    )
+    restored = []
+    archived = []
+
+    def callback(call, **kwargs):
+        data_dir = call[3]
+        archive_dir = call[call.index('-a') + 1]
+        restored.append(sorted(os.listdir(data_dir)))
+        archived.append(sorted(os.listdir(archive_dir)))
+
+        def get_path(d):
+            upper = data_dir if d in restored[-1] else archive_dir
+            return get_random_path(d, upper)
+
+        f_p = os.path.join(call[call.index('-r') + 1], 'computer_matches.csv')
+        with open(f_p, 'w') as f:
+            writer = csv.writer(f, delimiter=';')
+            # Also output pairs between archived submissions, these should
+            # not be stored.
+            for dir1, dir2 in itertools.combinations(
+                restored[-1] + archived[-1], 2
+            ):
+                writer.writerow([
+                    dir1, dir2, 50, 50,
+                    get_path(dir1), 0, 10, get_path(dir2), 0, 10
+                ])
+
+    monkeypatch.setattr(subprocess, 'Popen', make_popen_stub(callback))
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submissions/',
+            204,
+            real_data={'file': (bb_tar_gz, 'bb.tar.gz')},
+        )
+
+    data = {
+        'provider': 'JPlag',
+        'old_assignments': [],
+        'lang': 'Python 3',
+        'has_old_submissions': False,
+        'has_base_code': False,
+        'incremental': True,
+    }
+
+    def do_run():
+        with logged_in(teacher_user):
+            plag = test_client.req(
+                'post',
+                f'/api/v1/assignments/{assignment.id}/plagiarism',
+                200,
+                data=data,
+            )
+            plag = test_client.req(
+                'get',
+                f'/api/v1/plagiarism/{plag["id"]}',
+                200,
+                result={
+                    '__allow_extra__': True,
+                    'state': 'done',
+                    'log': str,
+                },
+            )
+            cases = test_client.req(
+                'get', f'/api/v1/plagiarism/{plag["id"]}/cases/', 200
+            )
+            return plag, sorted(
+                tuple(sorted(sub['id'] for sub in case['submissions']))
+                for case in cases
+            )
+
+    with describe('first incremental run should compare everything'):
+        _, cases = do_run()
+        assert len(restored) == 1
+        assert len(restored[0]) == 3
+        assert archived[0] == []
+        assert len(cases) == 3
+
+    with describe('nothing changed so provider should not be called'):
+        plag, new_cases = do_run()
+        assert len(restored) == 1
+        assert new_cases == cases
+        assert plag['log'] == 'No submissions changed since the previous run.'
+
+    with describe('changed submission should be compared to all others'):
+        work = models.Work.query.filter_by(assignment_id=assignment.id
+                                           ).first()
+        code = models.File.query.filter_by(work=work, is_directory=False
+                                           ).first()
+        psef.files.replace_stored_file(code.get_diskname(), b'changed')
+
+        _, new_cases = do_run()
+        assert len(restored) == 2
+        assert len(restored[1]) == 1
+        assert len(archived[1]) == 2
+        assert new_cases == cases
+
+    with describe('cannot do incremental runs with base code'), logged_in(
+        teacher_user
+    ):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/plagiarism',
+            400,
+            data={**data, 'has_base_code': True},
+            result=error_template,
+        )
+
+
+@pytest.mark.parametrize('bb_tar_gz', ['correct.tar.gz'])
+def test_jplag_restores_submissions(
+    bb_tar_gz, logged_in, assignment, test_client, teacher_user, monkeypatch,
+    monkeypatch_celery
+):
+    bb_tar_gz = (
+        f'{os.path.dirname(__file__)}/'
+        f'../test_data/test_blackboard/{bb_tar_gz}'
+    )
+    restored = {}
+
+    def callback(call, **kwargs):
+        data_dir = call[3]
+        for dir_name in os.listdir(data_dir):
+            restored[dir_name] = get_all_files_of_dir(dir_name, data_dir)
+
+        f_p = os.path.join(call[call.index('-r') + 1], 'computer_matches.csv')
+        open(f_p, 'w').close()
+
+    monkeypatch.setattr(subprocess, 'Popen', make_popen_stub(callback))
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submissions/',
+            204,
+            real_data={'file': (bb_tar_gz, 'bb.tar.gz')},
+        )
+        plag = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/plagiarism',
+            200,
+            data={
+                'provider': 'JPlag',
+                'old_assignments': [],
+                'lang': 'Python 3',
+                'has_old_submissions': False,
+                'has_base_code': False,
+            },
+        )
+        test_client.req(
+            'get',
+            f'/api/v1/plagiarism/{plag["id"]}',
+            200,
+            result={
+                '__allow_extra__': True,
+                'state': 'done',
+                'submissions_done': 3,
+            },
+        )
+
+    # The external provider should get the files of every submission.
+    assert len(restored) == 3
+    assert all(restored.values())
+
+
+@pytest.mark.parametrize('bb_tar_gz', ['correct.tar.gz'])
+def test_winnowing(
+    bb_tar_gz, logged_in, assignment, test_client, teacher_user,
+    monkeypatch, monkeypatch_celery, session, describe
+):
+    bb_tar_gz = (
+        f'{os.path.dirname(__file__)}/'
+        f'../test_data/test_blackboard/{bb_tar_gz}'
+    )
+
+    def popen(*args, **kwargs):
+        assert False, 'No external program should be called'
+
+    monkeypatch.setattr(subprocess, 'Popen', popen)
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submissions/',
+            204,
+            real_data={'file': (bb_tar_gz, 'bb.tar.gz')},
+        )
+
+    data = {
+        'provider': 'Winnowing',
+        'old_assignments': [],
+        'has_old_submissions': False,
+        'has_base_code': False,
+        # The submissions are tiny, so every token should be a fingerprint.
+        'kgram_size': 1,
+        'window_size': 1,
+    }
+
+    with describe('all submissions are the same'), logged_in(teacher_user):
+        plag = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/plagiarism',
+            200,
+            data=data,
+        )
+        test_client.req(
+            'get',
+            f'/api/v1/plagiarism/{plag["id"]}',
+            200,
+            result={
+                '__allow_extra__': True,
+                'state': 'done',
+                'submissions_total': 3,
+                'submissions_done': 3,
+                'log': 'Compared 3 submissions, found 3 cases.',
+            },
+        )
+        cases = test_client.req(
+            'get', f'/api/v1/plagiarism/{plag["id"]}/cases/', 200
+        )
+        assert len(cases) == 3
+        for case in cases:
+            assert case['match_avg'] == 100
+            case = test_client.req(
+                'get',
+                f'/api/v1/plagiarism/{plag["id"]}/cases/{case["id"]}',
+                200,
+            )
+            assert case['matches'], 'Matches should be stored'
+
+    with describe('similarity above threshold'), logged_in(teacher_user):
+        plag = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/plagiarism',
+            200,
+            data={**data, 'simil': 101},
+        )
+        test_client.req(
+            'get',
+            f'/api/v1/plagiarism/{plag["id"]}/cases/',
+            200,
+            result=[],
+        )
+
+
+def test_winnowing_ignores_common_hashes(describe):
+    from psef.plagiarism import FingerprintLocation
+    from psef.plagiarism_providers.winnowing import (
+        Winnowing, _MIN_COMMON_SUBMISSIONS
+    )
+
+    provider = Winnowing()
+    loc = FingerprintLocation(1, 0, 1)
+
+    def get_pairs(amount, **extra):
+        # Every submission has a boilerplate hash ``0`` and a unique hash,
+        # the submissions in ``extra`` also share a hash ``1``.
+        fingerprints = {
+            work_id: {0: loc, 10 + work_id: loc}
+            for work_id in range(amount)
+        }
+        for work_id in extra.get('copied', []):
+            fingerprints[work_id] = {0: loc, 1: loc}
+        return sorted(
+            (case.work1_id, case.work2_id, case.match_avg)
+            for case in provider.get_cases(fingerprints, set(), {})
+        )
+
+    with describe('hashes shared by a few submissions are used'):
+        assert get_pairs(_MIN_COMMON_SUBMISSIONS) == [
+            (work1, work2, 50)
+            for work1, work2 in itertools.combinations(
+                range(_MIN_COMMON_SUBMISSIONS), 2
+            )
+        ]
+
+    with describe('hashes shared by many submissions are ignored'):
+        amount = _MIN_COMMON_SUBMISSIONS + 1
+        assert get_pairs(amount) == []
+        # The ignored boilerplate hash doesn't lower the similarity.
+        assert get_pairs(amount, copied=[3, 5]) == [(3, 5, 100)]
+
+    with describe('limit grows with the amount of submissions'):
+        copied = list(range(2 * _MIN_COMMON_SUBMISSIONS))
+        assert get_pairs(len(copied) + 1, copied=copied) == []
+        assert get_pairs(20 * len(copied), copied=copied) == [
+            (work1, work2, 100)
+            for work1, work2 in itertools.combinations(copied, 2)
+        ]
+
+
 def test_get_plagiarism_providers(test_client):
     test_client.req(
         'get',
@@ -1041,5 +1341,25 @@ def test_get_plagiarism_providers(test_client):
                                 'placeholder': 'default: 50',
                             }],
             },
+            {
+                'name': 'Winnowing',
+                'base_code': True,
+                'progress': True,
+                'options': [
+                    {
+                        'name': name,
+                        'title': str,
+                        'description': str,
+                        'type': typ,
+                        'mandatory': False,
+                        'placeholder': str,
+                    } for name, typ in [
+                        ('suffixes', 'strvalue'),
+                        ('simil', 'numbervalue'),
+                        ('kgram_size', 'numbervalue'),
+                        ('window_size', 'numbervalue'),
+                    ]
+                ],
+            },
         ],
     )
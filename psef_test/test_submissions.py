@@ -1044,6 +1044,50 @@ def test_get_teacher_zip_file(
     }
 
 
+@pytest.mark.parametrize(
+    'filename', ['../test_submissions/multiple_dir_archive.zip'],
+    indirect=True
+)
+def test_stream_zip_file(
+    test_client, logged_in, assignment_real_works, ta_user, student_user,
+    describe
+):
+    assignment, work = assignment_real_works
+    work_id = work['id']
+
+    def get_names(url, status=200):
+        res = test_client.get(url)
+        assert res.status_code == status
+        if status != 200:
+            return None
+        assert res.headers['Content-Type'] == 'application/zip'
+        assert 'attachment' in res.headers['Content-Disposition']
+        return set(zipfile.ZipFile(io.BytesIO(res.get_data())).namelist())
+
+    with describe('single submission'), logged_in(ta_user):
+        assert get_names(f'/api/v1/submissions/{work_id}/zip') == {
+            'multiple_dir_archive.zip/',
+            'multiple_dir_archive.zip/dir/single_file_work',
+            'multiple_dir_archive.zip/dir/single_file_work_copy',
+            'multiple_dir_archive.zip/dir2/single_file_work',
+            'multiple_dir_archive.zip/dir2/single_file_work_copy',
+        }
+
+    with describe('all latest submissions'), logged_in(ta_user):
+        names = get_names(
+            f'/api/v1/assignments/{assignment.id}/submissions/zip'
+        )
+        latest = assignment.get_all_latest_submissions().all()
+        assert latest
+        for sub in latest:
+            prefix = f'{sub.user.name} - {sub.id}/multiple_dir_archive.zip/'
+            assert f'{prefix}dir/single_file_work' in names
+
+    with describe('students cannot download all submissions'
+                  ), logged_in(student_user):
+        get_names(f'/api/v1/assignments/{assignment.id}/submissions/zip', 403)
+
+
 @pytest.mark.parametrize(
     'named_user', [
         'Thomas Schaper',
@@ -1848,6 +1892,169 @@ def test_delete_submission_with_other_work(
                                                 ).one_or_none() is None
 
 
+def test_latest_submissions_stay_up_to_date(
+    test_client, logged_in, admin_user, session, describe
+):
+    with describe('setup'), logged_in(admin_user):
+        course = create_course(test_client)
+        assignment = m.Assignment.query.get(
+            create_assignment(
+                test_client, course, 'open', deadline='tomorrow'
+            )['id']
+        )
+        students = [
+            create_user_with_role(session, 'Student', course)
+            for _ in range(2)
+        ]
+
+        def get_latest_ids(**kwargs):
+            return sorted(
+                sub.id
+                for sub in assignment.get_all_latest_submissions(**kwargs)
+            )
+
+        def check_latest_ids(expected):
+            assert get_latest_ids() == sorted(expected)
+            # This should always give the same submissions as when getting
+            # them for all users at once.
+            per_user = [
+                assignment.get_latest_submission_for_user(s).one_or_none()
+                for s in students
+            ]
+            assert sorted(
+                sub.id for sub in per_user if sub is not None
+            ) == sorted(expected)
+
+        with logged_in(students[0]):
+            oldest = create_submission(test_client, assignment)['id']
+            newest = create_submission(test_client, assignment)['id']
+        with logged_in(students[1]):
+            other = create_submission(test_client, assignment)['id']
+
+    with describe('newly created submissions are the latest'):
+        check_latest_ids([newest, other])
+
+    with describe('deleting the latest submission uses the previous one'
+                  ), logged_in(admin_user):
+        test_client.req('delete', f'/api/v1/submissions/{newest}', 204)
+        check_latest_ids([oldest, other])
+        assert get_latest_ids(include_deleted=True) == sorted([newest, other])
+
+    with describe('deleting all submissions of a user'), logged_in(admin_user):
+        test_client.req('delete', f'/api/v1/submissions/{oldest}', 204)
+        check_latest_ids([other])
+        assert m.AssignmentLatestSubmission.query.filter_by(
+            assignment_id=assignment.id
+        ).count() == 1
+
+
+def test_latest_submissions_of_directly_created_works(
+    session, describe, admin_user
+):
+    with describe('seeded submissions are in the latest submissions'):
+        # The test data is created by ``manage.py test_data``, which creates
+        # the submissions directly.
+        seeded = m.Assignment.query.filter(
+            m.Assignment.id.in_(
+                session.query(m.Work.assignment_id).filter(~m.Work._deleted)
+            )
+        ).all()
+        assert seeded
+        for assig in seeded:
+            assert sorted(
+                w.id for w in assig.get_all_latest_submissions()
+            ) == sorted(
+                w.id
+                for w in assig.get_all_latest_submissions(include_deleted=True)
+                if not w.deleted
+            )
+
+    with describe('directly created works update the latest submissions'):
+        assig = seeded[0]
+        work = m.Work(assignment=assig, user=admin_user)
+        session.add(work)
+        session.commit()
+        assert work.id in [w.id for w in assig.get_all_latest_submissions()]
+
+        newer = m.Work(assignment=assig, user=admin_user)
+        session.add(newer)
+        session.commit()
+        ids = [w.id for w in assig.get_all_latest_submissions()]
+        assert newer.id in ids
+        assert work.id not in ids
+
+    with describe('changing deleted directly updates the table'):
+        newer.deleted = True
+        session.commit()
+        ids = [w.id for w in assig.get_all_latest_submissions()]
+        assert work.id in ids
+        assert newer.id not in ids
+
+
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+def test_preloaded_grades(
+    test_client, logged_in, assignment_real_works, teacher_user, describe
+):
+    with describe('setup'):
+        assignment, _ = assignment_real_works
+        with logged_in(teacher_user):
+            rubric = test_client.req(
+                'put',
+                f'/api/v1/assignments/{assignment.id}/rubrics/',
+                200,
+                data={
+                    'rows': [{
+                        'header': 'row',
+                        'description': 'desc',
+                        'items': [{
+                            'description': f'{points}points',
+                            'header': 'bladie',
+                            'points': points,
+                        } for points in [1, 3, 7]],
+                    }],
+                },
+            )
+        works = m.Work.query.filter_by(assignment_id=assignment.id
+                                       ).order_by(m.Work.id).all()
+        assert len(works) == 3
+
+        with logged_in(teacher_user):
+            test_client.req(
+                'patch',
+                f'/api/v1/submissions/{works[0].id}/rubricitems/',
+                200,
+                data={
+                    'items': [{
+                        'row_id': rubric[0]['id'],
+                        'item_id': rubric[0]['items'][1]['id'],
+                        'multiplier': 0.3,
+                    }],
+                },
+            )
+            test_client.req(
+                'patch',
+                f'/api/v1/submissions/{works[1].id}',
+                200,
+                data={'grade': 5.5},
+            )
+
+        expected = [work.grade for work in works]
+        assert expected[0] is not None
+        assert expected[1] == 5.5
+        assert expected[2] is None
+
+    with describe('preloaded grades are the same as normal grades'):
+        m.Work.preload_grades(works)
+        assert [work.grade for work in works] == expected
+        assert all(work._preloaded_grade == work.grade for work in works)
+
+    with describe('changing the grade clears the preloaded grade'):
+        works[2].set_grade(2.0, teacher_user)
+        assert works[2].grade == 2.0
+        works[0].selected_items = []
+        assert works[0].grade is None
+
+
 @pytest.mark.parametrize('old_format', [True, False])
 @pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
 @pytest.mark.parametrize(
@@ -1,6 +1,11 @@
 import pytest
 
-from psef.ignore import Options, FileRule, ParseError, SubmissionValidator
+from psef.ignore import (
+    Options, FileRule, ParseError, IgnoreFilterManager, SubmissionValidator
+)
+from psef.extract_tree import (
+    ExtractFileTree, ExtractFileTreeFile, ExtractFileTreeDirectory
+)
 
 
 def test_parse_option():
@@ -141,3 +146,65 @@ def test_policy_deny_no_rules():
             'rules': [],
         })
     assert e.value.msg.startswith('When the policy is set to "deny_all_files"')
+
+
+@pytest.mark.parametrize(
+    'cgignore', [
+        '',
+        '*.py\n!c.py',
+        'a/\n!a/b/',
+        '/b\n**/d.txt',
+        'a/**/c.py\n!*.txt',
+        '*\n!c.py',
+        'b/*\n?\n[ab]',
+    ]
+)
+def test_ignore_filter_match_tree(cgignore):
+    def add_children(parent, children):
+        for child in children:
+            if isinstance(child, str):
+                parent.values.append(
+                    ExtractFileTreeFile(
+                        name=child, parent=parent, disk_name='', size=None
+                    )
+                )
+            else:
+                name, grand_children = child
+                new_dir = ExtractFileTreeDirectory(
+                    name=name, parent=parent, values=[]
+                )
+                add_children(new_dir, grand_children)
+                parent.values.append(new_dir)
+
+    def walk(tree):
+        for child in tree.values:
+            yield child
+            if child.is_dir:
+                yield from walk(child)
+
+    tree = ExtractFileTree(name='top', parent=None, values=[])
+    add_children(
+        tree, [
+            'c.py',
+            'd.txt',
+            ('a', ['c.py', 'e', ('b', ['c.py', 'd.txt', ('a', ['b'])])]),
+            ('b', ['a', 'c.py', ('d.txt', [])]),
+            ('e', [('a', [('b', ['c.py'])])]),
+        ]
+    )
+
+    filt = IgnoreFilterManager(cgignore)
+    file_allowed = filt._get_file_checker(tree)
+
+    for f in walk(tree):
+        matches = filt.find_matching(f.get_full_name())
+        expected = (matches[-1].is_exclude, matches[-1].original_line
+                    ) if matches else (None, None)
+        assert filt.is_ignored(f.get_full_name()) == expected
+
+        deletion = file_allowed(f)
+        if expected[0]:
+            assert deletion.reason == expected[1]
+            assert deletion.deleted_file.get_full_name() == f.get_full_name()
+        else:
+            assert deletion is None